@@ -1,8 +1,13 @@
 from utils.llm import chat
+from utils.code_stream import LLM_STREAMING, STREAM_RETRIES, stream_code
+from utils import events
+from utils.token_budget import Section, budget_for, fit
 
 class CodeGeneratorAgent:
     def generate_code(self, state: dict):
         req = state.get("user_request", "").strip()
+        # very long requests are cut in the middle to stay within the prompt budget
+        req = fit([Section("request", req, strategy="middle")], budget_for("generator"))["request"]
         messages = [
             {"role": "system", "content": "You generate clean, runnable Python. Return only full code, no explanations."},
             {"role": "user", "content": (
@@ -14,6 +19,14 @@ class CodeGeneratorAgent:
                 "- Avoid network calls and heavy deps.\n"
             )},
         ]
-        code = chat(messages, max_tokens=1500, temperature=0.2)
+        if LLM_STREAMING:
+            # stream, cancel obvious dead ends early and show finished defs as they land
+            code, info = stream_code(
+                messages, max_tokens=1500, temperature=0.2, retries=STREAM_RETRIES,
+                on_definition=lambda d: events.emit(state, {"type": "partial", "node": "generate", **d}),
+            )
+            state.setdefault("debug", []).append({"node": "generate", "streamed": True, **info})
+        else:
+            code = chat(messages, max_tokens=1500, temperature=0.2)
         state["code"] = code
         return state
@@ -1,15 +1,120 @@
 # agents/error_analyzer.py
+import ast
 import os
-from typing import Any, Dict
-from utils.mcp_client import MCPClient
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from utils import events
+from utils.mcp_client import MCPClient, mcp_url
+from utils.fingerprint import fingerprint, search_query
+from utils.tracebacks import compact_error, parse_error
 
 ANALYZE_LIMIT = int(os.getenv("ANALYZE_LIMIT", "20"))
+# max size of the compacted error kept in state["errors"]
+ERROR_CHARS = int(os.getenv("ERROR_CHARS", "1500"))
+# Concurrent mode (ANALYZER_CONCURRENT=0 for the old serial order): tester and
+# sandbox run side by side when there are no test files (the tester result is
+# known to be a pass), and the StackOverflow lookup runs in the background;
+# its results are attached to state["references"] whenever they're ready.
+ANALYZER_CONCURRENT = os.getenv("ANALYZER_CONCURRENT", "1") == "1"
+_calls = ThreadPoolExecutor(max_workers=int(os.getenv("ANALYZER_WORKERS", "8")), thread_name_prefix="analyzer")
+
+# run_id -> reference lookups still in flight
+_pending: Dict[str, List[Future]] = {}
+_pending_lock = threading.Lock()
+
+
+# errors against installed packages that the docs server's symbol index can ground
+_NO_MODULE_RE = re.compile(r"No module named '([\w.]+)'")
+_NO_NAME_RE = re.compile(r"cannot import name '(\w+)' from '([\w.]+)'")
+_NO_ATTR_RE = re.compile(r"module '([\w.]+)' has no attribute '(\w+)'")
+
+
+def _has_tests(files: Dict[str, str]) -> bool:
+    return any(n.startswith("test_") and n.endswith(".py") or n.endswith("_test.py") for n in files)
+
+
+def docs_request(err_text: str) -> Optional[Tuple[str, Dict[str, str]]]:
+    """(endpoint, payload) for the docs server, or None if the error isn't about a package."""
+    for text in (parse_error(err_text).get("message") or "", err_text):
+        m = _NO_NAME_RE.search(text)
+        if m:
+            return "symbol", {"module": m.group(2), "name": m.group(1)}
+        m = _NO_ATTR_RE.search(text)
+        if m:
+            return "symbol", {"module": m.group(1), "name": m.group(2)}
+        m = _NO_MODULE_RE.search(text)
+        if m:
+            return "module", {"module": m.group(1)}
+    return None
+
+
+def _docs_items(res: Any, payload: Dict[str, str]) -> List[Dict[str, Any]]:
+    if not isinstance(res, dict) or not res.get("ok"):
+        return []
+    suggestions = res.get("suggestions") or []
+    if res.get("found"):
+        title = res.get("qualname") or res.get("module") or ""
+        if res.get("dist"):
+            title += f" ({res['dist']} {res.get('version') or ''}".rstrip() + ")"
+        return [{"title": title, "signature": res.get("signature") or "", "doc": res.get("doc") or "",
+                 "suggestions": suggestions}]
+    module, name = payload.get("module", ""), payload.get("name", "")
+    title = f"{module} has no {name!r}" if name and res.get("module") else f"no installed module {module or name!r}"
+    best = res.get("best") or {}
+    if suggestions:
+        title += "; did you mean: " + ", ".join(suggestions)
+    return [{"title": title, "signature": best.get("signature") or "", "doc": best.get("doc") or "",
+             "suggestions": suggestions}]
+
+
+def attach_references(state: Dict[str, Any], timeout: float = 0.0, final: bool = False) -> int:
+    """
+    Merge finished background lookups into state["references"]; waits up to
+    `timeout` seconds for ones still running. final=True forgets whatever is
+    still pending for the run. Returns the number of results added.
+    """
+    run_id = state.get("run_id") or ""
+    with _pending_lock:
+        futures = list(_pending.get(run_id) or [])
+    if not futures:
+        return 0
+    if timeout > 0:
+        wait(futures, timeout=timeout)
+    added = 0
+    done = [f for f in futures if f.done()]
+    for f in done:
+        try:
+            source, items = f.result()
+        except Exception:
+            continue
+        refs = state.get("references") or {}
+        refs.setdefault(source, []).extend(items)
+        state["references"] = refs
+        added += len(items)
+    with _pending_lock:
+        left = [f for f in _pending.get(run_id) or [] if f not in done]
+        if left and not final:
+            _pending[run_id] = left
+        else:
+            _pending.pop(run_id, None)
+    return added
+
+
+def discard_references(run_id: str):
+    """Drop (and cancel where possible) the lookups still pending for a run."""
+    with _pending_lock:
+        futures = _pending.pop(run_id or "", None) or []
+    for f in futures:
+        f.cancel()
 
 class ErrorAnalyzerAgent:
     def __init__(self):
-        self.tester = MCPClient("http://127.0.0.1:8002")         # /pytest
-        self.sandbox = MCPClient("http://127.0.0.1:8001")        # /run
-        self.stackoverflow = MCPClient("http://127.0.0.1:8003")  # /search
+        self.tester = MCPClient(mcp_url("tester"))                # /pytest
+        self.sandbox = MCPClient(mcp_url("sandbox"))              # /run
+        self.stackoverflow = MCPClient(mcp_url("stackoverflow"))  # /search
+        self.docs = MCPClient(mcp_url("docs"))                    # /symbol, /module
 
     def analyze_error(self, state: Dict[str, Any]):
         dbg = state.setdefault("debug", [])
@@ -28,17 +133,32 @@ class ErrorAnalyzerAgent:
             dbg[-1]["loop_guard"] = "tripped"
             return state
 
+        # earlier background lookups that have finished by now
+        attach_references(state)
+
         # 1) Run tests (or auto-pass if no tests were provided)
-        t = self.tester.post("pytest", {"files": {"app.py": code}})
+        # run_id + last failures let the tester re-run those first and stop early
+        files = {"app.py": code}
+        tester_payload = {"files": files, "run_id": state.get("run_id"),
+                          "failed_tests": state.get("failed_tests") or []}
+        run_f = None
+        if ANALYZER_CONCURRENT and not _has_tests(files):
+            # no tests -> the tester will pass, so the program run is needed anyway
+            run_f = _calls.submit(self.sandbox.post, "run", {"code": code, "timeout": 8})
+            dbg[-1]["concurrent"] = True
+        t = self.tester.post("pytest", tester_payload)
+        if run_f is not None and not (isinstance(t, dict) and not t.get("error") and t.get("passed")):
+            run_f.cancel()  # the run is only used when the tests pass
         if isinstance(t, dict) and t.get("error"):
             state["errors"] = [f"tester_error: {t['error']}"]
             state["force_giveup"] = True
             dbg[-1]["tester"] = "error"
             return state
 
+        state["failed_tests"] = [x["nodeid"] for x in t.get("tests") or [] if x.get("outcome") in ("failed", "error")]
         if t.get("passed"):
             # 2) When tests pass (or none provided), run the program to capture output
-            r = self.sandbox.post("run", {"code": code, "timeout": 8})
+            r = run_f.result() if run_f is not None else self.sandbox.post("run", {"code": code, "timeout": 8})
             if isinstance(r, dict) and r.get("error"):
                 # If sandbox infra fails, exit gracefully (don’t loop)
                 state["errors"] = [f"sandbox_error: {r['error']}"]
@@ -50,20 +170,87 @@ class ErrorAnalyzerAgent:
             state["program_output"] = (r.get("stdout") or "").strip()
             dbg[-1]["tester"] = "passed"
             dbg[-1]["run_rc"] = r.get("returncode", 0)
+            if r.get("returncode", 0) != 0:
+                # a crash still leaves references for the caller
+                self._docs_lookup(state, (r.get("stderr") or "").strip())
             return state
 
-        # 3) Tests failed: collect a concise error message
+        # 3) Tests failed: keep the exception, user frames and assertion diff
         err_text = (t.get("stderr") or t.get("stdout") or "").strip()
-        state["errors"] = [err_text[:4000]]
+        state["errors"] = [compact_error(err_text, max_chars=ERROR_CHARS)]
         dbg[-1]["tester"] = "failed"
+        dbg[-1]["error_chars"] = {"raw": len(err_text), "compact": len(state["errors"][0])}
 
         # Single SO query per attempt
         if not state.get("so_queried", False) and err_text:
-            q = (err_text.splitlines()[0] if err_text else "python error")[:160]
-            sr = self.stackoverflow.post("search", {"query": q})
-            refs = state.setdefault("references", {}).setdefault("stackoverflow", [])
-            if isinstance(sr, dict):
-                refs.extend(sr.get("results", [])[:3])
+            # normalized message: no temp paths, line numbers or local names
+            q = search_query(fingerprint(err_text))
+            self._lookup(state, "stackoverflow", lambda: self._so_items(q))
             state["so_queried"] = True
 
+        self._docs_lookup(state, err_text)
         return state
+
+    def _docs_lookup(self, state: Dict[str, Any], err_text: str):
+        """Import/attribute errors against installed packages: ask the docs server's symbol index (once per query)."""
+        req = docs_request(err_text) if err_text else None
+        if req is None:
+            return
+        key = f"{req[0]}:{'.'.join(req[1].values())}"
+        asked = state.setdefault("docs_queried", [])
+        if key in asked:
+            return
+        asked.append(key)
+        state["debug"][-1]["docs"] = key
+        self._lookup(state, "docs", lambda: _docs_items(self.docs.post(*req), req[1]))
+
+    def _so_items(self, query: str) -> List[Dict[str, Any]]:
+        sr = self.stackoverflow.post("search", {"query": query})
+        return (sr.get("results") or [])[:3] if isinstance(sr, dict) else []
+
+    def _lookup(self, state: Dict[str, Any], source: str, fetch: Callable[[], List[Dict[str, Any]]]):
+        """
+        Reference lookup for state["references"][source]. In concurrent mode it
+        runs off the critical path and the fixer picks it up if it's ready.
+        """
+        if not ANALYZER_CONCURRENT:
+            state.setdefault("references", {}).setdefault(source, []).extend(fetch())
+            return
+        run_id = state.get("run_id") or ""
+        sink = {"run_id": run_id}
+
+        def lookup():
+            items = fetch()
+            events.emit(sink, {"type": "references", "source": source, "count": len(items)})
+            return source, items
+
+        f = _calls.submit(lookup)
+        with _pending_lock:
+            _pending.setdefault(run_id, []).append(f)
+
+    def probe(self, code: str) -> Dict[str, Any]:
+        """
+        Check a candidate without touching graph state (used by speculative fixing).
+        passed=True means: parses, tests pass (or none) and the program exits 0.
+        """
+        try:
+            ast.parse(code)
+        except SyntaxError as e:
+            return {"passed": False, "error": f"Syntax: {e}"}
+        files = {"app.py": code}
+        run_f = None
+        if ANALYZER_CONCURRENT and not _has_tests(files):
+            run_f = _calls.submit(self.sandbox.post, "run", {"code": code, "timeout": 8})
+        t = self.tester.post("pytest", {"files": files})
+        if run_f is not None and not (isinstance(t, dict) and not t.get("error") and t.get("passed")):
+            run_f.cancel()  # the run is only used when the tests pass
+        if isinstance(t, dict) and t.get("error"):
+            return {"passed": False, "error": f"tester_error: {t['error']}", "infra": True}
+        if not t.get("passed"):
+            return {"passed": False, "error": compact_error(t.get("stderr") or t.get("stdout") or "", ERROR_CHARS)}
+        r = run_f.result() if run_f is not None else self.sandbox.post("run", {"code": code, "timeout": 8})
+        if isinstance(r, dict) and r.get("error"):
+            return {"passed": False, "error": f"sandbox_error: {r['error']}", "infra": True}
+        if r.get("returncode", 0) != 0:
+            return {"passed": False, "error": compact_error(r.get("stderr") or "", ERROR_CHARS)}
+        return {"passed": True, "program_output": (r.get("stdout") or "").strip()}
@@ -1,12 +1,39 @@
 # agents/fixer.py
 import difflib
+import os
 import re
-from typing import Dict, Any, List
-from utils.llm import chat, ChatRateLimited
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Any, List, Optional
+from agents.error_analyzer import attach_references
+from utils.llm import chat, chat_stream, ChatRateLimited, PRIORITY_FIX
+from utils.code_stream import LLM_STREAMING, STREAM_RETRIES, stream_code
+from utils import events
+from utils.patching import apply_patch
+from utils.token_budget import Section, budget_for, fit, format_references
 
 # extract code from a ```python ... ``` block if the model returns fences
 _CODE_FENCE_RE = re.compile(r"```(?:python)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
 
+# Speculative fixing: FIX_CANDIDATES > 1 asks for that many candidates at once
+# (temperatures from FIX_TEMPERATURES, alternating prompt variants) and keeps the
+# first one that passes the tester + sandbox.
+FIX_CANDIDATES = int(os.getenv("FIX_CANDIDATES", "1"))
+FIX_TEMPERATURES = [float(t) for t in os.getenv("FIX_TEMPERATURES", "0.1,0.4,0.7,0.9").split(",") if t.strip()]
+
+# Patch mode: FIX_MODE=patch asks for SEARCH/REPLACE blocks instead of the whole
+# file (falls back to full-file mode when the patch can't be applied).
+FIX_MODE = os.getenv("FIX_MODE", "full").lower()
+FIX_PATCH_MAX_TOKENS = int(os.getenv("FIX_PATCH_MAX_TOKENS", "600"))
+
+_VARIANT_HINTS = (
+    "",
+    "Find the root cause first; prefer the smallest change that fixes it.\n",
+)
+
+def _est_tokens(text: str) -> int:
+    return len(text or "") // 4
+
 def _extract_code(text: str) -> str:
     if not text:
         return ""
@@ -20,11 +47,20 @@ class FixerAgent:
     - If the returned code is IDENTICAL to the previous code, we increment a
       no-change streak and set `force_giveup=True` (so the graph exits via memory).
     - On LLM/rate-limit failure we also set `force_giveup=True`.
+    - With a `probe` (ErrorAnalyzerAgent.probe) and FIX_CANDIDATES > 1, several
+      candidates are generated and validated in parallel; the first passing one wins.
+      Its probe result goes into state (errors cleared, program_output) with
+      fix_verified=True, so the graph goes straight to validate instead of
+      re-analyzing the same code.
     """
 
+    def __init__(self, probe: Optional[Callable[[str], Dict[str, Any]]] = None):
+        self.probe = probe
+
     def fix_code(self, state: Dict[str, Any]):
         debug = state.setdefault("debug", [])
         debug.append({"node": "fix", "attempts": int(state.get("attempts", 0))})
+        state["fix_verified"] = False
 
         errors: List[str] = state.get("errors") or []
         if not errors:
@@ -33,24 +69,49 @@ class FixerAgent:
             return state
 
         current = state.get("code", "") or ""
-        first_error = (errors[0] or "")[:2000]  # keep prompt small/safe
+        # background reference lookups that finished while we were routing here
+        attach_references(state)
+        # the code must go in whole (we ask for the whole file back); the error
+        # and any references share what's left of the prompt budget
+        parts = fit([
+            Section("code", current, keep=True),
+            Section("error", errors[0] or "", min_tokens=300, strategy="middle"),
+            Section("refs", format_references(state.get("references"))),
+        ], budget_for("fixer"))
+        first_error = parts["error"]
+        refs = ("\nPossibly related references:\n" + parts["refs"] + "\n") if parts["refs"] else ""
 
         prompt = (
             "You repair a single-file Python FastAPI app named app.py.\n"
             "Return ONLY the full corrected file content. Do not add explanations.\n\n"
             "Current code:\n```python\n" + current + "\n```\n\n"
-            "Observed error (from tests/sandbox):\n" + first_error + "\n"
+            "Observed error (from tests/sandbox):\n" + first_error + "\n" + refs
         )
 
+        messages = [
+            {"role": "system", "content": "You are a meticulous Python fixer."},
+            {"role": "user", "content": prompt},
+        ]
+        patched = None
+        verified = None
         try:
-            fixed_text = chat(
-                [
-                    {"role": "system", "content": "You are a meticulous Python fixer."},
-                    {"role": "user", "content": prompt},
-                ],
-                max_tokens=1500,
-                temperature=0.1,
-            )
+            if FIX_MODE == "patch" and current.strip():
+                patched = self._patch(state, current, first_error + refs, debug[-1])
+            if patched is not None:
+                fixed_text = patched
+            elif self.probe is not None and FIX_CANDIDATES > 1:
+                fixed_text, spec = self._speculate(messages, current)
+                verified = spec.pop("probe", None)
+                debug[-1]["speculative"] = spec
+            elif LLM_STREAMING:
+                fixed_text, sinfo = stream_code(
+                    messages, max_tokens=1500, temperature=0.1, priority=PRIORITY_FIX,
+                    retries=STREAM_RETRIES,
+                    on_definition=lambda d: events.emit(state, {"type": "partial", "node": "fix", **d}),
+                )
+                debug[-1]["stream"] = sinfo
+            else:
+                fixed_text = chat(messages, max_tokens=1500, temperature=0.1, priority=PRIORITY_FIX)
         except ChatRateLimited as e:
             # stop the loop immediately on rate limit
             fa = state.get("fix_attempts", [])
@@ -70,7 +131,7 @@ class FixerAgent:
             return state
 
         # postprocess model output
-        new_code = _extract_code(fixed_text) or ""
+        new_code = patched if patched is not None else (_extract_code(fixed_text) or "")
         changed = new_code.strip() != current.strip()
 
         # prepare diff for UI/debug
@@ -95,7 +156,141 @@ class FixerAgent:
         # accept the change
         state["code"] = new_code
         state["nochange_streak"] = 0
-        fa.append({"status": "ok", "changed": True, "diff": udiff[:5000]})
+        # remembered by MemoryAgent if the run ends up healed
+        state.setdefault("heal_history", []).append({"error": errors[0], "before": current, "after": new_code})
+        entry = {"status": "ok", "changed": True, "diff": udiff[:5000]}
+        for k in ("speculative", "patch"):
+            if k in debug[-1]:
+                entry[k] = debug[-1][k]
+        fa.append(entry)
         state["fix_attempts"] = fa
         debug[-1].update({"status": "ok", "changed": True, "len": len(new_code)})
+        if verified is not None:
+            # the winner already passed tester + sandbox: same outcome analyze would record
+            state["errors"] = []
+            state["failed_tests"] = []
+            state["program_output"] = verified.get("program_output", "")
+            state["fix_verified"] = True
+            debug[-1]["verified"] = True
         return state
+
+    def _patch(self, state: Dict[str, Any], current: str, error: str, dbg: Dict[str, Any]) -> Optional[str]:
+        """
+        Ask for SEARCH/REPLACE blocks and apply them (fuzzy). Returns the patched
+        file, or None to fall back to full-file mode. Token savings vs. a full-file
+        answer are recorded per fix and accumulated in state["patch_metrics"].
+        """
+        prompt = (
+            "You repair a single-file Python FastAPI app named app.py.\n"
+            "Reply ONLY with one or more edit blocks in exactly this format, no explanations:\n"
+            "<<<<<<< SEARCH\n<lines copied exactly from the current code>\n=======\n"
+            "<replacement lines>\n>>>>>>> REPLACE\n"
+            "Keep each SEARCH part short but unique within the file.\n\n"
+            "Current code:\n```python\n" + current + "\n```\n\n"
+            "Observed error (from tests/sandbox):\n" + error + "\n"
+        )
+        reply = chat(
+            [
+                {"role": "system", "content": "You are a meticulous Python fixer who edits code with minimal patches."},
+                {"role": "user", "content": prompt},
+            ],
+            max_tokens=FIX_PATCH_MAX_TOKENS,
+            temperature=0.1,
+            priority=PRIORITY_FIX,
+        )
+        patched, fmt = apply_patch(current, reply)
+        if patched is not None and patched.strip() == current.strip():
+            patched = None  # a no-op patch; let full-file mode have a go
+        out_tokens = _est_tokens(reply)
+        info: Dict[str, Any] = {"format": fmt, "applied": patched is not None, "output_tokens": out_tokens}
+        metrics = state.get("patch_metrics") or {"attempts": 0, "applied": 0, "fallbacks": 0, "saved_tokens": 0}
+        state["patch_metrics"] = metrics
+        metrics["attempts"] += 1
+        if patched is not None:
+            full = _est_tokens(patched)
+            info.update(full_file_tokens=full, saved_tokens=full - out_tokens)
+            metrics["applied"] += 1
+        else:
+            # the patch reply was wasted output on top of the full-file answer
+            info["saved_tokens"] = -out_tokens
+            metrics["fallbacks"] += 1
+        metrics["saved_tokens"] += info["saved_tokens"]
+        dbg["patch"] = info
+        return patched
+
+    def _speculate(self, messages: List[Dict[str, str]], current: str):
+        """
+        Request FIX_CANDIDATES fixes concurrently, drop duplicates/no-ops and probe
+        the rest in parallel as they arrive. Returns (code, info): the first
+        candidate that passes (its probe result in info["probe"]), else the first
+        changed one (in request order). Once there's a winner, candidates still
+        streaming are closed, which cancels their Groq requests, and no further
+        probes start. Raises ChatRateLimited only if every candidate request was
+        rate limited.
+        """
+        n = max(2, FIX_CANDIDATES)
+        temps = [FIX_TEMPERATURES[i % len(FIX_TEMPERATURES)] for i in range(n)] if FIX_TEMPERATURES else [0.1] * n
+        info: Dict[str, Any] = {"requested": n, "unique": 0, "probed": 0, "winner": None}
+        stop = threading.Event()
+
+        def ask(i: int) -> str:
+            msgs = messages
+            hint = _VARIANT_HINTS[i % len(_VARIANT_HINTS)]
+            if hint:
+                msgs = messages[:-1] + [{"role": "user", "content": hint + messages[-1]["content"]}]
+            # always streamed (whatever LLM_STREAMING says): that's what makes a loser cancellable
+            if stop.is_set():
+                return ""
+            parts: List[str] = []
+            gen = chat_stream(msgs, max_tokens=1500, temperature=temps[i], priority=PRIORITY_FIX)
+            try:
+                for delta in gen:
+                    if stop.is_set():
+                        return ""
+                    parts.append(delta)
+            finally:
+                gen.close()  # early close drops the request and its scheduler slot
+            return "".join(parts)
+
+        pool = ThreadPoolExecutor(max_workers=2 * n, thread_name_prefix="fix-spec")
+        pending = {pool.submit(ask, i): ("llm", i) for i in range(n)}
+        seen, changed, errors = {current.strip()}, {}, []
+        winner, probes = None, {}
+        try:
+            while pending and winner is None:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    kind, i = pending.pop(fut)
+                    if kind == "llm":
+                        try:
+                            code = _extract_code(fut.result())
+                        except Exception as e:
+                            errors.append(e)
+                            continue
+                        if not code or code.strip() in seen:
+                            continue
+                        seen.add(code.strip())
+                        changed[i] = code
+                        info["unique"] += 1
+                        if winner is None:
+                            pending[pool.submit(self.probe, code)] = ("probe", i)
+                    else:
+                        info["probed"] += 1
+                        res = fut.result() if not fut.exception() else {"passed": False}
+                        if res.get("passed") and winner is None:
+                            winner, probes[i] = i, res
+        finally:
+            # losers: streams stop at their next chunk, queued work is dropped
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+        info["cancelled"] = sum(1 for kind, _ in pending.values() if kind == "llm")
+
+        if winner is not None:
+            info.update(winner=winner, temperature=temps[winner], probe=probes[winner])
+            return changed[winner], info
+        if changed:
+            return changed[min(changed)], info
+        if errors and len(errors) == n:
+            rate_limited = [e for e in errors if isinstance(e, ChatRateLimited)]
+            raise rate_limited[0] if rate_limited else errors[0]
+        return current, info
@@ -1,4 +1,7 @@
 # agents/learner.py
+from utils.fingerprint import fingerprint
+
+
 class LearnerAgent:
     def learn_patterns(self, state: dict):
         state.setdefault("debug", []).append({"node": "learner", "attempts": int(state.get("attempts", 0))})
@@ -6,7 +9,12 @@ class LearnerAgent:
         patterns = state.get("learner_patterns") or {}
         if errors:
             for e in errors:
-                key = (str(e)[:80] or "unknown").strip()
-                patterns[key] = patterns.get(key, 0) + 1
+                # key on the error family, not the raw text: temp paths, line
+                # numbers and names differ between runs of the same mistake
+                fp = fingerprint(str(e))
+                p = patterns.setdefault(fp["family"], {"label": fp["label"], "count": 0, "signatures": []})
+                p["count"] += 1
+                if fp["signature"] not in p["signatures"]:
+                    p["signatures"].append(fp["signature"])
         state["learner_patterns"] = patterns
         return state
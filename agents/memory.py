@@ -1,9 +1,72 @@
 # agents/memory.py
+import atexit
+import os
+import threading
+from utils.fingerprint import fingerprint
 from utils.mcp_client import MCPClient
+from utils.patching import apply_hunks, diff_hunks
+from utils.write_behind import WriteBehindQueue
+
+# Try remembered fixes before asking the LLM (MEMORY_RECALL=0 to disable)
+MEMORY_RECALL = os.getenv("MEMORY_RECALL", "1") == "1"
+RECALL_TIMEOUT = int(os.getenv("RECALL_TIMEOUT", "3"))
+
+# Stores go through a background write-behind queue (MEMORY_WRITE_BEHIND=0 to
+# post synchronously). One queue per memory URL, shared across graph rebuilds.
+MEMORY_WRITE_BEHIND = os.getenv("MEMORY_WRITE_BEHIND", "1") == "1"
+MEMORY_QUEUE_SIZE = int(os.getenv("MEMORY_QUEUE_SIZE", "1000"))
+MEMORY_BATCH_SIZE = int(os.getenv("MEMORY_BATCH_SIZE", "50"))
+MEMORY_FLUSH_INTERVAL = float(os.getenv("MEMORY_FLUSH_INTERVAL", "1.0"))
+MEMORY_ENQUEUE_TIMEOUT = float(os.getenv("MEMORY_ENQUEUE_TIMEOUT", "0"))  # backpressure wait before dropping
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def _writer(memory_url: str) -> WriteBehindQueue:
+    with _writers_lock:
+        w = _writers.get(memory_url)
+        if w is None:
+            client = MCPClient(memory_url)
+
+            def flush(items):
+                resp = client.post("store_batch", {"items": items})
+                return isinstance(resp, dict) and bool(resp.get("ok"))
+
+            w = _writers[memory_url] = WriteBehindQueue(
+                flush, max_size=MEMORY_QUEUE_SIZE, batch_size=MEMORY_BATCH_SIZE,
+                interval=MEMORY_FLUSH_INTERVAL, put_timeout=MEMORY_ENQUEUE_TIMEOUT,
+                name="memory-write-behind",
+            )
+        return w
+
+
+def flush_memory_writes(timeout: float = 10.0) -> int:
+    """Write out all queued memory records (app shutdown / interpreter exit)."""
+    with _writers_lock:
+        writers = list(_writers.values())
+    return sum(w.flush(timeout) for w in writers)
+
+
+def memory_write_stats() -> dict:
+    with _writers_lock:
+        return {url: w.stats() for url, w in _writers.items()}
+
+
+atexit.register(flush_memory_writes)
+
 
 class MemoryAgent:
     def __init__(self, memory_url: str):
         self.memory = MCPClient(memory_url)
+        # recall sits on the hot path: fail fast and let the fixer take over
+        self.recaller = MCPClient(memory_url, timeout=RECALL_TIMEOUT)
+        self.writer = _writer(memory_url) if MEMORY_WRITE_BEHIND else None
+
+    def _store(self, payload: dict):
+        if self.writer is not None:
+            return {"queued": self.writer.put(payload)}
+        return self.memory.call("store", payload)
 
     def store(self, state: dict):
         state.setdefault("debug", []).append({"node": "memory", "attempts": int(state.get("attempts", 0))})
@@ -17,11 +80,90 @@ class MemoryAgent:
         payload = {
             "error_text": errors or "no-errors",
             "fix": {"files": {"main.py": code}},
+            "fixed_code": code,
+            "validated": bool(state.get("validated")),
         }
         try:
-            resp = self.memory.call("store", payload)
-            state["memory_write"] = resp
+            state["memory_write"] = self._store(payload)
         except Exception:
             # don't block the flow on memory failures
             pass
+
+        # A healed run: remember each error together with the change made for it
+        # (fixes from memory itself are already stored). Only the step that produced
+        # the validated code is known to work; an earlier one may just have traded
+        # its error for the next, so it's kept unvalidated and never recalled.
+        if state.get("validated"):
+            for step in state.get("heal_history") or []:
+                if step.get("source") == "memory":
+                    continue
+                try:
+                    self._store({
+                        "error_text": step["error"],
+                        "fix": {"files": {"main.py": step["after"]}},
+                        "before_code": step["before"],
+                        "fixed_code": step["after"],
+                        "validated": step["after"].strip() == code.strip(),
+                    })
+                except Exception:
+                    pass
+        return state
+
+    def recall(self, state: dict):
+        """
+        Look the current error up in memory and, if a healed fix is known, apply it
+        without an LLM call: verbatim when the code is the same as back then, else
+        by replaying that fix's diff onto the current code (fuzzy).
+        Sets state["memory_hit"] for the graph router. An error whose fingerprint
+        had no stored matches earlier in this run isn't looked up again.
+        """
+        dbg = state.setdefault("debug", [])
+        dbg.append({"node": "recall", "attempts": int(state.get("attempts", 0))})
+        state["memory_hit"] = False
+
+        errors = state.get("errors") or []
+        current = state.get("code", "") or ""
+        if not MEMORY_RECALL or not errors or not current:
+            dbg[-1]["skipped"] = True
+            return state
+
+        sig = fingerprint(str(errors[0]))["signature"]
+        dbg[-1]["signature"] = sig
+        misses = state.setdefault("recall_misses", [])
+        if sig in misses:
+            dbg[-1]["skipped"] = "known_miss"
+            return state
+
+        resp = self.recaller.post("query", {"error_text": str(errors[0])})
+        matches = (resp.get("matches") or []) if isinstance(resp, dict) else []
+        tried = state.setdefault("recall_tried", [])
+        for m in matches:
+            meta = m.get("metadata") or {}
+            fixed, before = meta.get("fixed_code") or "", meta.get("before_code") or ""
+            key = m.get("id")
+            if not meta.get("validated") or not fixed or key in tried:
+                continue
+            tried.append(key)
+            if before.strip() == current.strip():
+                candidate, how = fixed, "verbatim"
+            elif before:
+                candidate, how = apply_hunks(current, diff_hunks(before, fixed)), "replayed_diff"
+            else:
+                continue
+            if not candidate or candidate.strip() == current.strip():
+                continue
+
+            state["code"] = candidate
+            state["memory_hit"] = True
+            state.setdefault("heal_history", []).append(
+                {"error": errors[0], "before": current, "after": candidate, "source": "memory"})
+            fa = state.get("fix_attempts", [])
+            fa.append({"status": "ok", "changed": True, "source": "memory", "memory_id": key, "how": how})
+            state["fix_attempts"] = fa
+            dbg[-1].update({"hit": True, "memory_id": key, "how": how})
+            return state
+
+        if not matches:
+            misses.append(sig)  # nothing stored for it; later attempts can skip the call
+        dbg[-1].update({"hit": False, "candidates": len(matches)})
         return state
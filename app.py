@@ -7,20 +7,35 @@ Main FastAPI app for SelfHeal-Code-AI
 """
 
 import os
+import asyncio
 import multiprocessing
 import uvicorn
 from fastapi import FastAPI, Request                       # ✨ NEW: Request
 from dotenv import load_dotenv
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse   # ✨ NEW: JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 import socket
+import threading
+import time
+import json
 # ✨ NEW: hook the graph runner
-from graph.selfheal_graph import execute_selfheal          # <-- you'll add this function
+from graph.selfheal_graph import run_selfheal, get_graph, reload_graph, benchmark_graph
+from utils.jobs import JobManager, JobQueueFull
+from agents.memory import flush_memory_writes, memory_write_stats
+from utils.llm import cache_stats as llm_cache_stats, scheduler as llm_scheduler
+from utils.mcp_client import MCP_PORTS, MCP_TRANSPORT, AsyncMCPClient, client_stats as mcp_client_stats, close_clients, mcp_url
+from utils.mcp_local import MCP_MODULES, start_local_servers
 
 # load .env keys
 load_dotenv()
 
 app = FastAPI(title="SelfHeal Code AI")
+
+# Bounded pool of graph workers: the graph is fully synchronous, so it must
+# never run on the event loop itself (size via JOB_WORKERS / JOB_QUEUE_SIZE).
+jobs = JobManager()
+# async clients for probing the MCP servers from the event loop
+mcp_clients = {name: AsyncMCPClient(mcp_url(name), retries=0) for name in MCP_PORTS}
 # ------------------------
 # Utility to check port availability
 
@@ -39,13 +54,7 @@ def run_server(module: str, port: int):
 
 def start_mcp_servers():
     """Start all MCP microservers as separate processes (idempotent)."""
-    servers = [
-        ("mcp_servers.sandbox_server", 8001),
-        ("mcp_servers.tester_server", 8002),
-        ("mcp_servers.stackoverflow_server", 8003),
-        ("mcp_servers.docs_server", 8004),
-        ("mcp_servers.chroma_server", 8005),
-    ]
+    servers = [(MCP_MODULES[name], port) for name, port in MCP_PORTS.items()]
     procs = []
     for module, port in servers:
         if _port_in_use(port):
@@ -61,8 +70,31 @@ def start_mcp_servers():
 
 @app.on_event("startup")
 async def startup_event():
-    # start all MCP services in background
-    start_mcp_servers()
+    # start all MCP services in background; MCP_TRANSPORT=local runs them in this process instead
+    if MCP_TRANSPORT == "local":
+        threading.Thread(target=start_local_servers, name="mcp-local-start", daemon=True).start()
+    else:
+        start_mcp_servers()
+    # compile the graph once up front so the first request doesn't pay for it
+    t0 = time.perf_counter()
+    get_graph()
+    print(f"[BOOT] Compiled self-heal graph in {(time.perf_counter() - t0) * 1000:.1f} ms")
+    if os.getenv("GRAPH_BENCH", "0") == "1":
+        print(f"[BENCH] graph: {benchmark_graph()}")
+    jobs.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    # memory writes are queued in the background; don't lose the tail of them
+    n = flush_memory_writes()
+    if n:
+        print(f"[SHUTDOWN] Flushed {n} queued memory records")
+    close_clients()
+
+@app.on_event("shutdown")
+async def close_mcp_clients():
+    for c in mcp_clients.values():
+        await c.aclose()
 
 # ------------------------
 # Main API routes
@@ -76,18 +108,93 @@ async def root():
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    return {"status": "ok", "jobs": jobs.stats(), "llm_cache": llm_cache_stats(),
+            "llm_scheduler": llm_scheduler.snapshot(), "memory_writes": memory_write_stats(),
+            "mcp_clients": mcp_client_stats()}
+
+@app.get("/health/mcp")
+async def health_mcp():
+    """Ping every MCP server concurrently; a 404 still means the server is up."""
+    names = list(mcp_clients)
+    res = await asyncio.gather(*(mcp_clients[n].get("/health") for n in names))
+    return {n: {"up": "error" not in r or bool(r.get("status_code")), "health": r} for n, r in zip(names, res)}
+
+def _submit_prompt(prompt: str):
+    """Queue a self-heal run; returns (job, None) or (None, error JSONResponse)."""
+    if not prompt:
+        return None, JSONResponse({"error": "prompt is required"}, status_code=400)
+    try:
+        return jobs.submit(run_selfheal, prompt, stream_events=True), None
+    except JobQueueFull as e:
+        return None, JSONResponse({"error": str(e)}, status_code=429, headers={"Retry-After": "5"})
 
 # ✨ NEW: one-shot run endpoint that your frontend calls
 @app.post("/run_workflow")
 async def run_agentic_system(req: Request):
     payload = await req.json()
-    prompt = payload.get("prompt", "").strip()
-    if not prompt:
-        return JSONResponse({"error": "prompt is required"}, status_code=400)
-    # run the whole LangGraph/MCP pipeline and return a clean JSON
-    result = execute_selfheal(prompt)
-    return JSONResponse(result)
+    job, err = _submit_prompt(payload.get("prompt", "").strip())
+    if err is not None:
+        return err
+    # wait for the worker without blocking the event loop
+    while not job.done.is_set():
+        await asyncio.sleep(0.2)
+    if job.status == "failed":
+        return JSONResponse({"error": job.error}, status_code=500)
+    return JSONResponse(job.result)
+
+@app.post("/graph/reload")
+def graph_reload():
+    """Re-read .env and rebuild the shared graph (MAX_ATTEMPTS, MCP URLs, ...)."""
+    load_dotenv(override=True)
+    t0 = time.perf_counter()
+    reload_graph()
+    return {"ok": True, "build_ms": round((time.perf_counter() - t0) * 1000, 3)}
+
+# ------------------------
+# Async job API
+# ------------------------
+
+@app.post("/jobs")
+async def create_job(req: Request):
+    payload = await req.json()
+    job, err = _submit_prompt(payload.get("prompt", "").strip())
+    if err is not None:
+        return err
+    return JSONResponse({"job_id": job.id, "status": job.status}, status_code=202)
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "job not found"}, status_code=404)
+    return JSONResponse(job.to_dict())
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Server-Sent Events stream of per-node progress for a job: `node`, `code`
+    (diff + full code), `output` (sandbox stdout) and finally `result`.
+    Replays from the start, so it can be opened at any time; ends with `end`.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "job not found"}, status_code=404)
+
+    async def stream():
+        idx = 0
+        while True:
+            fresh = job.events[idx:]
+            for ev in fresh:
+                yield f"event: {ev.get('type', 'message')}\ndata: {json.dumps(ev, default=str)}\n\n"
+            idx += len(fresh)
+            if job.done.is_set() and idx >= len(job.events):
+                end = {"type": "end", "status": job.status, "error": job.error}
+                yield f"event: end\ndata: {json.dumps(end)}\n\n"
+                return
+            await asyncio.sleep(0.2)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # ------------------------
 # Main entry
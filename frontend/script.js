@@ -41,6 +41,91 @@
     throw new Error(lastErr || "No endpoint reachable");
   }
 
+  function render(data) {
+    // Optional logs from backend
+    if (Array.isArray(data.logs)) {
+      for (const l of data.logs) logOutput.textContent += l + "\n";
+    }
+
+    // Render code + meta
+    codeOutput.textContent = data.final_code || data.code || "";
+    validatedEl.textContent = `validated = ${Boolean(data.validated)}`;
+    attemptsEl.textContent  = `attempts = ${data.attempts ?? "?"}/${data.max_attempts ?? "?"}`;
+
+    if (data.program_output && data.program_output.trim()) {
+      logOutput.textContent += `\n[program output]\n${data.program_output}\n`;
+      }
+    // Warnings / issues / errors
+    if (Array.isArray(data.validation_warnings) && data.validation_warnings.length) {
+      logOutput.textContent += "\n[warnings]\n" + data.validation_warnings.join("\n") + "\n";
+    }
+    if (Array.isArray(data.validation_issues) && data.validation_issues.length) {
+      logOutput.textContent += "\n[issues]\n" + data.validation_issues.join("\n") + "\n";
+    }
+    if (Array.isArray(data.errors) && data.errors.length) {
+      logOutput.textContent += "\n[errors]\n" + data.errors.join("\n---\n") + "\n";
+    }
+
+    // Debug trace (if provided)
+    if (Array.isArray(data.debug)) {
+      logOutput.textContent += "\n[debug]\n" + data.debug.map(d => JSON.stringify(d)).join("\n") + "\n";
+    }
+  }
+
+  async function pollJob(jobId) {
+    for (;;) {
+      const resp = await fetch(`/jobs/${jobId}`);
+      if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+      const job = await resp.json();
+      if (job.status === "done") return job.result || {};
+      if (job.status === "failed") throw new Error(job.error || "job failed");
+      await new Promise((r) => setTimeout(r, 1000));
+    }
+  }
+
+  // Stream per-node progress from /jobs/{id}/events; resolves with the final result.
+  async function runStreaming(body) {
+    const resp = await fetch("/jobs", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(body),
+    });
+    if (!resp.ok || !window.EventSource) return null; // caller falls back to callApi
+    const { job_id } = await resp.json();
+
+    return new Promise((resolve, reject) => {
+      const es = new EventSource(`/jobs/${job_id}/events`);
+      let result = null;
+      es.addEventListener("node", (e) => {
+        const ev = JSON.parse(e.data);
+        attemptsEl.textContent = `attempts = ${ev.attempts}`;
+        for (const d of ev.debug || []) logOutput.textContent += JSON.stringify(d) + "\n";
+      });
+      es.addEventListener("code", (e) => {
+        const ev = JSON.parse(e.data);
+        codeOutput.textContent = ev.code || "";
+        if (ev.diff) logOutput.textContent += `[${ev.node}] code changed\n${ev.diff}\n`;
+      });
+      es.addEventListener("partial", (e) => {
+        const ev = JSON.parse(e.data);
+        logOutput.textContent += `[${ev.node}] ${ev.kind} ${ev.name} ready (line ${ev.lineno})\n`;
+      });
+      es.addEventListener("output", (e) => {
+        const ev = JSON.parse(e.data);
+        logOutput.textContent += `[program output]\n${ev.program_output}\n`;
+      });
+      es.addEventListener("result", (e) => { result = JSON.parse(e.data).result; });
+      es.addEventListener("end", (e) => {
+        es.close();
+        const ev = JSON.parse(e.data);
+        if (ev.status === "failed") reject(new Error(ev.error || "job failed"));
+        else resolve(result || {});
+      });
+      // stream dropped: stop (a reconnect would replay everything) and poll instead
+      es.onerror = () => { es.close(); pollJob(job_id).then(resolve, reject); };
+    });
+  }
+
   async function run(evt) {
     evt?.preventDefault(); // ✅ safer than relying on global event
 
@@ -57,36 +142,14 @@
     attemptsEl.textContent = "";
 
     try {
-      const data = await callApi({ prompt });
-
-      // Optional logs from backend
-      if (Array.isArray(data.logs)) {
-        for (const l of data.logs) logOutput.textContent += l + "\n";
-      }
-
-      // Render code + meta
-      codeOutput.textContent = data.final_code || data.code || "";
-      validatedEl.textContent = `validated = ${Boolean(data.validated)}`;
-      attemptsEl.textContent  = `attempts = ${data.attempts ?? "?"}/${data.max_attempts ?? "?"}`;
-
-      if (data.program_output && data.program_output.trim()) {
-        logOutput.textContent += `\n[program output]\n${data.program_output}\n`;
-        }
-      // Warnings / issues / errors
-      if (Array.isArray(data.validation_warnings) && data.validation_warnings.length) {
-        logOutput.textContent += "\n[warnings]\n" + data.validation_warnings.join("\n") + "\n";
-      }
-      if (Array.isArray(data.validation_issues) && data.validation_issues.length) {
-        logOutput.textContent += "\n[issues]\n" + data.validation_issues.join("\n") + "\n";
-      }
-      if (Array.isArray(data.errors) && data.errors.length) {
-        logOutput.textContent += "\n[errors]\n" + data.errors.join("\n---\n") + "\n";
-      }
-
-      // Debug trace (if provided)
-      if (Array.isArray(data.debug)) {
-        logOutput.textContent += "\n[debug]\n" + data.debug.map(d => JSON.stringify(d)).join("\n") + "\n";
+      let data = null;
+      try {
+        data = await runStreaming({ prompt });
+      } catch (e) {
+        logOutput.textContent += `\nStreaming failed (${e?.message || e}); retrying without it...\n`;
       }
+      if (data === null) data = await callApi({ prompt });
+      render(data);
     } catch (e) {
       logOutput.textContent += `\nRequest failed: ${e?.message || e}\n`;
     } finally {
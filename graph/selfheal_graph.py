@@ -1,16 +1,29 @@
 # graph/selfheal_graph.py
+import difflib
 import os
+import threading
+import time
+import uuid
+from typing import Callable, Optional
 from langgraph.graph import StateGraph, END
 from graph.state import CodeState
 
 from agents.code_generator import CodeGeneratorAgent
 from agents.validator import ValidatorAgent
-from agents.error_analyzer import ErrorAnalyzerAgent
+from agents.error_analyzer import ErrorAnalyzerAgent, attach_references, discard_references
 from agents.fixer import FixerAgent
 from agents.memory import MemoryAgent
 from agents.learner import LearnerAgent
+from utils.mcp_client import MCP_PORTS, mcp_url
+from utils import events
 
 DEFAULT_MAX_ATTEMPTS = int(os.getenv("MAX_ATTEMPTS", "3"))
+# how long a finished run waits for background reference lookups before returning
+REFERENCES_WAIT = float(os.getenv("REFERENCES_WAIT", "1.0"))
+
+def _default_max_attempts() -> int:
+    # read at call time so a changed MAX_ATTEMPTS is picked up on reload
+    return int(os.getenv("MAX_ATTEMPTS", str(DEFAULT_MAX_ATTEMPTS)))
 
 def _bump_attempts(state: CodeState) -> CodeState:
     state["attempts"] = int(state.get("attempts", 0)) + 1
@@ -25,6 +38,9 @@ def _hard_validation_issue(issues) -> bool:
 def _route_after_analyze(state: CodeState) -> str:
     return "fail" if state.get("errors") else "pass"
 
+def _route_after_recall(state: CodeState) -> str:
+    return "hit" if state.get("memory_hit") else "miss"
+
 def _route_after_validate(state: CodeState) -> str:
     if state.get("force_giveup"):
         return "giveup"
@@ -44,6 +60,8 @@ def _route_after_validate(state: CodeState) -> str:
 def _route_after_bump(state: CodeState) -> str:
     if state.get("force_giveup"):
         return "giveup"
+    if state.get("fix_verified"):
+        return "verified"
     attempts = int(state.get("attempts", 0))
     max_attempts = int(state.get("max_attempts", DEFAULT_MAX_ATTEMPTS))
     return "giveup" if attempts >= max_attempts else "again"
@@ -51,15 +69,16 @@ def _route_after_bump(state: CodeState) -> str:
 def build_graph():
     generator = CodeGeneratorAgent()
     analyzer  = ErrorAnalyzerAgent()
-    fixer     = FixerAgent()
+    fixer     = FixerAgent(probe=analyzer.probe)  # probe used only in speculative mode
     validator = ValidatorAgent()  # syntax-only
-    memory    = MemoryAgent(memory_url="http://127.0.0.1:8005")
+    memory    = MemoryAgent(memory_url=mcp_url("chroma"))
     learner   = LearnerAgent()
 
     g = StateGraph(CodeState)
 
     g.add_node("generate",  generator.generate_code)
     g.add_node("analyze",   analyzer.analyze_error)
+    g.add_node("recall",    memory.recall)
     g.add_node("fix",       fixer.fix_code)
     g.add_node("bump",      _bump_attempts)
     g.add_node("validate",  validator.validate_code)
@@ -72,12 +91,18 @@ def build_graph():
 
     g.add_conditional_edges("analyze", _route_after_analyze, {
         "pass": "validate",    # tests ok (or no tests): go validate syntax
-        "fail": "fix",         # tests failed: go fix
+        "fail": "recall",      # tests failed: try a remembered fix first
+    })
+
+    g.add_conditional_edges("recall", _route_after_recall, {
+        "hit": "bump",         # applied a known fix without the LLM; re-verify
+        "miss": "fix",
     })
 
     g.add_edge("fix", "bump")
     g.add_conditional_edges("bump", _route_after_bump, {
         "again": "analyze",    # try again until attempts exhausted
+        "verified": "validate",  # speculative winner already passed tests + run
         "giveup": "memory",
     })
 
@@ -92,10 +117,70 @@ def build_graph():
 
     return g.compile()
 
-def execute_selfheal(user_request: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> dict:
-    executor = build_graph()
+# ---- Process-wide compiled graph --------------------------------------------
+# Building the graph recompiles the StateGraph and creates fresh agents (and
+# their MCP clients), so we do it once and share the result across requests.
+# The compiled graph and agents hold no per-run state, so concurrent invoke()
+# calls from the job workers are safe. If the config that went into the build
+# changes (MAX_ATTEMPTS, *_URL), the next get_graph() rebuilds it.
+
+_graph_lock = threading.Lock()
+_graph_entry = None  # (config_key, compiled_graph)
+
+def _config_key() -> tuple:
+    return (_default_max_attempts(),) + tuple(mcp_url(s) for s in sorted(MCP_PORTS))
+
+def get_graph():
+    """Return the shared compiled graph, building it on first use or config change."""
+    global _graph_entry
+    key = _config_key()
+    entry = _graph_entry
+    if entry is not None and entry[0] == key:
+        return entry[1]
+    with _graph_lock:
+        entry = _graph_entry
+        if entry is None or entry[0] != key:
+            entry = (key, build_graph())
+            _graph_entry = entry
+        return entry[1]
+
+def reload_graph():
+    """Force a rebuild (e.g. after editing .env); returns the new compiled graph."""
+    global _graph_entry
+    with _graph_lock:
+        _graph_entry = (_config_key(), build_graph())
+        return _graph_entry[1]
+
+def benchmark_graph(n: int = 20) -> dict:
+    """
+    Measure graph build cost and the per-request overhead of getting a runnable
+    graph: rebuilding per request (old behaviour) vs the shared registry.
+    """
+    t0 = time.perf_counter()
+    build_graph()
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    for _ in range(n):
+        build_graph()
+    rebuild_ms = (time.perf_counter() - t0) * 1000 / n
+
+    get_graph()
+    t0 = time.perf_counter()
+    for _ in range(n):
+        get_graph()
+    warm_ms = (time.perf_counter() - t0) * 1000 / n
 
-    state = CodeState({
+    return {
+        "build_ms": round(build_ms, 3),
+        "per_request_rebuild_ms": round(rebuild_ms, 3),
+        "per_request_warm_ms": round(warm_ms, 4),
+        "samples": n,
+    }
+
+def _initial_state(user_request: str, max_attempts: int) -> CodeState:
+    return CodeState({
+        "run_id": uuid.uuid4().hex,
         "user_request": user_request,
         "code": "",
         "errors": [],
@@ -109,12 +194,21 @@ def execute_selfheal(user_request: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS
         "program_output": "",
         "attempts": 0,
         "max_attempts": max_attempts,
+        "analyze_count": 0,
+        "nochange_streak": 0,
+        "force_giveup": False,
+        "failed_tests": [],
+        "so_queried": False,
+        "docs_queried": [],
+        "fix_verified": False,
+        "heal_history": [],
+        "memory_hit": False,
+        "recall_tried": [],
+        "recall_misses": [],
         "debug": [],
     })
 
-    # Low recursion; control loop with attempts & loop-guards
-    final = executor.invoke(state, config={"recursion_limit": 40})
-
+def _summarize(final: dict, max_attempts: int) -> dict:
     return {
         "code": final.get("code", ""),
         "final_code": final.get("code", ""),
@@ -130,3 +224,71 @@ def execute_selfheal(user_request: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS
         "max_attempts": final.get("max_attempts", max_attempts),
         "debug": final.get("debug", []),
     }
+
+def _node_events(node: str, out: dict, prev: dict, seen_debug: int) -> list:
+    """Progress events for one finished node, relative to the previous state."""
+    debug = out.get("debug") or []
+    events = [{
+        "type": "node",
+        "node": node,
+        "attempts": int(out.get("attempts", 0)),
+        "debug": debug[seen_debug:],
+    }]
+    before, after = prev.get("code") or "", out.get("code") or ""
+    if after != before:
+        udiff = "\n".join(difflib.unified_diff(
+            before.splitlines(), after.splitlines(),
+            fromfile="before", tofile="after", lineterm=""))
+        events.append({"type": "code", "node": node, "code": after, "diff": udiff[:5000]})
+    output = out.get("program_output") or ""
+    if output and output != (prev.get("program_output") or ""):
+        events.append({"type": "output", "node": node, "program_output": output})
+    return events
+
+def run_selfheal(user_request: str, max_attempts: int | None = None,
+                 on_event: Optional[Callable[[dict], None]] = None) -> dict:
+    """
+    Run the self-heal graph with LangGraph's streaming execution.
+    After every node, on_event (if given) receives the node's new debug entries,
+    a code diff when the code changed and fresh sandbox output; a final
+    {"type": "result"} event carries the same dict this function returns.
+    Agents may also emit mid-node events (e.g. "partial" definitions while
+    streaming code) through utils.events.
+    """
+    executor = get_graph()
+    if max_attempts is None:
+        max_attempts = _default_max_attempts()
+
+    state = _initial_state(user_request, max_attempts)
+    final: dict = state
+    seen_debug = 0
+
+    if on_event is not None:
+        events.register(state["run_id"], on_event)
+    try:
+        # Low recursion; control loop with attempts & loop-guards
+        for chunk in executor.stream(state, config={"recursion_limit": 40}):
+            for node, out in chunk.items():
+                if not isinstance(out, dict):
+                    continue
+                if on_event is not None and node != END:
+                    for ev in _node_events(node, out, final, seen_debug):
+                        on_event(ev)
+                seen_debug = len(out.get("debug") or [])
+                final = out
+        attach_references(final, timeout=REFERENCES_WAIT, final=True)
+    finally:
+        discard_references(state["run_id"])
+        events.unregister(state["run_id"])
+
+    result = _summarize(final, max_attempts)
+    if on_event is not None:
+        on_event({"type": "result", "result": result})
+    return result
+
+def execute_selfheal(user_request: str, max_attempts: int | None = None) -> dict:
+    return run_selfheal(user_request, max_attempts)
+
+if __name__ == "__main__":
+    # python -m graph.selfheal_graph  -> print the build/overhead benchmark
+    print(benchmark_graph())
@@ -1,6 +1,9 @@
 class CodeState(dict):
     """
     Shared state between all agents in the graph.
+
+    LangGraph keeps one channel per annotated key and drops anything else between
+    nodes, so every key a node hands to the next one must be listed here.
     """
     user_request: str
     code: str
@@ -8,3 +11,35 @@ class CodeState(dict):
     fixed_code: str
     test_results: str
     explanation: str
+
+    # run bookkeeping
+    run_id: str
+    attempts: int
+    max_attempts: int
+    analyze_count: int
+    nochange_streak: int
+    force_giveup: bool
+    giveup_reason: str
+    debug: list
+
+    # analyze / validate
+    program_output: str
+    failed_tests: list
+    so_queried: bool
+    docs_queried: list
+    references: dict
+    analyzer_output: dict
+    validated: bool
+    validation_issues: list
+    validation_warnings: list
+
+    # fix / memory / learner
+    fix_attempts: list
+    fix_verified: bool
+    heal_history: list
+    patch_metrics: dict
+    memory_hit: bool
+    memory_write: dict
+    recall_tried: list
+    recall_misses: list
+    learner_patterns: dict
@@ -3,16 +3,31 @@
 MCP - Chroma Memory (v0.5+ API, telemetry OFF, local persistence)
 
 Endpoints:
- - POST /store        { "error_text": "...", "fix": { ... } }
- - POST /query        { "error_text": "..." }
+ - POST /store        { "error_text": "...", "fix": { ... },
+                        "before_code": "...", "fixed_code": "...", "validated": true }
+ - POST /store_batch  { "items": [ <store payload>, ... ] }   one upsert for many records
+ - POST /query        { "error_text": "...", "k": 5, "offset": 0, "min_score": 0.3,
+                        "use_embeddings": false }
+                      exact signature hit first, else top-k similar errors from a
+                      BM25 inverted index reranked by token overlap (paginated);
+                      records of the same error family score at least FAMILY_SCORE
  - POST /query_by_sig { "signature": "abcd1234" }
  - GET  /health
+
+Records are keyed by the normalized error fingerprint (utils/fingerprint.py), so
+the same error from another temp dir / line / variable name lands on one record.
 """
 
 from fastapi import FastAPI
 from pydantic import BaseModel
-import hashlib
+from collections import deque
 import os
+import threading
+import time
+from typing import List
+
+from utils.fingerprint import fingerprint
+from utils.fts_index import FTSIndex, similarity
 
 # Chroma v0.5+ client API
 try:
@@ -49,16 +64,111 @@ COL_NAME = "error_fixes"
 # v0.5+ still supports get_or_create_collection
 collection = client.get_or_create_collection(name=COL_NAME)
 
+# ---- Similarity index -------------------------------------------------------
+# Token-level inverted index over the error documents (SQLite FTS5, BM25) so
+# /query never has to load the whole collection. Rebuilt from Chroma in the
+# background if it's missing (e.g. first start on an existing DB).
+index = FTSIndex(os.path.join(PERSIST_DIR, "error_index.sqlite3"), table="errors")
+INDEX_CANDIDATES = int(os.getenv("MEMORY_INDEX_CANDIDATES", "50"))
+# Chroma's own embedding search is opt-in: the default embedder downloads a model
+EMBED_QUERY = os.getenv("CHROMA_EMBED_QUERY", "0") == "1"
+# Minimum score for a record in the same error family (same type + message shape)
+FAMILY_SCORE = float(os.getenv("MEMORY_FAMILY_SCORE", "0.6"))
+
+def _rekey_legacy(page: int = 1000) -> int:
+    """
+    Records stored before fingerprinting are keyed by a hash of the raw error
+    text (and have no "family"), so exact lookups by fingerprint miss them.
+    Move each one to its fingerprint key; a validated record already there wins.
+    Runs once: the collection's "fingerprint_keys" metadata marks it done.
+    """
+    if (collection.metadata or {}).get("fingerprint_keys"):
+        return 0
+    legacy = []
+    for offset in range(0, collection.count(), page):
+        res = collection.get(limit=page, offset=offset, include=["documents", "metadatas"])
+        legacy += [(i, d or "", m or {}) for i, d, m in zip(res.get("ids") or [], res.get("documents") or [],
+                                                           res.get("metadatas") or []) if "family" not in (m or {})]
+    for old_id, doc, meta in legacy:
+        fp = fingerprint(doc)
+        new_id = fp["signature"]
+        if new_id != old_id:
+            prev = collection.get(ids=[new_id], include=["metadatas"])
+            prev_meta = (prev.get("metadatas") or [None])[0] or {}
+            if not (prev_meta.get("validated") and not meta.get("validated")):
+                meta = dict(meta, signature=new_id, family=fp["family"], error_label=fp["label"])
+                collection.upsert(ids=[new_id], documents=[doc], metadatas=[meta])
+                index.upsert(new_id, doc)
+            collection.delete(ids=[old_id])
+            index.delete(old_id)
+        else:
+            collection.update(ids=[old_id], metadatas=[dict(meta, family=fp["family"], error_label=fp["label"])])
+    # every record written from here on carries its family, so one pass is enough
+    collection.modify(metadata=dict(collection.metadata or {}, fingerprint_keys=True))
+    if legacy:
+        print(f"[chroma] re-keyed {len(legacy)} records stored before error fingerprints")
+    return len(legacy)
+
+def _backfill_index(page: int = 1000):
+    try:
+        _rekey_legacy(page)
+        total = collection.count()
+        if index.count() >= total:
+            return
+        for offset in range(0, total, page):
+            res = collection.get(limit=page, offset=offset, include=["documents"])
+            index.upsert_many(
+                (i, {"text": d or ""}) for i, d in zip(res.get("ids") or [], res.get("documents") or [])
+            )
+    except Exception as e:
+        print(f"[chroma] index backfill failed: {e}")
+
+threading.Thread(target=_backfill_index, name="chroma-index-backfill", daemon=True).start()
+
+class _Latency:
+    """Rolling query latency stats for /health."""
+    def __init__(self, window: int = 1000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def add(self, ms: float):
+        with self._lock:
+            self.samples.append(ms)
+            self.count += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            s = sorted(self.samples)
+        if not s:
+            return {"count": self.count}
+        pick = lambda q: round(s[min(len(s) - 1, int(q * len(s)))], 3)
+        return {"count": self.count, "p50_ms": pick(0.5), "p95_ms": pick(0.95), "max_ms": round(s[-1], 3)}
+
+query_latency = _Latency()
+
 # ---- Helpers ----------------------------------------------------------------
-def _sig(text: str) -> str:
-    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()[:16]
+# Chroma keeps metadata in SQLite; cap stored code so one record can't balloon
+MAX_CODE_CHARS = int(os.getenv("MEMORY_MAX_CODE_CHARS", "50000"))
 
 class StoreIn(BaseModel):
     error_text: str
     fix: dict
+    before_code: str = ""   # code that produced error_text
+    fixed_code: str = ""    # code after the fix (defaults to the first file in fix["files"])
+    validated: bool = False # True when the fix is known to have healed the run
+
+class StoreBatchIn(BaseModel):
+    items: List[StoreIn]
+
+MAX_BATCH = int(os.getenv("MEMORY_MAX_BATCH", "500"))
 
 class QueryIn(BaseModel):
     error_text: str
+    k: int = 5
+    offset: int = 0
+    min_score: float = 0.3      # token-overlap similarity threshold (0..1)
+    use_embeddings: bool = False
 
 class QuerySig(BaseModel):
     signature: str
@@ -71,58 +181,149 @@ def health():
         "persist_dir": PERSIST_DIR,
         "collection": COL_NAME,
         "telemetry": False,
+        "indexed": index.count(),
+        "query_latency": query_latency.snapshot(),
     }
 
-@app.post("/store")
-def store_fix(payload: StoreIn):
-    sig = _sig(payload.error_text)
+def _prepare(payload: StoreIn):
+    fp = fingerprint(payload.error_text)
+    sig = fp["signature"]
     doc = (payload.error_text or "")[:2000]
+    fixed = payload.fixed_code
+    if not fixed and isinstance(payload.fix, dict):
+        files = payload.fix.get("files") or {}
+        fixed = next(iter(files.values()), "") if isinstance(files, dict) else ""
     metadata = {
         "signature": sig,
-        "fix_preview": str(list(payload.fix.keys()))[:500]
-        if isinstance(payload.fix, dict) else str(payload.fix)[:500],
+        "family": fp["family"],
+        "error_label": fp["label"],
+        "fix_preview": (fixed or str(payload.fix))[:500],
+        "fixed_code": (fixed or "")[:MAX_CODE_CHARS],
+        "before_code": (payload.before_code or "")[:MAX_CODE_CHARS],
+        "validated": bool(payload.validated),
     }
+    return sig, doc, metadata
+
+def _upsert(items: list) -> dict:
+    """One Chroma upsert + one index write for many StoreIn records."""
+    records = {}
+    for it in items:
+        sig, doc, meta = _prepare(it)
+        prev = records.get(sig)
+        # same error twice in one batch: the later record wins unless only the earlier one is validated
+        if prev and prev[1]["validated"] and not meta["validated"]:
+            continue
+        records[sig] = (doc, meta)
+    if not records:
+        return {"ok": True, "stored": 0, "kept": 0, "signatures": []}
+
+    # never let an unhealed run overwrite a fix that is known to work
+    unvalidated = [i for i, (_, m) in records.items() if not m["validated"]]
+    kept = []
+    if unvalidated:
+        prev = collection.get(ids=unvalidated, include=["metadatas"])
+        kept = [i for i, m in zip(prev.get("ids") or [], prev.get("metadatas") or []) if (m or {}).get("validated")]
+    ids = [i for i in records if i not in kept]
+    if ids:
+        collection.upsert(ids=ids, documents=[records[i][0] for i in ids], metadatas=[records[i][1] for i in ids])
+        index.upsert_many((i, {"text": records[i][0]}) for i in ids)
+    return {"ok": True, "stored": len(ids), "kept": len(kept), "signatures": list(records)}
+
+@app.post("/store")
+def store_fix(payload: StoreIn):
     try:
-        try:
-            collection.add(ids=[sig], documents=[doc], metadatas=[metadata])
-        except Exception:
-            # If ID exists, update
-            collection.update(ids=[sig], documents=[doc], metadatas=[metadata])
-        return {"ok": True, "signature": sig}
+        res = _upsert([payload])
+        out = {"ok": True, "signature": res["signatures"][0]}
+        if res["kept"]:
+            out["kept"] = "validated"
+        return out
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+
+@app.post("/store_batch")
+def store_batch(payload: StoreBatchIn):
+    try:
+        return _upsert(payload.items[:MAX_BATCH])
     except Exception as e:
         return {"ok": False, "error": str(e)}
 
+def _records(ids: list) -> dict:
+    """id -> {document, metadata} for just these ids."""
+    if not ids:
+        return {}
+    res = collection.get(ids=ids)
+    return {
+        i: {"document": d, "metadata": m}
+        for i, d, m in zip(res.get("ids") or [], res.get("documents") or [], res.get("metadatas") or [])
+    }
+
+def _embedding_hits(text: str, n: int) -> dict:
+    """id -> similarity from Chroma's vector search (distance mapped to 0..1)."""
+    try:
+        res = collection.query(query_texts=[text], n_results=n, include=["distances"])
+        ids = (res.get("ids") or [[]])[0]
+        dists = (res.get("distances") or [[]])[0]
+        return {i: 1.0 / (1.0 + float(d)) for i, d in zip(ids, dists)}
+    except Exception:
+        return {}
+
 @app.post("/query")
 def query_fix(payload: QueryIn):
-    sig = _sig(payload.error_text)
+    t0 = time.perf_counter()
+    k = min(max(1, payload.k), 100)
+    offset = max(0, payload.offset)
+    fp = fingerprint(payload.error_text)
+    sig = fp["signature"]
+
+    def done(out: dict) -> dict:
+        ms = (time.perf_counter() - t0) * 1000
+        query_latency.add(ms)
+        out["elapsed_ms"] = round(ms, 3)
+        out["signature"], out["family"] = sig, fp["family"]
+        return out
 
     # First: exact ID match
     try:
         res = collection.get(ids=[sig])
-        if res and res.get("ids"):
+        if res and res.get("ids") and offset == 0:
             ids = res.get("ids", [])
             docs = res.get("documents", [])
             metas = res.get("metadatas", [])
-            out = [{"id": ids[i], "document": docs[i], "metadata": metas[i]} for i in range(len(ids))]
-            return {"ok": True, "matches": out}
+            out = [{"id": ids[i], "document": docs[i], "metadata": metas[i], "score": 1.0, "match": "exact"}
+                   for i in range(len(ids))]
+            return done({"ok": True, "matches": out, "total": len(out), "k": k, "offset": 0, "next_offset": None})
     except Exception:
-        pass  # fall through to substring
+        pass  # fall through to similarity search
 
-    # Fallback: naive substring search across all docs (small scale)
+    # Top-k similar errors: BM25 candidates from the inverted index, reranked by
+    # token overlap and cut at min_score (optionally merged with vector hits)
     try:
-        all_items = collection.get()
-        ids = all_items.get("ids", []) or []
-        docs = all_items.get("documents", []) or []
-        metas = all_items.get("metadatas", []) or []
         term = (payload.error_text or "").strip()
-        matches = []
-        if term:
-            for i, d in enumerate(docs):
-                if term in (d or ""):
-                    matches.append({"id": ids[i], "document": d, "metadata": metas[i]})
-        return {"ok": True, "matches": matches}
+        if not term:
+            return done({"ok": True, "matches": [], "total": 0, "k": k, "offset": offset, "next_offset": None})
+        want = max(INDEX_CANDIDATES, (offset + k) * 4)
+        scores = {h["doc_id"]: similarity(term, h["text"]) for h in index.search(term, limit=want)}
+        try:
+            fam = collection.get(where={"family": fp["family"]}, limit=want, include=[])
+            for i in fam.get("ids") or []:
+                scores[i] = max(scores.get(i, 0.0), FAMILY_SCORE)
+        except Exception:
+            pass
+        if payload.use_embeddings or EMBED_QUERY:
+            for i, sc in _embedding_hits(term, want).items():
+                scores[i] = max(scores.get(i, 0.0), sc)
+        ranked = sorted(((sc, i) for i, sc in scores.items() if sc >= payload.min_score), reverse=True)
+        page = ranked[offset:offset + k]
+        recs = _records([i for _, i in page])
+        matches = [
+            {"id": i, "document": recs[i]["document"], "metadata": recs[i]["metadata"],
+             "score": round(sc, 4), "match": "similar"}
+            for sc, i in page if i in recs
+        ]
+        nxt = offset + k if offset + k < len(ranked) else None
+        return done({"ok": True, "matches": matches, "total": len(ranked), "k": k, "offset": offset, "next_offset": nxt})
     except Exception as e:
-        return {"ok": False, "error": str(e)}
+        return done({"ok": False, "error": str(e)})
 
 @app.post("/query_by_sig")
 def query_by_sig(payload: QuerySig):
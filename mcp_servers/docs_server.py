@@ -2,36 +2,170 @@
 mcp_servers/docs_server.py
 
 Simple MCP service that fetches PyPI package metadata (via pypi.org JSON API)
-Endpoint:
+and answers offline questions about the installed packages from a local
+symbol index (utils/symbol_index.py: modules, public symbols, signatures and
+docstrings, read from source with `ast`).
+Endpoints:
  - POST /pkg_info  { "package": "fastapi" }
-Returns package info summary.
+ - POST /pkg_info_batch  { "packages": ["fastapi", "pydantic"] }
+ - POST /symbol    { "module": "pydantic", "name": "BaseModel" }  or  { "name": "pydantic.BaseModel" }
+ - POST /module    { "module": "fastapi.testclient" }
+ - POST /suggest   { "module": "pydnatic" }  /  { "module": "fastapi", "name": "FastAP" }
+ - POST /reindex   rebuild in the background (only changed distributions)
+ - GET  /health
+Misses on /symbol and /module carry "did you mean" suggestions.
+
+PyPI answers go through utils/response_cache.py (persistent, ETag
+revalidation, stale-while-revalidate, one upstream call per package at a time).
+
+DOCS_INDEX: startup (build in the background at startup, default), lazy
+(the first lookup starts the background build) or off. Lookups answer
+{"building": true} until the first build is in.
 """
 
 from fastapi import FastAPI
 from pydantic import BaseModel
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 import requests
+import os
+import re
+import threading
+
+from utils.response_cache import NOT_MODIFIED, ResponseCache
+from utils.symbol_index import DOCS_INDEX_PATH, SymbolIndex
 
 app = FastAPI(title="MCP - PyPI Docs")
 
 PYPI_URL = "https://pypi.org/pypi/{pkg}/json"
+PKG_NOT_FOUND_TTL = float(os.getenv("PKG_NOT_FOUND_TTL", "600"))
+PKG_BATCH_MAX = int(os.getenv("PKG_BATCH_MAX", "50"))
+
+# PyPI metadata: fresh for 6 h, then served stale (and revalidated) for a week
+cache = ResponseCache("docs", {"/pkg_info": (6 * 3600, 7 * 24 * 3600)})
+_pypi = requests.Session()
+_batch = ThreadPoolExecutor(max_workers=8, thread_name_prefix="pkg-info")
+
+DOCS_INDEX = os.getenv("DOCS_INDEX", "startup")
+
+index = SymbolIndex(DOCS_INDEX_PATH) if DOCS_INDEX != "off" else None
+_build_lock = threading.Lock()
 
 class PkgIn(BaseModel):
     package: str
 
-@app.post("/pkg_info")
-def pkg_info(payload: PkgIn):
-    pkg = payload.package.strip()
-    if not pkg:
-        return {"ok": False, "error": "empty package"}
+class PkgBatchIn(BaseModel):
+    packages: List[str]
+
+class SymbolIn(BaseModel):
+    module: str = ""
+    name: str = ""
+
+class ModuleIn(BaseModel):
+    module: str
+
+def _build():
+    if not _build_lock.acquire(blocking=False):
+        return  # a build is already running
     try:
-        r = requests.get(PYPI_URL.format(pkg=pkg), timeout=8)
-        if r.status_code == 404:
-            return {"ok": False, "error": "package not found"}
-        r.raise_for_status()
-        j = r.json()
-        info = j.get("info", {})
-        releases = j.get("releases", {}).keys()
-        return {
+        stats = index.build()
+        print(f"[DOCS] symbol index: {stats['dists_indexed']} distributions re-indexed in {stats['ms']:.0f} ms")
+    except Exception as e:
+        print(f"[DOCS] symbol index build failed: {e}")
+    finally:
+        _build_lock.release()
+
+def _build_in_background():
+    threading.Thread(target=_build, name="docs-index", daemon=True).start()
+
+def _ready():
+    """None when the index can answer, else an error dict."""
+    if index is None:
+        return {"ok": False, "error": "symbol index disabled (DOCS_INDEX=off)"}
+    if index.empty():
+        if DOCS_INDEX == "lazy":
+            # a cold build takes far longer than a lookup's timeout: never inside the request
+            _build_in_background()
+        return {"ok": False, "error": "symbol index is still building", "building": True}
+    return None
+
+@app.on_event("startup")
+def _startup():
+    if DOCS_INDEX == "startup":
+        _build_in_background()
+
+@app.get("/health")
+def health():
+    return {"status": "ok", "index_mode": DOCS_INDEX, "index": index.stats() if index else None,
+            "cache": cache.stats()}
+
+@app.post("/symbol")
+def symbol(payload: SymbolIn):
+    err = _ready()
+    if err:
+        return err
+    module, name = payload.module.strip(), payload.name.strip()
+    if not module:
+        resolved = index.resolve(name)
+        if resolved is None:
+            return {"ok": True, "found": False, "suggestions": index.suggest_module(name)}
+        module, name = resolved
+    hit = index.symbol(module, name)
+    if hit:
+        return {"ok": True, "found": True, **hit}
+    if index.module(module) is None:
+        return {"ok": True, "found": False, "suggestions": index.suggest_module(module)}
+    suggestions = index.suggest_symbol(module, name)
+    # the likeliest intended symbol, so callers get its signature right away
+    best = index.symbol(module, suggestions[0]) if suggestions else None
+    return {"ok": True, "found": False, "module": module, "suggestions": suggestions, "best": best}
+
+@app.post("/module")
+def module(payload: ModuleIn):
+    err = _ready()
+    if err:
+        return err
+    name = payload.module.strip()
+    info = index.module(name)
+    if info is None:
+        return {"ok": True, "found": False, "suggestions": index.suggest_module(name)}
+    return {"ok": True, "found": True, **info, "members": index.members(info["module"]),
+            "submodules": index.submodules(info["module"])}
+
+@app.post("/suggest")
+def suggest(payload: SymbolIn):
+    err = _ready()
+    if err:
+        return err
+    module, name = payload.module.strip(), payload.name.strip()
+    if name and module:
+        return {"ok": True, "suggestions": index.suggest_symbol(module, name)}
+    return {"ok": True, "suggestions": index.suggest_module(module or name)}
+
+@app.post("/reindex")
+def reindex():
+    if index is None:
+        return {"ok": False, "error": "symbol index disabled (DOCS_INDEX=off)"}
+    _build_in_background()
+    return {"ok": True, "building": True}
+
+def _fetch_pkg(pkg: str, validators: dict):
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    r = _pypi.get(PYPI_URL.format(pkg=pkg), headers=headers, timeout=8)
+    if r.status_code == 304:
+        return NOT_MODIFIED
+    if r.status_code == 404:
+        return {"value": {"ok": False, "error": "package not found"}, "ttl": PKG_NOT_FOUND_TTL}
+    r.raise_for_status()
+    j = r.json()
+    info = j.get("info", {})
+    releases = j.get("releases", {}).keys()
+    return {
+        "value": {
             "ok": True,
             "name": info.get("name"),
             "summary": info.get("summary"),
@@ -39,6 +173,30 @@ def pkg_info(payload: PkgIn):
             "home_page": info.get("home_page"),
             "requires_dist": info.get("requires_dist"),
             "releases": list(releases)[:10]
-        }
+        },
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+    }
+
+def _pkg_info(package: str) -> dict:
+    pkg = package.strip()
+    if not pkg:
+        return {"ok": False, "error": "empty package"}
+    # PyPI treats "Foo_Bar" and "foo-bar" as the same project
+    key = re.sub(r"[-_.]+", "-", pkg).lower()
+    try:
+        value, how = cache.lookup("/pkg_info", key, lambda v: _fetch_pkg(pkg, v))
+        return dict(value, cache=how)
     except Exception as e:
         return {"ok": False, "error": str(e)}
+
+@app.post("/pkg_info")
+def pkg_info(payload: PkgIn):
+    return _pkg_info(payload.package)
+
+@app.post("/pkg_info_batch")
+def pkg_info_batch(payload: PkgBatchIn):
+    """{ "packages": ["fastapi", "pydantic"] } -> {"results": {package: pkg_info}}; fetched concurrently."""
+    names = list(dict.fromkeys(p.strip() for p in payload.packages if p.strip()))[:PKG_BATCH_MAX]
+    results = dict(zip(names, _batch.map(_pkg_info, names)))
+    return {"ok": True, "results": results}
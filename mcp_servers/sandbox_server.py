@@ -1,39 +1,147 @@
+"""
+mcp_servers/sandbox_server.py
+
+MCP - Sandbox: run a Python snippet and return its output.
+
+POST /run { "code": "...", "timeout": 8, "cpu_seconds": 8, "memory_mb": 512, "force": false,
+            "output_cap": 65536, "kill_on_output_cap": false, "spool_output": false }
+  -> { stdout, stderr, returncode, timed_out, worker, queue_wait_ms, run_ms, cached?,
+       stdout_bytes, stderr_bytes, truncated, output_killed?, artifact? }
+GET  /artifact/{artifact}/{stdout|stderr}  full output of a run made with "spool_output": true
+GET  /health
+
+Runs are admission-controlled: at most SANDBOX_CONCURRENCY execute at once
+(default: the pool size), up to SANDBOX_QUEUE_SIZE more wait for a slot (at
+most SANDBOX_QUEUE_TIMEOUT s), anything beyond that gets a 429 right away.
+Limits from the request are honoured but clamped to SANDBOX_MAX_TIMEOUT /
+SANDBOX_MAX_MEMORY_MB.
+
+Output is captured through bounded head + tail buffers (utils/output_capture.py):
+stdout/stderr carry at most output_cap bytes each (clamped to SANDBOX_MAX_OUTPUT_CAP),
+with the real byte counts and a truncated flag next to them.
+
+Identical code + limits are answered from an execution cache (utils/exec_cache.py)
+without taking a slot; "force": true re-runs. Spooled runs always execute.
+"""
+
+import asyncio
+import math
+import os
+import threading
+import time
+
 from fastapi import FastAPI
-import subprocess, tempfile, os, shutil, sys
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from utils.exec_cache import ExecCache
+from utils.output_capture import OUTPUT_CAP, OUTPUT_KILL, read_artifact
+from utils.zygote import ZygotePool, DEFAULT_MEMORY_MB
 
 app = FastAPI(title="MCP - Sandbox")
 
+# Pre-forked, pre-imported interpreters: each run is a fork of a warm zygote
+# (fresh temp cwd, rlimits, killed on timeout) instead of a cold `python main.py`.
+pool = ZygotePool()
+results = ExecCache()
+
+CONCURRENCY = int(os.getenv("SANDBOX_CONCURRENCY", "0")) or pool.size
+QUEUE_SIZE = int(os.getenv("SANDBOX_QUEUE_SIZE", "64"))
+QUEUE_TIMEOUT = float(os.getenv("SANDBOX_QUEUE_TIMEOUT", "30"))
+DEFAULT_TIMEOUT = float(os.getenv("SANDBOX_TIMEOUT", "10"))
+MAX_TIMEOUT = float(os.getenv("SANDBOX_MAX_TIMEOUT", "60"))
+MAX_MEMORY_MB = int(os.getenv("SANDBOX_MAX_MEMORY_MB", "2048"))
+MAX_OUTPUT_CAP = int(os.getenv("SANDBOX_MAX_OUTPUT_CAP", str(1024 * 1024)))
+
+_slots = None      # asyncio.Semaphore, created on the server's loop
+_waiting = 0
+_stats = {"admitted": 0, "rejected": 0, "queue_timeouts": 0, "running": 0}
+
+@app.on_event("startup")
+def _startup():
+    global _slots
+    _slots = asyncio.Semaphore(CONCURRENCY)
+    threading.Thread(target=pool.prewarm, name="sandbox-prewarm", daemon=True).start()
+
+@app.on_event("shutdown")
+def _close_pool():
+    pool.close()
+
+@app.get("/health")
+def health():
+    return {"status": "ok", "pool": pool.stats(), "admission": dict(_stats, waiting=_waiting,
+            concurrency=CONCURRENCY, queue_size=QUEUE_SIZE), "exec_cache": results.stats()}
+
+def _num(value, default, lo, hi):
+    try:
+        return min(max(type(default)(value), lo), hi)
+    except (TypeError, ValueError):
+        return default
+
+@app.get("/artifact/{artifact}/{stream}")
+def artifact(artifact: str, stream: str):
+    text = read_artifact(artifact, stream)
+    if text is None:
+        return JSONResponse({"error": "artifact not found or expired"}, status_code=404)
+    return PlainTextResponse(text)
+
+def _busy(msg: str, status: int = 429):
+    return JSONResponse({"stdout": "", "stderr": msg, "returncode": -1, "timed_out": False, "error": msg},
+                        status_code=status, headers={"Retry-After": "1"})
+
 @app.post("/run")
-def run_code(request: dict):
+async def run_code(request: dict):
+    global _waiting
     code = request.get("code", "")
-    tmpdir = tempfile.mkdtemp(prefix="mcp_sandbox_")
-    path = os.path.join(tmpdir, "main.py")
+    timeout = _num(request.get("timeout"), DEFAULT_TIMEOUT, 0.1, MAX_TIMEOUT)
+    job = {
+        "kind": "run",
+        "files": {"main.py": code},
+        "timeout": timeout,
+        # CPU limit a bit above the wall timeout so a busy loop reports as a timeout
+        "cpu_seconds": _num(request.get("cpu_seconds"), math.ceil(timeout) + 1, 1, int(MAX_TIMEOUT) + 1),
+        "memory_mb": _num(request.get("memory_mb"), DEFAULT_MEMORY_MB, 32, MAX_MEMORY_MB),
+        "output_cap": _num(request.get("output_cap"), OUTPUT_CAP, 1024, MAX_OUTPUT_CAP),
+        "kill_on_output_cap": bool(request.get("kill_on_output_cap", OUTPUT_KILL)),
+        "spool_output": bool(request.get("spool_output")),
+    }
+
+    key = results.key("run", job["files"], timeout=job["timeout"], cpu=job["cpu_seconds"], mem=job["memory_mb"],
+                      out=job["output_cap"], kill=job["kill_on_output_cap"])
+    # a spooled run needs its own artifact, so it never comes from (or goes to) the cache
+    hit = None if job["spool_output"] else results.get(key, force=bool(request.get("force")))
+    if hit is not None:
+        hit.update(queue_wait_ms=0.0, run_ms=0.0)
+        return hit
+
+    # counted before the first await, so a burst can't all slip past the check
+    if _waiting + _stats["running"] >= CONCURRENCY + QUEUE_SIZE:
+        _stats["rejected"] += 1
+        return _busy("sandbox busy: queue full")
+    t0 = time.perf_counter()
+    _waiting += 1
+    try:
+        await asyncio.wait_for(_slots.acquire(), QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        _stats["queue_timeouts"] += 1
+        return _busy("sandbox busy: timed out waiting for a slot", 503)
+    else:
+        _stats["running"] += 1
+    finally:
+        _waiting -= 1
+    queue_wait = time.perf_counter() - t0
+
+    _stats["admitted"] += 1
+    t1 = time.perf_counter()
     try:
-        with open(path, "w", encoding="utf-8") as f:
-            f.write(code)
-
-        proc = subprocess.run(
-            [sys.executable, path],
-            cwd=tmpdir,
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-        return {
-            "stdout": proc.stdout,
-            "stderr": proc.stderr,
-            "returncode": proc.returncode,
-            "timed_out": False
-        }
-    except subprocess.TimeoutExpired as e:
-        return {
-            "stdout": e.stdout or "",
-            "stderr": (e.stderr or "") + "TIMEOUT",
-            "returncode": 124,
-            "timed_out": True
-        }
+        res = await pool.run_async(job)
     except Exception as e:
         # Never 500 — always return JSON
-        return {"stdout": "", "stderr": str(e), "returncode": -1, "timed_out": False}
+        res = {"stdout": "", "stderr": str(e), "returncode": -1, "timed_out": False}
     finally:
-        shutil.rmtree(tmpdir, ignore_errors=True)
+        _stats["running"] -= 1
+        _slots.release()
+    if not job["spool_output"]:
+        results.put(key, job["files"], res)
+    res["queue_wait_ms"] = round(queue_wait * 1000, 3)
+    res["run_ms"] = round((time.perf_counter() - t1) * 1000, 3)
+    return res
@@ -4,25 +4,60 @@ mcp_servers/stackoverflow_server.py
 Small MCP wrapper around Stack Exchange API (StackOverflow search).
 POST /search  { "query": "text", "pagesize": 5 }
 Returns a list of {title, link, is_answered, score, excerpt}
+GET  /health
+
+SO_MODE picks where results come from:
+- offline: the local index built by `python -m utils.so_corpus Posts.xml`
+  (SO_CORPUS_PATH); answers in milliseconds, no network
+- live:    api.stackexchange.com (the original behaviour)
+- hybrid:  offline first; the live API only fills up what the index didn't
+  cover, and after a failed live call it's skipped for SO_LIVE_RETRY s
+  (air-gapped hosts)
+Default: hybrid when an index exists, live otherwise.
+
+Live API answers go through utils/response_cache.py: persistent, fresh for a
+day and then served stale while a background refresh runs, and one upstream
+call per query at a time. Cached answers are still served while the API is
+being skipped. The API has no ETag/Last-Modified, so there's no conditional
+revalidation here.
 """
 
 from fastapi import FastAPI
 from pydantic import BaseModel
 import requests
 import os
+import re
+import time
+
+from utils.response_cache import ResponseCache
+from utils.so_corpus import SO_CORPUS_PATH, SOCorpus
 
 app = FastAPI(title="MCP - StackOverflow")
 
 STACK_EX_BASE = "https://api.stackexchange.com/2.3/search/advanced"
 
+SO_MODE = os.getenv("SO_MODE") or ("hybrid" if os.path.exists(SO_CORPUS_PATH) else "live")
+SO_LIVE_TIMEOUT = float(os.getenv("SO_LIVE_TIMEOUT", "8" if SO_MODE == "live" else "3"))
+SO_LIVE_RETRY = float(os.getenv("SO_LIVE_RETRY", "60"))
+
+corpus = SOCorpus(SO_CORPUS_PATH) if SO_MODE in ("offline", "hybrid") else None
+_live_down_until = 0.0
+_api = requests.Session()
+cache = ResponseCache("stackoverflow", {"/search": (24 * 3600, 7 * 24 * 3600)})
+
 class QueryIn(BaseModel):
     query: str
     pagesize: int = 5
 
-@app.post("/search")
-def search_stackoverflow(payload: QueryIn):
-    q = payload.query
-    pagesize = min(max(1, payload.pagesize), 20)
+@app.get("/health")
+def health():
+    return {"status": "ok", "mode": SO_MODE, "corpus": corpus.count() if corpus else None,
+            "live_down": time.monotonic() < _live_down_until, "cache": cache.stats()}
+
+def _live_search(q: str, pagesize: int) -> list:
+    global _live_down_until
+    if SO_MODE == "hybrid" and time.monotonic() < _live_down_until:
+        raise RuntimeError("StackOverflow API unreachable; retrying later")
     params = {
         "order": "desc",
         "sort": "relevance",
@@ -31,19 +66,52 @@ def search_stackoverflow(payload: QueryIn):
         "pagesize": pagesize
     }
     try:
-        r = requests.get(STACK_EX_BASE, params=params, timeout=8)
+        r = _api.get(STACK_EX_BASE, params=params, timeout=SO_LIVE_TIMEOUT)
         r.raise_for_status()
-        data = r.json()
-        items = data.get("items", [])[:pagesize]
-        results = []
-        for it in items:
-            results.append({
-                "title": it.get("title"),
-                "link": it.get("link"),
-                "is_answered": it.get("is_answered"),
-                "score": it.get("score"),
-                "excerpt": it.get("excerpt") if "excerpt" in it else None
-            })
-        return {"ok": True, "results": results}
+    except requests.RequestException:
+        _live_down_until = time.monotonic() + SO_LIVE_RETRY
+        raise
+    data = r.json()
+    items = data.get("items", [])[:pagesize]
+    results = []
+    for it in items:
+        results.append({
+            "title": it.get("title"),
+            "link": it.get("link"),
+            "is_answered": it.get("is_answered"),
+            "score": it.get("score"),
+            "excerpt": it.get("excerpt") if "excerpt" in it else None
+        })
+    return results
+
+def _question_id(link: str) -> str:
+    """Offline links end at the id, live ones carry a slug after it."""
+    m = re.search(r"/questions/(\d+)", link or "")
+    return m.group(1) if m else link
+
+def _live(q: str, pagesize: int) -> tuple:
+    """(results, cache status) of the live API, through the response cache."""
+    key = (" ".join(q.lower().split()), pagesize)
+    return cache.lookup("/search", key, lambda validators: {"value": _live_search(q, pagesize)})
+
+@app.post("/search")
+def search_stackoverflow(payload: QueryIn):
+    q = payload.query
+    pagesize = min(max(1, payload.pagesize), 20)
+    try:
+        if SO_MODE == "live":
+            results, how = _live(q, pagesize)
+            return {"ok": True, "results": results, "source": "live", "cache": how}
+        results = corpus.search(q, pagesize)
+        source, how = "offline", None
+        if SO_MODE == "hybrid" and len(results) < pagesize:
+            try:
+                live, how = _live(q, pagesize)
+                seen = {_question_id(r["link"]) for r in results}
+                results += [r for r in live if _question_id(r["link"]) not in seen]
+                source = "hybrid"
+            except Exception:
+                pass  # offline results still stand
+        return {"ok": True, "results": results[:pagesize], "source": source, "cache": how}
     except Exception as e:
         return {"ok": False, "error": str(e)}
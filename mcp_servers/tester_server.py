@@ -1,15 +1,148 @@
 # mcp_servers/tester_server.py
-from fastapi import FastAPI, Request
+import asyncio
+import os
+import threading
+
+from fastapi import FastAPI
 from fastapi.responses import JSONResponse
-from utils.test_runner import run_pytest_on_files
+from utils.cache import TTLCache, make_key
+from utils.exec_cache import ExecCache
+from utils.zygote import ZygotePool, PRELOAD
 
 app = FastAPI(title="MCP Tester Server")
 
+# Forked pytest workers: zygotes with pytest (and the usual test deps) already
+# imported fork once per run and call pytest.main in a fresh workspace.
+TESTER_PRELOAD = [m for m in os.getenv(
+    "TESTER_PRELOAD", "pytest,_pytest.python,_pytest.assertion.rewrite,fastapi.testclient,httpx"
+).split(",") if m.strip()]
+
+def _plugin_modules():
+    # installed pytest plugins are loaded (and assert-rewritten) on every pytest.main;
+    # importing them in the zygote makes that a no-op in the forked run
+    try:
+        from importlib.metadata import entry_points
+        return [ep.module for ep in entry_points(group="pytest11")]
+    except Exception:
+        return []
+
+TESTER_TIMEOUT = float(os.getenv("TESTER_TIMEOUT", "30"))
+# tmpfs workspace when there is one: test files are tiny and short-lived
+TESTER_TMPDIR = os.getenv("TESTER_TMPDIR") or ("/dev/shm" if os.access("/dev/shm", os.W_OK) else "")
+
+pool = ZygotePool(size=int(os.getenv("TESTER_POOL_SIZE", "0")) or min(4, os.cpu_count() or 2),
+                  preload=PRELOAD + TESTER_PRELOAD + _plugin_modules())
+# same files + limits -> same test results; "force": true in the request re-runs
+results = ExecCache()
+# run_id -> {"failed": [node ids], "known": [node ids]} for failed-first ordering
+sessions = TTLCache(max_entries=1024, ttl=float(os.getenv("TESTER_SESSION_TTL", "3600")))
+# per-test durations (seconds), used to balance shards
+durations = TTLCache(max_entries=20000, ttl=24 * 3600)
+TESTER_SHARDS = int(os.getenv("TESTER_SHARDS", "0")) or pool.size
+TESTER_SHARD_MIN_SECONDS = float(os.getenv("TESTER_SHARD_MIN_SECONDS", "2"))
+
+@app.on_event("startup")
+def _prewarm():
+    threading.Thread(target=pool.prewarm, name="tester-prewarm", daemon=True).start()
+
+@app.on_event("shutdown")
+def _close_pool():
+    pool.close()
+
+@app.get("/health")
+def health():
+    return {"status": "ok", "pool": pool.stats(), "tmp_root": TESTER_TMPDIR or None,
+            "exec_cache": results.stats(), "sessions": sessions.stats(), "durations": durations.stats()}
+
+def _failing(tests: list) -> list:
+    return [t["nodeid"] for t in tests if t.get("outcome") in ("failed", "error") and "::" in t.get("nodeid", "")]
+
+def _duration_key(files: dict, nodeid: str) -> str:
+    # per test *and* test-file content: "test_app.py::test_add" means different things across runs
+    return make_key(files.get(nodeid.split("::")[0], ""), nodeid)
+
+async def _pytest(files: dict, args: list, force: bool = False) -> dict:
+    """One pytest run (cached), normalised to the /pytest response shape."""
+    key = results.key("pytest", files, timeout=TESTER_TIMEOUT, mem=1024, args=args)
+    cached = results.get(key, force=force)
+    if cached is not None:
+        return cached
+    res = await pool.run_async({
+        "kind": "pytest",
+        "files": files,
+        "args": args,
+        "timeout": TESTER_TIMEOUT,
+        "memory_mb": 1024,
+        "tmp_root": TESTER_TMPDIR,
+    })
+    report = res.pop("report", None) or {}
+    out = {
+        "passed": res.get("returncode") == 0,
+        "returncode": res.get("returncode"),
+        "stdout": res.get("stdout", ""),
+        "stderr": res.get("stderr", ""),
+        "timed_out": bool(res.get("timed_out")),
+        "error": "TIMEOUT" if res.get("timed_out") else None,
+        "tests": report.get("tests", []),
+        "summary": report.get("summary", {}),
+        "worker": res.get("worker"),
+        "duration_ms": res.get("duration_ms"),
+    }
+    for t in out["tests"]:
+        durations.set(_duration_key(files, t["nodeid"]), t.get("duration", 0.0))
+    # pytest exit codes 0/1/5: all passed / some failed / nothing collected
+    results.put(key, files, out, ok_codes=(0, 1, 5))
+    return out
+
+def _merge(outs: list, parallel: bool = False) -> dict:
+    """Combine several pytest runs into one response (exit code 5 = 'nothing collected' is neutral)."""
+    if len(outs) == 1:
+        return outs[0]
+    bad = [o["returncode"] for o in outs if o.get("returncode") not in (0, 5)]
+    rc = bad[0] if bad else (0 if any(o.get("returncode") == 0 for o in outs) else 5)
+    tests = [t for o in outs for t in o.get("tests") or []]
+    summary = {k: sum(1 for t in tests if t["outcome"] == k) for k in ("passed", "failed", "error", "skipped")}
+    summary["total"] = len(tests)
+    ms = [o.get("duration_ms") or 0 for o in outs]
+    return {
+        "passed": rc == 0,
+        "returncode": rc,
+        "stdout": "\n".join(o["stdout"] for o in outs if (o.get("stdout") or "").strip()),
+        "stderr": "\n".join(o["stderr"] for o in outs if (o.get("stderr") or "").strip()),
+        "timed_out": any(o.get("timed_out") for o in outs),
+        "error": next((o["error"] for o in outs if o.get("error")), None),
+        "tests": tests,
+        "summary": summary,
+        "worker": outs[0].get("worker"),
+        "duration_ms": round(max(ms) if parallel else sum(ms), 3),
+    }
+
+async def _full_suite(files: dict, deselect: list, known: list, force: bool) -> dict:
+    """The whole suite; sharded across workers when recorded durations say it pays off."""
+    timed = [(durations.get(_duration_key(files, n)), n) for n in known if n not in deselect]
+    timed = [(d, n) for d, n in timed if d is not None]
+    total = sum(d for d, _ in timed)
+    n_shards = min(TESTER_SHARDS, len(timed))
+    if n_shards < 2 or total < TESTER_SHARD_MIN_SECONDS:
+        return dict(await _pytest(files, [a for n in deselect for a in ("--deselect", n)], force), phase="full")
+
+    groups = [[0.0, []] for _ in range(n_shards)]
+    for d, n in sorted(timed, reverse=True):
+        g = min(groups, key=lambda g: g[0])
+        g[0] += d
+        g[1].append(n)
+    # plus one run for everything without a recorded duration (new tests)
+    rest = [a for n in deselect + [n for _, n in timed] for a in ("--deselect", n)]
+    runs = [_pytest(files, g[1], force) for g in groups] + [_pytest(files, rest, force)]
+    out = _merge(list(await asyncio.gather(*runs)), parallel=True)
+    return dict(out, phase="sharded", shards=len(runs))
+
 @app.post("/pytest")
-async def run_tests(request: Request):
+async def run_tests(data: dict):
     try:
-        data = await request.json()
         files = data.get("files", {}) or {}
+        run_id = data.get("run_id") or ""
+        force = bool(data.get("force"))
 
         # Detect explicit tests from payload
         has_tests = any(
@@ -20,18 +153,43 @@ async def run_tests(request: Request):
         if not has_tests:
             # ✨ If no tests provided, treat as success.
             # This avoids the default FastAPI test that breaks simple scripts.
-            return JSONResponse({
+            return {
                 "passed": True,
                 "returncode": 0,
                 "stdout": "NO_TESTS",
                 "stderr": "",
                 "timed_out": False,
                 "error": None
-            })
+            }
 
-        # Run only the provided tests (no auto-injected defaults)
-        res = run_pytest_on_files(files, timeout=30, create_default_test=False)
-        return JSONResponse(res)
+        # Run only the provided tests (no auto-injected defaults).
+        # Failed-first: whatever failed last time (hint or session) runs alone with -x;
+        # the rest of the suite only runs once those pass.
+        session = sessions.get(run_id) if run_id else None
+        prev = data.get("failed_tests") or (session or {}).get("failed") or []
+        prev = [n for n in dict.fromkeys(prev) if n.split("::")[0] in files]
+        outs = []
+        if prev:
+            first = await _pytest(files, ["-x", *prev], force)
+            if first.get("returncode") not in (0, 4, 5):   # 4/5: ids no longer exist -> just run everything
+                out = dict(first, phase="failed_first", partial=True)
+                if run_id:
+                    sessions.set(run_id, {"failed": _failing(first["tests"]) or prev,
+                                          "known": (session or {}).get("known", [])})
+                return out
+            if first.get("returncode") == 0:
+                outs.append(first)
+        deselect = [t["nodeid"] for o in outs for t in o["tests"]]
+        known = (session or {}).get("known") or []
+        full = await _full_suite(files, deselect, known, force)
+        out = _merge(outs + [full])
+        out["phase"] = "failed_first+full" if outs else full.get("phase", "full")
+        if full.get("shards"):
+            out["shards"] = full["shards"]
+        if run_id:
+            sessions.set(run_id, {"failed": _failing(out["tests"]),
+                                  "known": [t["nodeid"] for t in out["tests"]]})
+        return out
     except Exception as e:
         return JSONResponse({
             "passed": False,
@@ -0,0 +1,30 @@
+from utils.patching import apply_hunks, apply_patch, diff_hunks
+
+SOURCE = "def f(y):\n    return y+1\n\n\ndef g(x):\n    return x+1\n"
+
+
+def _sr(search: str, replace: str) -> str:
+    return f"<<<<<<< SEARCH\n{search}\n=======\n{replace}\n>>>>>>> REPLACE\n"
+
+
+def test_fuzzy_tie_is_rejected():
+    # matches both functions equally well: no guessing
+    patched, fmt = apply_patch(SOURCE, _sr("    return z+1", "    return z+2"))
+    assert fmt == "search_replace"
+    assert patched is None
+
+
+def test_several_exact_matches_are_rejected():
+    src = "def f():\n    return 1\n\n\ndef g():\n    return 1\n"
+    assert apply_patch(src, _sr("    return 1", "    return 2"))[0] is None
+
+
+def test_unique_fuzzy_match_still_applies():
+    patched, _ = apply_patch(SOURCE, _sr("def g(x):\n    return x + 1", "def g(x):\n    return x + 2"))
+    assert patched == "def f(y):\n    return y+1\n\n\ndef g(x):\n    return x + 2\n"
+
+
+def test_replayed_diff():
+    before = "a = 1\nb = 2\nc = 3\n"
+    after = "a = 1\nb = 20\nc = 3\n"
+    assert apply_hunks("x = 0\n" + before, diff_hunks(before, after)) == "x = 0\n" + after
@@ -0,0 +1,178 @@
+"""
+utils/code_stream.py
+
+Incremental checks on a streamed LLM code completion.
+- StreamingCodeChecker is fed text deltas and flags dead ends as soon as they
+  are certain: prose instead of code at the start, or a syntax error in the
+  part of the file whose top-level blocks have already closed.
+- A closing ``` fence ends the code; whatever follows is chatter we don't need.
+- Completed top-level def/class blocks are reported so the UI can show them
+  before the whole file has arrived.
+
+stream_code() wraps utils.llm.chat_stream with these checks, cancels a bad
+completion early and re-prompts up to `retries` times.
+"""
+
+import ast
+import os
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.llm import chat_stream, PRIORITY_GENERATE
+
+# Agents use stream_code() instead of chat() when LLM_STREAMING=1
+LLM_STREAMING = os.getenv("LLM_STREAMING", "0") == "1"
+STREAM_RETRIES = int(os.getenv("STREAM_RETRIES", "1"))
+
+# "Here is the code:", "Sure! Below ...", "This program ..." and similar openers
+_PROSE_RE = re.compile(r"^(here|below|sure|certainly|this|the following|i |i'm|okay|ok)\b", re.IGNORECASE)
+
+# statements that continue the previous top-level block rather than start one
+_CONTINUATIONS = ("else", "elif", "except", "finally", "case")
+
+# syntax errors that only mean "not finished yet" (e.g. a column-0 line inside a docstring)
+_INCOMPLETE_HINTS = ("unterminated", "EOF", "was never closed", "unexpected EOF")
+
+
+class StreamingCodeChecker:
+    def __init__(self):
+        self.text = ""             # raw streamed text
+        self.lines: List[str] = [] # complete code lines (fences removed)
+        self.fenced: Optional[bool] = None
+        self.done = False          # closing fence seen: the rest is not code
+        self.error: Optional[str] = None
+        self._emitted = set()
+        self._pending = ""
+
+    def code(self) -> str:
+        tail = [] if self.done else [self._pending]
+        return "\n".join(self.lines + tail).strip()
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """Consume a delta; returns newly completed top-level definitions."""
+        if self.done or self.error:
+            return []
+        self.text += chunk
+        self._pending += chunk
+        *complete, self._pending = self._pending.split("\n")
+        found: List[Dict] = []
+        for line in complete:
+            found.extend(self._line(line))
+            if self.done or self.error:
+                break
+        return found
+
+    # ---- internals --------------------------------------------------------------
+    def _line(self, line: str) -> List[Dict]:
+        stripped = line.strip()
+        if self.fenced is None:
+            if not stripped:
+                return []
+            if stripped.startswith("```"):
+                self.fenced = True
+                return []
+            self.fenced = False
+            if _PROSE_RE.match(stripped) and not _parses(stripped):
+                self.error = "prose_leak: response starts with prose instead of code"
+                return []
+        elif stripped.startswith("```"):
+            self.done = True
+            return []
+
+        starts_block = (
+            line[:1] not in ("", " ", "\t", "#", ")", "]", "}")
+            and not stripped.split(" ")[0].rstrip(":") in _CONTINUATIONS
+        )
+        last = next((l for l in reversed(self.lines) if l.strip()), "")
+        found: List[Dict] = []
+        # a decorator line belongs to the def/class that follows it
+        if starts_block and last and not last.startswith("@"):
+            found = self._check_prefix()
+        self.lines.append(line)
+        return found
+
+    def finish(self) -> List[Dict]:
+        """Stream ended: report definitions from the final block too (no dead-end check)."""
+        if self.error:
+            return []
+        if not self.done and self._pending.strip():
+            self.lines.append(self._pending)
+            self._pending = ""
+        return self._check_prefix(flag_errors=False)
+
+    def _check_prefix(self, flag_errors: bool = True) -> List[Dict]:
+        src = "\n".join(self.lines)
+        try:
+            tree = ast.parse(src)
+        except SyntaxError as e:
+            msg = str(e)
+            if flag_errors and not any(h in msg for h in _INCOMPLETE_HINTS):
+                self.error = f"syntax: {msg}"
+            return []
+        found = []
+        for node in tree.body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                key = (node.name, node.lineno)
+                if key in self._emitted:
+                    continue
+                self._emitted.add(key)
+                found.append({
+                    "kind": "class" if isinstance(node, ast.ClassDef) else "def",
+                    "name": node.name,
+                    "lineno": node.lineno,
+                    "source": ast.get_source_segment(src, node) or "",
+                })
+        return found
+
+
+def _parses(src: str) -> bool:
+    try:
+        ast.parse(src)
+        return True
+    except SyntaxError:
+        return False
+
+
+def stream_code(messages: List[Dict], max_tokens: int = 1500, temperature: float = 0.2,
+                priority: int = PRIORITY_GENERATE, retries: int = 1,
+                on_definition: Optional[Callable[[Dict], None]] = None) -> Tuple[str, Dict]:
+    """
+    Stream a completion, abandoning it as soon as the checker finds a dead end and
+    re-prompting with the reason (at most `retries` times).
+    Returns (code, info) where info = {"cancelled": [reasons], "early_stop": bool}.
+    The last attempt's code is returned even if it was flagged; callers validate it.
+    ChatRateLimited and other LLM errors propagate.
+    """
+    info: Dict = {"cancelled": [], "early_stop": False}
+    msgs = list(messages)
+    checker = StreamingCodeChecker()
+    for attempt in range(retries + 1):
+        checker = StreamingCodeChecker()
+        # cached answers are only trusted on the first try; re-prompts must be fresh
+        stream = chat_stream(msgs, max_tokens=max_tokens, temperature=temperature,
+                             use_cache=(attempt == 0), priority=priority)
+        try:
+            for delta in stream:
+                for d in checker.feed(delta):
+                    if on_definition is not None:
+                        on_definition(d)
+                if checker.error or checker.done:
+                    break
+        finally:
+            stream.close()
+        if not checker.error and on_definition is not None:
+            for d in checker.finish():
+                on_definition(d)
+        if checker.done:
+            info["early_stop"] = True
+        if not checker.error:
+            return checker.code(), info
+        info["cancelled"].append(checker.error)
+        msgs = list(messages) + [
+            {"role": "assistant", "content": checker.text},
+            {"role": "user", "content": (
+                f"That output was rejected ({checker.error}). "
+                "Return ONLY the complete Python file, no prose and no markdown."
+            )},
+        ]
+    return checker.code(), info
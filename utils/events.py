@@ -0,0 +1,39 @@
+"""
+utils/events.py
+
+Tiny registry that lets agents push progress events for the run they are
+working on while a node is still executing (the graph itself only reports
+after each node finishes). graph.run_selfheal registers the run's on_event
+callback under state["run_id"]; agents call emit(state, {...}).
+"""
+
+import threading
+from typing import Any, Callable, Dict
+
+_sinks: Dict[str, Callable[[dict], None]] = {}
+_lock = threading.Lock()
+
+
+def register(run_id: str, on_event: Callable[[dict], None]):
+    with _lock:
+        _sinks[run_id] = on_event
+
+
+def unregister(run_id: str):
+    with _lock:
+        _sinks.pop(run_id, None)
+
+
+def emit(state: Dict[str, Any], event: dict):
+    """Send an event to the run's listener, if anyone is listening. Never raises."""
+    run_id = state.get("run_id")
+    if not run_id:
+        return
+    with _lock:
+        sink = _sinks.get(run_id)
+    if sink is None:
+        return
+    try:
+        sink(event)
+    except Exception:
+        pass
@@ -0,0 +1,105 @@
+"""
+utils/exec_cache.py
+
+Content-addressed cache for sandbox/tester executions: the same files run with
+the same interpreter and limits give the same result, so the analyze -> fix ->
+analyze loop (and identical programs from different users) can skip the run.
+
+- key: hash of kind, files, interpreter version and limits/args.
+- Only clean, deterministic results are stored: no timeouts, no infra errors,
+  no kills by signal, and no code importing modules whose output can change
+  from run to run (random, time, network, threads, ...). The module check is a
+  static scan of the imports; it's a heuristic, not a guarantee.
+- Callers pass force=True to re-execute; the fresh result replaces the entry.
+
+Env: EXEC_CACHE (1/0), EXEC_CACHE_TTL (s), EXEC_CACHE_ENTRIES
+"""
+
+import ast
+import copy
+import os
+import sys
+from typing import Any, Dict, Optional
+
+from utils.cache import TTLCache, make_key
+
+EXEC_CACHE = os.getenv("EXEC_CACHE", "1") == "1"
+EXEC_CACHE_TTL = float(os.getenv("EXEC_CACHE_TTL", "600"))
+EXEC_CACHE_ENTRIES = int(os.getenv("EXEC_CACHE_ENTRIES", "1024"))
+
+NONDETERMINISTIC_MODULES = {
+    "random", "secrets", "uuid", "time", "datetime", "calendar", "os", "platform",
+    "socket", "ssl", "http", "urllib", "requests", "httpx", "aiohttp", "subprocess",
+    "threading", "multiprocessing", "concurrent", "asyncio", "tempfile", "glob", "shutil",
+    "pathlib", "sqlite3",
+}
+_INTERPRETER = f"{sys.implementation.name}-{sys.version}"
+
+
+def _imports(source: str):
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return set()
+    mods = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            mods.update(a.name.split(".")[0] for a in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            mods.add(node.module.split(".")[0])
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in ("input", "id", "hash", "__import__"):
+            mods.add(node.func.id)
+    return mods
+
+
+def is_deterministic(files: Dict[str, str]) -> bool:
+    for src in (files or {}).values():
+        if _imports(src or "") & (NONDETERMINISTIC_MODULES | {"input", "id", "hash", "__import__"}):
+            return False
+    return True
+
+
+class ExecCache:
+    def __init__(self, max_entries: int = EXEC_CACHE_ENTRIES, ttl: float = EXEC_CACHE_TTL, enabled: bool = EXEC_CACHE):
+        self.enabled = enabled
+        self.cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self.stored = 0
+        self.skipped = 0   # results not cached (timeout / error / nondeterministic)
+        self.forced = 0
+
+    def key(self, kind: str, files: Dict[str, str], **limits: Any) -> str:
+        return make_key(kind, files or {}, _INTERPRETER, limits)
+
+    def get(self, key: str, force: bool = False) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        if force:
+            self.forced += 1
+            return None
+        res = self.cache.get(key)
+        if res is None:
+            return None
+        out = copy.deepcopy(res)
+        out["cached"] = True
+        return out
+
+    def put(self, key: str, files: Dict[str, str], res: Dict[str, Any], ok_codes=None) -> bool:
+        """
+        Store `res` if it's a clean, repeatable result. ok_codes: return codes that
+        mean "ran to the end" (default: any exit status >= 0 except 124 = timeout).
+        """
+        if not self.enabled:
+            return False
+        rc = res.get("returncode")
+        ran = rc in ok_codes if ok_codes is not None else (isinstance(rc, int) and rc >= 0 and rc != 124)
+        clean = ran and not res.get("timed_out") and is_deterministic(files)
+        if not clean:
+            self.skipped += 1
+            return False
+        self.cache.set(key, copy.deepcopy(res))
+        self.stored += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.cache.stats(), enabled=self.enabled, stored=self.stored,
+                    skipped=self.skipped, forced=self.forced)
@@ -0,0 +1,81 @@
+"""
+utils/fingerprint.py
+
+Canonical fingerprints for Python / pytest errors, so the same failure keys the
+same way no matter the temp dir, line number, object address or identifier.
+
+fingerprint(text) -> {
+    "exc_type":  "NameError",
+    "template":  "name <name> is not defined",    # normalized message
+    "frames":    "app.py:main > app.py:add",      # user frames, no line numbers
+    "signature": "3f1c...",  # exc_type + template + frame shape (fine-grained)
+    "family":    "9ab0...",  # exc_type + coarse template (groups near-duplicates)
+    "label":     "NameError: name <name> is not defined",
+}
+"""
+
+import hashlib
+import re
+from typing import Any, Dict, List
+
+from utils.tracebacks import parse_error, _is_user_frame, _short
+
+_SUBS = [
+    (re.compile(r"0x[0-9a-fA-F]+"), "<addr>"),
+    (re.compile(r"(?:[A-Za-z]:)?(?:[\\/][\w.\-<>]+)+[\\/]?"), "<path>"),
+    (re.compile(r"'[A-Za-z_][\w.]*'|\"[A-Za-z_][\w.]*\""), "<name>"),
+    (re.compile(r"'[^']*'|\"[^\"]*\""), "<str>"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "<num>"),
+    (re.compile(r"\s+"), " "),
+]
+_PLACEHOLDER_RE = re.compile(r"<\w+>")
+FAMILY_WORDS = 6
+
+
+def _h(*parts: str) -> str:
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def normalize_message(msg: str) -> str:
+    out = (msg or "").strip()
+    for rx, repl in _SUBS:
+        out = rx.sub(repl, out)
+    return out.strip()[:300]
+
+
+def _frame_shape(frames: List[Dict[str, Any]]) -> str:
+    shape: List[str] = []
+    for f in frames:
+        if not _is_user_frame(f["file"]):
+            continue
+        s = f"{_short(f['file'])}:{f['func'] or '?'}"
+        if not shape or shape[-1] != s:
+            shape.append(s)
+    return " > ".join(shape[-6:])
+
+
+def fingerprint(text: str) -> Dict[str, str]:
+    info = parse_error(text or "")
+    exc_type = info["exc_type"] or "Unknown"
+    msg = info["message"]
+    if not info["exc_type"]:
+        tail = [l for l in (text or "").splitlines() if l.strip()]
+        msg = tail[-1] if tail else ""
+    template = normalize_message(msg)
+    frames = _frame_shape(info["frames"])
+    coarse = " ".join(template.split(" ")[:FAMILY_WORDS])
+    return {
+        "exc_type": exc_type,
+        "template": template,
+        "frames": frames,
+        "signature": _h(exc_type, template, frames),
+        "family": _h(exc_type, coarse),
+        "label": f"{exc_type}: {template}".rstrip(": ")[:120],
+    }
+
+
+def search_query(fp: Dict[str, str], limit: int = 160) -> str:
+    """Text for a web/Q&A search: exception type plus the message without placeholders."""
+    words = _PLACEHOLDER_RE.sub(" ", fp.get("template", ""))
+    q = " ".join(f"{fp.get('exc_type', '')} {words}".split())
+    return (q if fp.get("exc_type") != "Unknown" else words.strip())[:limit] or "python error"
@@ -0,0 +1,112 @@
+"""
+utils/fts_index.py
+
+Token-level inverted index on SQLite FTS5 (BM25 ranking), used where we need
+"similar text" lookups without scanning every stored document.
+- upsert()/upsert_many() keep one row per doc_id (extra columns are optional).
+- search() returns the top candidates by BM25; callers usually rerank them
+  with similarity() and apply a threshold.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+_TOKEN_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]+")
+MAX_QUERY_TOKENS = 32
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens, order kept, duplicates removed."""
+    return list(dict.fromkeys(t.lower() for t in _TOKEN_RE.findall(text or "")))
+
+
+def similarity(a: str, b: str) -> float:
+    """Jaccard similarity of the token sets, 0..1."""
+    ta, tb = set(tokenize(a)), set(tokenize(b))
+    if not ta or not tb:
+        return 0.0
+    return len(ta & tb) / len(ta | tb)
+
+
+class FTSIndex:
+    def __init__(self, path: str, table: str = "docs", columns: Sequence[str] = ("text",)):
+        """`columns` are the searchable text columns; doc_id is stored alongside."""
+        self.path = path
+        self.table = table
+        self.columns = list(columns)
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        cols = ", ".join(self.columns)
+        self._conn.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+            f"doc_id UNINDEXED, {cols}, tokenize='unicode61')"
+        )
+        # doc_id -> FTS rowid, so upserts/deletes don't scan the FTS table
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table}_ids (doc_id TEXT PRIMARY KEY, rid INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+
+    def upsert_many(self, rows: Iterable[Tuple[str, Dict[str, str]]]):
+        """rows: (doc_id, {column: text})"""
+        cols = ", ".join(self.columns)
+        marks = ", ".join("?" for _ in self.columns)
+        with self._lock:
+            cur = self._conn.cursor()
+            for doc_id, values in rows:
+                self._delete_locked(cur, doc_id)
+                cur.execute(
+                    f"INSERT INTO {self.table} (doc_id, {cols}) VALUES (?, {marks})",
+                    (doc_id, *[values.get(c) or "" for c in self.columns]),
+                )
+                cur.execute(f"INSERT INTO {self.table}_ids (doc_id, rid) VALUES (?, ?)", (doc_id, cur.lastrowid))
+            self._conn.commit()
+
+    def _delete_locked(self, cur, doc_id: str):
+        row = cur.execute(f"SELECT rid FROM {self.table}_ids WHERE doc_id = ?", (doc_id,)).fetchone()
+        if row is not None:
+            cur.execute(f"DELETE FROM {self.table} WHERE rowid = ?", (row[0],))
+            cur.execute(f"DELETE FROM {self.table}_ids WHERE doc_id = ?", (doc_id,))
+
+    def upsert(self, doc_id: str, text: str):
+        self.upsert_many([(doc_id, {self.columns[0]: text})])
+
+    def delete(self, doc_id: str):
+        with self._lock:
+            self._delete_locked(self._conn.cursor(), doc_id)
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}_ids").fetchone()[0]
+
+    def search(self, query: str, limit: int = 50, offset: int = 0,
+               weights: Optional[Sequence[float]] = None) -> List[Dict[str, object]]:
+        """
+        Top `limit` rows whose tokens overlap the query, best BM25 first.
+        Each hit: {"doc_id", "rank" (lower is better), <column>: text}.
+        """
+        tokens = tokenize(query)[:MAX_QUERY_TOKENS]
+        if not tokens:
+            return []
+        match = " OR ".join(f'"{t}"' for t in tokens)
+        bm25 = f"bm25({self.table}, 0, {', '.join(str(w) for w in weights)})" if weights else f"bm25({self.table})"
+        cols = ", ".join(self.columns)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT doc_id, {bm25} AS rank, {cols} FROM {self.table} "
+                f"WHERE {self.table} MATCH ? ORDER BY rank LIMIT ? OFFSET ?",
+                (match, limit, offset),
+            ).fetchall()
+        out = []
+        for r in rows:
+            hit = {"doc_id": r[0], "rank": r[1]}
+            hit.update(zip(self.columns, r[2:]))
+            out.append(hit)
+        return out
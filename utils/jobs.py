@@ -0,0 +1,158 @@
+"""
+utils/jobs.py
+
+Bounded background job pool for long-running self-heal workflows.
+- A fixed number of worker threads drain a bounded queue.
+- submit() never blocks: when the queue is full it raises JobQueueFull
+  so the API can answer 429 instead of piling up work.
+- Finished jobs are kept for JOB_RESULT_TTL seconds so clients can poll them.
+- Jobs submitted with stream_events=True get an on_event callback; the events
+  are buffered on the job so SSE clients can replay and follow them.
+
+Config (env):
+  JOB_WORKERS     number of graph workers (default 4)
+  JOB_QUEUE_SIZE  max queued (not yet running) jobs (default 32)
+  JOB_RESULT_TTL  seconds to keep finished jobs around (default 3600)
+"""
+
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "32"))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+
+
+class JobQueueFull(Exception):
+    """Raised by JobManager.submit when the pending queue is at capacity."""
+    pass
+
+
+class Job:
+    """A single unit of work plus its status/result as seen by API clients."""
+
+    def __init__(self, fn: Callable[..., Any], args: tuple, kwargs: dict, stream_events: bool = False):
+        self.id = uuid.uuid4().hex
+        self.fn = fn
+        self.args = args
+        self.kwargs = dict(kwargs, on_event=self.emit) if stream_events else kwargs
+        self.events: List[Dict[str, Any]] = []
+        self.status = "queued"          # queued | running | done | failed
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.done = threading.Event()
+
+    def emit(self, event: Dict[str, Any]):
+        # list.append is atomic; readers only ever slice from an index they've seen
+        self.events.append(event)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    Fixed-size worker pool over a bounded queue.
+    Workers are daemon threads started lazily on first submit().
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, queue_size: int = JOB_QUEUE_SIZE,
+                 result_ttl: int = JOB_RESULT_TTL):
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.result_ttl = result_ttl
+        self._queue: "queue.Queue[Job]" = queue.Queue(maxsize=self.queue_size)
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._threads: list = []
+        self._running = 0
+        self.rejected = 0
+
+    # ---- lifecycle ----------------------------------------------------------
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"selfheal-job-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._running += 1
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                job.result = job.fn(*job.args, **job.kwargs)
+                job.status = "done"
+            except Exception:
+                job.error = traceback.format_exc()
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+                job.done.set()
+                with self._lock:
+                    self._running -= 1
+                self._queue.task_done()
+
+    # ---- API ----------------------------------------------------------------
+    def submit(self, fn: Callable[..., Any], *args, stream_events: bool = False, **kwargs) -> Job:
+        """
+        Queue fn(*args, **kwargs); raises JobQueueFull instead of blocking.
+        With stream_events=True, fn is also passed on_event=job.emit.
+        """
+        self.start()
+        self._evict_finished()
+        job = Job(fn, args, kwargs, stream_events=stream_events)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+                self.rejected += 1
+            raise JobQueueFull(f"job queue full ({self.queue_size} pending)")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "running": self._running,
+                "queued": self._queue.qsize(),
+                "queue_size": self.queue_size,
+                "tracked_jobs": len(self._jobs),
+                "rejected": self.rejected,
+            }
+
+    def _evict_finished(self):
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            stale = [jid for jid, j in self._jobs.items()
+                     if j.finished_at is not None and j.finished_at < cutoff]
+            for jid in stale:
+                del self._jobs[jid]
@@ -1,8 +1,15 @@
 # utils/llm.py
+import heapq
+import itertools
 import os
+import random
+import threading
+import time
+from contextlib import contextmanager
 from dotenv import load_dotenv
 import groq
 from groq import Groq
+from utils.cache import TTLCache, SQLiteCache, TieredCache, make_key
 
 load_dotenv()
 
@@ -13,31 +20,290 @@ if not API_KEY:
 # Use the same model for all agents (from .env), with a safe default
 MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
 
-# Reuse a single client across calls
-_client = Groq(api_key=API_KEY)
+# Reuse a single client across calls. Retries are done by the scheduler below,
+# so the SDK's own retry loop is off. GROQ_BASE_URL points it at a fake/local
+# endpoint for load tests.
+_client = Groq(api_key=API_KEY, base_url=os.getenv("GROQ_BASE_URL") or None, max_retries=0)
+
+# ---- Scheduler ----------------------------------------------------------------
+# One process-wide scheduler shapes all Groq traffic:
+# - token buckets for requests/min and tokens/min (LLM_RPM, LLM_TPM)
+# - at most LLM_MAX_CONCURRENCY requests in flight
+# - waiters are admitted by priority lane, then FIFO: fixes for runs already in
+#   progress go ahead of fresh generations
+# - 429/5xx/connection errors are retried with jittered exponential backoff,
+#   honouring Retry-After, up to LLM_MAX_RETRIES times
+PRIORITY_FIX = 0
+PRIORITY_GENERATE = 1
+
+LLM_RPM = float(os.getenv("LLM_RPM", "30"))
+LLM_TPM = float(os.getenv("LLM_TPM", "6000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+
+class _TokenBucket:
+    """Refills `per_minute` units per minute up to one minute's worth; <= 0 means unlimited."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, n: float) -> float:
+        if self.capacity <= 0:
+            return 0.0
+        self._refill()
+        n = min(n, self.capacity)
+        return 0.0 if self.tokens >= n else (n - self.tokens) / self.rate
+
+    def consume(self, n: float):
+        if self.capacity > 0:
+            self.tokens -= min(n, self.capacity)
+
+    def refund(self, n: float):
+        # correct an estimate once real usage is known (n may be negative)
+        if self.capacity > 0:
+            self.tokens = min(self.capacity, self.tokens + n)
+
+class LLMScheduler:
+    def __init__(self, rpm: float = LLM_RPM, tpm: float = LLM_TPM,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY):
+        self.requests = _TokenBucket(rpm)
+        self.tokens = _TokenBucket(tpm)
+        self.max_concurrency = max(1, max_concurrency)
+        self._cond = threading.Condition()
+        self._waiters: list = []          # heap of (priority, seq)
+        self._seq = itertools.count()
+        self.in_flight = 0
+        self.stats = {"admitted": 0, "retries": 0, "rate_limited": 0, "gave_up": 0, "wait_s": 0.0}
+
+    @contextmanager
+    def slot(self, priority: int, est_tokens: int):
+        """Block until this request may go out; yields the admission wait in seconds."""
+        t0 = time.monotonic()
+        with self._cond:
+            me = (priority, next(self._seq))
+            heapq.heappush(self._waiters, me)
+            try:
+                while True:
+                    if self._waiters[0] == me and self.in_flight < self.max_concurrency:
+                        wait = max(self.requests.wait_time(1), self.tokens.wait_time(est_tokens))
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                heapq.heappop(self._waiters)
+                self.requests.consume(1)
+                self.tokens.consume(est_tokens)
+                self.in_flight += 1
+                self.stats["admitted"] += 1
+                self.stats["wait_s"] += time.monotonic() - t0
+            except BaseException:
+                self._waiters.remove(me)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+                raise
+            # the next head may be admissible right away
+            self._cond.notify_all()
+        try:
+            yield time.monotonic() - t0
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def count(self, name: str):
+        with self._cond:
+            self.stats[name] += 1
+
+    def record_usage(self, est_tokens: int, used_tokens: int | None):
+        if used_tokens is None:
+            return
+        with self._cond:
+            self.tokens.refund(est_tokens - used_tokens)
+            self._cond.notify_all()
+
+    def penalize(self, delay: float):
+        """After a 429, drain the request bucket so nobody else fires before `delay`."""
+        with self._cond:
+            b = self.requests
+            if b.capacity > 0:
+                b._refill()
+                b.tokens = min(b.tokens, 1 - delay * b.rate)
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {**self.stats, "in_flight": self.in_flight, "waiting": len(self._waiters),
+                    "max_concurrency": self.max_concurrency}
+
+scheduler = LLMScheduler()
+
+def _estimate_tokens(messages, max_tokens: int) -> int:
+    # ~4 chars per token for the prompt, plus the completion budget
+    return sum(len(m.get("content") or "") for m in messages) // 4 + int(max_tokens)
+
+def _retry_after(err: Exception) -> float | None:
+    resp = getattr(err, "response", None)
+    headers = getattr(resp, "headers", None) or {}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        val = headers.get(name)
+        if val:
+            try:
+                return float(val) * scale
+            except ValueError:
+                pass
+    return None
+
+def _backoff(attempt: int, err: Exception) -> float:
+    hinted = _retry_after(err)
+    if hinted is not None:
+        return min(hinted, LLM_BACKOFF_MAX) + random.uniform(0, 0.25)
+    # full jitter
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+
+_RETRYABLE = (groq.RateLimitError, groq.APIConnectionError, groq.InternalServerError)
+
+# ---- Response cache ----------------------------------------------------------
+# Identical (model, messages, max_tokens, temperature) requests are answered from
+# an in-memory LRU backed by a SQLite file, so resubmitted prompts and repeated
+# errors skip the Groq round trip. LLM_CACHE=0 turns it off, LLM_CACHE_PATH=""
+# keeps it memory-only.
+LLM_CACHE = os.getenv("LLM_CACHE", "1") == "1"
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(os.getcwd(), "data", "llm_cache.sqlite3"))
+
+_cache = TieredCache(
+    TTLCache(max_entries=int(os.getenv("LLM_CACHE_MEM_ENTRIES", "256")), ttl=LLM_CACHE_TTL),
+    SQLiteCache(LLM_CACHE_PATH, max_entries=int(os.getenv("LLM_CACHE_DISK_ENTRIES", "5000")),
+                ttl=LLM_CACHE_TTL, table="llm_responses") if LLM_CACHE and LLM_CACHE_PATH else None,
+)
+
+def _cache_key(messages, max_tokens: int, temperature: float) -> str:
+    normalized = [{"role": m.get("role"), "content": (m.get("content") or "").strip()} for m in messages]
+    return make_key(MODEL, normalized, int(max_tokens), round(float(temperature), 3))
+
+def cache_stats() -> dict:
+    return {"enabled": LLM_CACHE, **_cache.stats()}
 
 class ChatRateLimited(Exception):
     """Raised when Groq returns HTTP 429 (rate limit)."""
     pass
 
-def chat(messages, max_tokens: int = 1200, temperature: float = 0.2) -> str:
+def chat(messages, max_tokens: int = 1200, temperature: float = 0.2, use_cache: bool = True,
+         priority: int = PRIORITY_GENERATE) -> str:
     """
     messages = [{"role": "system"|"user"|"assistant", "content": "..."}]
     Uses the single model defined by GROQ_MODEL for all agents.
-    Raises ChatRateLimited on 429 so agents can exit gracefully.
+    Calls go through the shared scheduler (rate limits, concurrency cap, retries);
+    raises ChatRateLimited only once 429s persist after LLM_MAX_RETRIES retries.
+    use_cache=False bypasses the response cache for this call (no read, no write).
+    priority: PRIORITY_FIX for repairs of in-flight runs, PRIORITY_GENERATE otherwise.
     """
-    try:
-        resp = _client.chat.completions.create(
-            model=MODEL,
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temperature,
-        )
-        content = (resp.choices[0].message.content or "").strip()
-        return _strip_code_fences(content)
-    except groq.RateLimitError as e:
-        # Let agents catch this and force 'giveup' to avoid loops
-        raise ChatRateLimited(str(e))
+    key = None
+    if LLM_CACHE and use_cache:
+        key = _cache_key(messages, max_tokens, temperature)
+        cached = _cache.get(key)
+        if cached is not None:
+            return cached
+    est = _estimate_tokens(messages, max_tokens)
+    attempt = 0
+    while True:
+        try:
+            with scheduler.slot(priority, est):
+                resp = _client.chat.completions.create(
+                    model=MODEL,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                )
+            usage = getattr(resp, "usage", None)
+            scheduler.record_usage(est, getattr(usage, "total_tokens", None))
+            break
+        except _RETRYABLE as e:
+            _wait_before_retry(e, attempt)
+            attempt += 1
+
+    content = _strip_code_fences((resp.choices[0].message.content or "").strip())
+    if key is not None and content:
+        _cache.set(key, content)
+    return content
+
+def chat_stream(messages, max_tokens: int = 1200, temperature: float = 0.2, use_cache: bool = True,
+                priority: int = PRIORITY_GENERATE):
+    """
+    Streaming twin of chat(): yields raw text deltas as Groq produces them
+    (fences are NOT stripped). Closing the generator early cancels the request
+    and frees its scheduler slot. Only complete responses are cached; a cache
+    hit is yielded as a single chunk.
+    """
+    key = None
+    if LLM_CACHE and use_cache:
+        key = _cache_key(messages, max_tokens, temperature)
+        cached = _cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    est = _estimate_tokens(messages, max_tokens)
+    attempt = 0
+    parts: list = []
+    while True:
+        try:
+            with scheduler.slot(priority, est):
+                stream = _client.chat.completions.create(
+                    model=MODEL,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    stream=True,
+                )
+                try:
+                    for chunk in stream:
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            parts.append(delta)
+                            yield delta
+                finally:
+                    # drop the HTTP response so Groq stops generating
+                    closer = getattr(stream, "close", None) or getattr(getattr(stream, "response", None), "close", None)
+                    if closer:
+                        closer()
+            break
+        except _RETRYABLE as e:
+            if parts:
+                raise  # already handed text to the caller; can't transparently retry
+            _wait_before_retry(e, attempt)
+            attempt += 1
+
+    content = _strip_code_fences("".join(parts).strip())
+    if key is not None and content:
+        _cache.set(key, content)
+
+def _wait_before_retry(err: Exception, attempt: int):
+    """Sleep before retry #attempt+1, or raise once LLM_MAX_RETRIES is exhausted."""
+    is_429 = isinstance(err, groq.RateLimitError)
+    if is_429:
+        scheduler.count("rate_limited")
+    if attempt >= LLM_MAX_RETRIES:
+        scheduler.count("gave_up")
+        if is_429:
+            # Let agents catch this and force 'giveup' to avoid loops
+            raise ChatRateLimited(str(err))
+        raise err
+    delay = _backoff(attempt, err)
+    if is_429:
+        scheduler.penalize(delay)
+    scheduler.count("retries")
+    time.sleep(delay)
 
 def _strip_code_fences(text: str) -> str:
     t = (text or "").strip()
@@ -1,52 +1,333 @@
 # utils/mcp_client.py
-import requests
+import asyncio
+import os
+import random
+import threading
+import time
 from urllib.parse import urljoin
 
+import httpx
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+# Default local ports of the MCP microservers started by app.start_mcp_servers()
+MCP_PORTS = {
+    "sandbox": 8001,
+    "tester": 8002,
+    "stackoverflow": 8003,
+    "docs": 8004,
+    "chroma": 8005,
+}
+
+# "http": one uvicorn process per server (app.start_mcp_servers); "local": the
+# servers are imported into this process and called directly (utils/mcp_local.py)
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "http").lower()
+
+def mcp_url(service: str) -> str:
+    """Base URL of an MCP service; override per service with e.g. SANDBOX_URL=http://host:port."""
+    default = f"local://{service}" if MCP_TRANSPORT == "local" else f"http://127.0.0.1:{MCP_PORTS[service]}"
+    return os.getenv(f"{service.upper()}_URL", default)
+
+# ---- Transport policy --------------------------------------------------------
+# - one keep-alive connection pool per server, shared by every client of it
+#   (MCP_POOL_SIZE connections), instead of a new TCP connection per call
+# - read timeout per endpoint (MCP_TIMEOUTS="/pytest=120,/search=10" overrides
+#   the table below); connects fail fast after MCP_CONNECT_TIMEOUT
+# - retries with jittered backoff, up to MCP_RETRIES: a refused connection or a
+#   429 "busy" answer is retried for any call (the server never ran it),
+#   timeouts, resets and 502/503/504 only for idempotent calls (GET + read-only POSTs)
+# - circuit breaker per server: after MCP_BREAKER_FAILURES failed connects in
+#   a row (a dead server; slow answers don't count), calls fail immediately for MCP_BREAKER_COOLDOWN s, then one
+#   trial call decides whether it closes again
+# - latency histogram per server + endpoint, see client_stats()
+MCP_TIMEOUT = float(os.getenv("MCP_TIMEOUT", "30"))
+MCP_CONNECT_TIMEOUT = float(os.getenv("MCP_CONNECT_TIMEOUT", "2"))
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "16"))
+MCP_RETRIES = int(os.getenv("MCP_RETRIES", "2"))
+MCP_BACKOFF_BASE = float(os.getenv("MCP_BACKOFF_BASE", "0.1"))
+MCP_BACKOFF_MAX = float(os.getenv("MCP_BACKOFF_MAX", "2"))
+MCP_BREAKER_FAILURES = int(os.getenv("MCP_BREAKER_FAILURES", "5"))
+MCP_BREAKER_COOLDOWN = float(os.getenv("MCP_BREAKER_COOLDOWN", "10"))
+
+# read timeouts: long enough for the server's own limits plus its queue
+ENDPOINT_TIMEOUTS = {
+    "/run": 95.0,        # SANDBOX_MAX_TIMEOUT + SANDBOX_QUEUE_TIMEOUT
+    "/pytest": 120.0,    # failed-first + full suite
+    "/search": 15.0,
+    "/pkg_info": 15.0,
+    "/pkg_info_batch": 30.0,
+    "/symbol": 5.0,
+    "/module": 5.0,
+    "/suggest": 5.0,
+    "/query": 10.0,
+    "/store": 30.0,
+    "/store_batch": 30.0,
+    "/health": 5.0,
+}
+for _item in os.getenv("MCP_TIMEOUTS", "").split(","):
+    if "=" in _item:
+        _path, _secs = _item.split("=", 1)
+        ENDPOINT_TIMEOUTS["/" + _path.strip().lstrip("/")] = float(_secs)
+
+# POSTs that only read, so a timed-out attempt can safely be sent again
+IDEMPOTENT_POSTS = {"/search", "/pkg_info", "/pkg_info_batch", "/symbol", "/module", "/suggest", "/query"}
+# "busy, try later": the request was not executed
+_BUSY = (429,)
+_RETRY_IF_IDEMPOTENT = (502, 503, 504)
+
+_LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class _Breaker:
+    def __init__(self):
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial = False
+        self.trips = 0
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.failures < MCP_BREAKER_FAILURES:
+                return True
+            if time.monotonic() - self.opened_at < MCP_BREAKER_COOLDOWN or self.trial:
+                return False
+            self.trial = True   # half-open: let one call through
+            return True
+
+    def record(self, ok: bool):
+        with self.lock:
+            self.trial = False
+            if ok:
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.failures >= MCP_BREAKER_FAILURES:
+                if self.failures == MCP_BREAKER_FAILURES:
+                    self.trips += 1
+                self.opened_at = time.monotonic()
+
+    def state(self) -> str:
+        if self.failures < MCP_BREAKER_FAILURES:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= MCP_BREAKER_COOLDOWN else "open"
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(_LATENCY_BUCKETS_MS) + 1)
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.short_circuited = 0   # refused by an open breaker, not sent
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float, ok: bool):
+        i = next((i for i, b in enumerate(_LATENCY_BUCKETS_MS) if ms <= b), len(_LATENCY_BUCKETS_MS))
+        self.counts[i] += 1
+        self.calls += 1
+        self.errors += 0 if ok else 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q: float) -> float | None:
+        # upper bound of the bucket holding the q-th call
+        if not self.calls:
+            return None
+        rank, seen = q * self.calls, 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return float(_LATENCY_BUCKETS_MS[i]) if i < len(_LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self) -> dict:
+        labels = [f"<={b}ms" for b in _LATENCY_BUCKETS_MS] + [f">{_LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            "calls": self.calls, "errors": self.errors, "retries": self.retries,
+            "short_circuited": self.short_circuited,
+            "avg_ms": round(self.total_ms / self.calls, 3) if self.calls else None,
+            "p50_ms": self.quantile(0.5), "p95_ms": self.quantile(0.95), "p99_ms": self.quantile(0.99),
+            "max_ms": round(self.max_ms, 3),
+            "buckets": {l: c for l, c in zip(labels, self.counts) if c},
+        }
+
+
+# shared by all clients (sync and async) of the same server
+_sessions: dict = {}
+_breakers: dict = {}
+_histograms: dict = {}
+_registry_lock = threading.Lock()
+
+def _session(base_url: str) -> requests.Session:
+    with _registry_lock:
+        s = _sessions.get(base_url)
+        if s is None:
+            s = requests.Session()
+            s.trust_env = False   # local servers: no proxy lookups per call
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MCP_POOL_SIZE)
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            _sessions[base_url] = s
+        return s
+
+def _breaker(base_url: str) -> _Breaker:
+    with _registry_lock:
+        return _breakers.setdefault(base_url, _Breaker())
+
+def _histogram(base_url: str, endpoint: str) -> _Histogram:
+    with _registry_lock:
+        return _histograms.setdefault((base_url, endpoint), _Histogram())
+
+def client_stats() -> dict:
+    """Per-server breaker state and per-endpoint latency histograms."""
+    with _registry_lock:
+        hists = list(_histograms.items())
+        breakers = dict(_breakers)
+    out = {}
+    for base, br in breakers.items():
+        out[base] = {"breaker": br.state(), "consecutive_failures": br.failures, "trips": br.trips, "endpoints": {}}
+    for (base, endpoint), h in hists:
+        out.setdefault(base, {"endpoints": {}})["endpoints"][endpoint] = h.snapshot()
+    return out
+
+def close_clients():
+    with _registry_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for s in sessions:
+        s.close()
+
+
+def _never_sent(err: Exception) -> bool:
+    """True if a requests ConnectionError happened before the request went out."""
+    if isinstance(err, requests.ConnectTimeout):
+        return True
+    seen = set()
+    while err is not None and id(err) not in seen:
+        seen.add(id(err))
+        if isinstance(err, urllib3.exceptions.NewConnectionError):
+            return True
+        err = getattr(err, "reason", None) or (err.args[0] if err.args and isinstance(err.args[0], Exception) else None)
+    return False
+
+def _backoff(attempt: int, retry_after: str | None) -> float:
+    try:
+        if retry_after:
+            return min(float(retry_after), MCP_BACKOFF_MAX)
+    except ValueError:
+        pass
+    return random.uniform(0, min(MCP_BACKOFF_MAX, MCP_BACKOFF_BASE * (2 ** attempt)))
+
+def _ok(out) -> bool:
+    # the tester answers {"error": None, ...} on success
+    return not (isinstance(out, dict) and out.get("error"))
+
+
 class MCPClient:
     """
     Minimal HTTP client for our MCP microservers.
     - Provides .get(), .post(), and .request()
     - Keeps .call(endpoint, payload) for backward compatibility (aliases .post()).
+    - Errors come back as {"error": ...} dicts, never as exceptions.
+
+    timeout: read timeout for every endpoint (default: ENDPOINT_TIMEOUTS, then
+    MCP_TIMEOUT); timeouts: per-endpoint overrides, e.g. {"/query": 1.5}.
+    A "local://<service>" base URL calls the server in-process instead.
     """
-    def __init__(self, base_url: str, timeout: int = 30):
+    def __init__(self, base_url: str, timeout: float | None = None, timeouts: dict | None = None,
+                 retries: int = MCP_RETRIES):
         # ensure a trailing slash so urljoin works reliably
         self.base_url = base_url.rstrip("/") + "/"
         self.timeout = timeout
+        self.timeouts = {"/" + k.lstrip("/"): v for k, v in (timeouts or {}).items()}
+        self.retries = retries
+        self.breaker = _breaker(self.base_url)
+        self.local = None
+        if self.base_url.startswith("local://"):
+            from utils.mcp_local import local_server
+            self.local = local_server(self.base_url[len("local://"):].strip("/"))
 
     def _url(self, path: str) -> str:
         # accept "/pytest" or "pytest"
         return urljoin(self.base_url, path.lstrip("/"))
 
-    def request(self, method: str, path: str, json: dict | None = None):
-        url = self._url(path)
-        try:
-            resp = requests.request(method.upper(), url, json=json, timeout=self.timeout)
-            resp.raise_for_status()
-            try:
-                return resp.json()
-            except Exception:
-                return {"raw": resp.text, "status_code": resp.status_code}
-        except requests.HTTPError as e:
+    def _endpoint(self, path: str) -> str:
+        return "/" + path.lstrip("/").split("?")[0]
+
+    def _timeout(self, endpoint: str) -> float:
+        if endpoint in self.timeouts:
+            return self.timeouts[endpoint]
+        if self.timeout is not None:
+            return self.timeout
+        return ENDPOINT_TIMEOUTS.get(endpoint, MCP_TIMEOUT)
+
+    def _idempotent(self, method: str, endpoint: str) -> bool:
+        return method in ("GET", "HEAD") or endpoint in IDEMPOTENT_POSTS
+
+    @staticmethod
+    def _result(url: str, status: int, reason: str, text: str, parse_json) -> dict:
+        if status >= 400:
             # include server response body for easier debugging
-            body = getattr(e.response, "text", "")
-            return {"error": str(e), "status_code": e.response.status_code if e.response else None, "body": body}
-        except Exception as e:
-            return {"error": str(e)}
+            kind = "Client" if status < 500 else "Server"
+            return {"error": f"{status} {kind} Error: {reason} for url: {url}", "status_code": status, "body": text}
+        try:
+            return parse_json()
+        except Exception:
+            return {"raw": text, "status_code": status}
 
-    def get(self, path: str, params: dict | None = None):
+    def _retry_status(self, status: int, idempotent: bool) -> bool:
+        return status in _BUSY or (idempotent and status in _RETRY_IF_IDEMPOTENT)
+
+    def _open(self, endpoint: str) -> dict:
+        _histogram(self.base_url, endpoint).short_circuited += 1
+        return {"error": f"circuit open: {self.base_url} failed {self.breaker.failures} times in a row",
+                "circuit_open": True}
+
+    def request(self, method: str, path: str, json: dict | None = None, params: dict | None = None,
+                timeout: float | None = None):
+        method = method.upper()
+        endpoint = self._endpoint(path)
+        read_timeout = timeout if timeout is not None else self._timeout(endpoint)
+        if self.local is not None:
+            t0 = time.perf_counter()
+            out = self.local.call(method, endpoint, json, params, read_timeout)
+            _histogram(self.base_url, endpoint).observe((time.perf_counter() - t0) * 1000, _ok(out))
+            return out
+        if not self.breaker.allow():
+            return self._open(endpoint)
         url = self._url(path)
-        try:
-            resp = requests.get(url, params=params, timeout=self.timeout)
-            resp.raise_for_status()
+        hist = _histogram(self.base_url, endpoint)
+        idempotent = self._idempotent(method, endpoint)
+        for attempt in range(self.retries + 1):
+            t0 = time.perf_counter()
+            retry_after = None
             try:
-                return resp.json()
-            except Exception:
-                return {"raw": resp.text, "status_code": resp.status_code}
-        except requests.HTTPError as e:
-            body = getattr(e.response, "text", "")
-            return {"error": str(e), "status_code": e.response.status_code if e.response else None, "body": body}
-        except Exception as e:
-            return {"error": str(e)}
+                resp = _session(self.base_url).request(method, url, json=json, params=params,
+                                                       timeout=(MCP_CONNECT_TIMEOUT, read_timeout))
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # refused/unreachable: nothing was sent; a timeout or reset after sending only if idempotent
+                connected = not _never_sent(e)
+                out, retry, transport_ok = {"error": str(e)}, not connected or idempotent, connected
+            except Exception as e:
+                out, retry, transport_ok = {"error": str(e)}, False, True
+            else:
+                transport_ok = True
+                out = self._result(url, resp.status_code, resp.reason, resp.text, resp.json)
+                retry = self._retry_status(resp.status_code, idempotent)
+                retry_after = resp.headers.get("Retry-After")
+            hist.observe((time.perf_counter() - t0) * 1000, _ok(out))
+            self.breaker.record(transport_ok)
+            if not retry or attempt >= self.retries or not self.breaker.allow():
+                return out
+            hist.retries += 1
+            time.sleep(_backoff(attempt, retry_after))
+        return out
+
+    def get(self, path: str, params: dict | None = None):
+        return self.request("GET", path, params=params)
 
     def post(self, path: str, json: dict | None = None):
         return self.request("POST", path, json=json)
@@ -55,4 +336,80 @@ class MCPClient:
     def call(self, endpoint: str, payload: dict):
         """Alias for .post(endpoint, json=payload)."""
         return self.post(endpoint, payload)
-# ---------------------------------------------------
\ No newline at end of file
+
+
+class AsyncMCPClient(MCPClient):
+    """
+    asyncio twin of MCPClient (httpx.AsyncClient) for use inside the FastAPI
+    app: same arguments, timeouts, retries, breaker and histograms; the methods
+    are coroutines. The underlying client is bound to the loop it was first
+    used on; call `await aclose()` when done.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._client: httpx.AsyncClient | None = None
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                trust_env=False,
+                limits=httpx.Limits(max_connections=MCP_POOL_SIZE, max_keepalive_connections=MCP_POOL_SIZE),
+            )
+        return self._client
+
+    async def request(self, method: str, path: str, json: dict | None = None, params: dict | None = None,
+                      timeout: float | None = None):
+        method = method.upper()
+        endpoint = self._endpoint(path)
+        read_timeout = timeout if timeout is not None else self._timeout(endpoint)
+        if self.local is not None:
+            t0 = time.perf_counter()
+            out = await self.local.acall(method, endpoint, json, params, read_timeout)
+            _histogram(self.base_url, endpoint).observe((time.perf_counter() - t0) * 1000, _ok(out))
+            return out
+        if not self.breaker.allow():
+            return self._open(endpoint)
+        url = self._url(path)
+        hist = _histogram(self.base_url, endpoint)
+        idempotent = self._idempotent(method, endpoint)
+        for attempt in range(self.retries + 1):
+            t0 = time.perf_counter()
+            retry_after = None
+            try:
+                resp = await self._http().request(method, url, json=json, params=params,
+                                                  timeout=httpx.Timeout(read_timeout, connect=MCP_CONNECT_TIMEOUT))
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                out, retry, transport_ok = {"error": str(e) or "connection failed"}, True, False
+            except httpx.PoolTimeout as e:
+                out, retry, transport_ok = {"error": str(e) or "connection pool timed out"}, True, True
+            except httpx.TransportError as e:
+                # timed out or dropped after sending: the server may have run it
+                out, retry, transport_ok = {"error": str(e) or type(e).__name__}, idempotent, True
+            except Exception as e:
+                out, retry, transport_ok = {"error": str(e)}, False, True
+            else:
+                transport_ok = True
+                out = self._result(url, resp.status_code, resp.reason_phrase, resp.text, resp.json)
+                retry = self._retry_status(resp.status_code, idempotent)
+                retry_after = resp.headers.get("Retry-After")
+            hist.observe((time.perf_counter() - t0) * 1000, _ok(out))
+            self.breaker.record(transport_ok)
+            if not retry or attempt >= self.retries or not self.breaker.allow():
+                return out
+            hist.retries += 1
+            await asyncio.sleep(_backoff(attempt, retry_after))
+        return out
+
+    async def get(self, path: str, params: dict | None = None):
+        return await self.request("GET", path, params=params)
+
+    async def post(self, path: str, json: dict | None = None):
+        return await self.request("POST", path, json=json)
+
+    async def call(self, endpoint: str, payload: dict):
+        return await self.post(endpoint, payload)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,195 @@
+"""
+utils/mcp_local.py
+
+In-process transport for the MCP servers (MCP_TRANSPORT=local, or a
+"local://<service>" URL for a single service): the server module is imported
+into this process and MCPClient calls go straight to its route handlers, with
+no socket, uvicorn or JSON round trip.
+
+- Routes are matched like Starlette does (path parameters included). Bodies
+  are validated with the handler's pydantic model, as FastAPI would; `dict`
+  parameters get the payload itself and query params go by name.
+- Responses are the handler's own dicts. JSONResponses (status codes) are
+  decoded, and errors come back in the same {error, status_code, body} shape
+  as the HTTP client.
+- Async handlers run on one background event loop. The servers' startup
+  hooks also run on it, so loop-bound state lives there. Sync handlers run in
+  the calling thread.
+- A server is imported and started on first use (or by start_local_servers)
+  and shut down at exit.
+"""
+
+import asyncio
+import atexit
+import concurrent.futures
+import importlib
+import inspect
+import json as _json
+import threading
+from http import HTTPStatus
+from typing import Any, Dict, List, Optional
+
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, ValidationError
+from starlette.responses import Response
+
+# service -> server module, as started by app.start_mcp_servers()
+MCP_MODULES = {
+    "sandbox": "mcp_servers.sandbox_server",
+    "tester": "mcp_servers.tester_server",
+    "stackoverflow": "mcp_servers.stackoverflow_server",
+    "docs": "mcp_servers.docs_server",
+    "chroma": "mcp_servers.chroma_server",
+}
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="mcp-local", daemon=True).start()
+        return _loop
+
+
+def _submit(coro) -> concurrent.futures.Future:
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop())
+
+
+def _error(url: str, status: int, body: str = "") -> Dict[str, Any]:
+    kind = "Client" if status < 500 else "Server"
+    return {"error": f"{status} {kind} Error: {HTTPStatus(status).phrase} for url: {url}",
+            "status_code": status, "body": body}
+
+
+def _response(url: str, res: Any) -> Dict[str, Any]:
+    if isinstance(res, Response):
+        text = bytes(res.body).decode("utf-8", "replace")
+        if res.status_code >= 400:
+            return _error(url, res.status_code, text)
+        try:
+            return _json.loads(text)
+        except ValueError:
+            return {"raw": text, "status_code": res.status_code}
+    if isinstance(res, BaseModel):
+        return res.model_dump()
+    return res
+
+
+class LocalServer:
+    def __init__(self, name: str):
+        self.name = name
+        self.module = MCP_MODULES[name]
+        self.app = None
+        self.routes: List[APIRoute] = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.app is not None:
+                return self.app
+            app = importlib.import_module(self.module).app
+            self.routes = [r for r in app.routes if isinstance(r, APIRoute)]
+            for hook in app.router.on_startup:
+                _submit(hook()).result() if inspect.iscoroutinefunction(hook) else hook()
+            self.app = app
+            atexit.register(self.stop)
+            return app
+
+    def stop(self):
+        with self._lock:
+            app, self.app = self.app, None
+        if app is None:
+            return
+        for hook in app.router.on_shutdown:
+            try:
+                _submit(hook()).result(10) if inspect.iscoroutinefunction(hook) else hook()
+            except Exception as e:
+                print(f"[SHUTDOWN] local {self.name}: {e}")
+
+    def _prepare(self, method: str, path: str, json: Optional[dict], params: Optional[dict]):
+        """(url, handler, kwargs, None), or (url, None, None, error dict)."""
+        self.start()
+        url = f"local://{self.name}{path}"
+        matches = [(r, m) for r in self.routes for m in [r.path_regex.match(path)] if m]
+        route, match = next(((r, m) for r, m in matches if method in r.methods), (None, None))
+        if route is None:
+            return url, None, None, _error(url, 405 if matches else 404)
+        fn = route.endpoint
+        kwargs = {k: route.param_convertors[k].convert(v) for k, v in match.groupdict().items()}
+        try:
+            for name, p in inspect.signature(fn, eval_str=True).parameters.items():
+                ann = p.annotation
+                if isinstance(ann, type) and issubclass(ann, BaseModel):
+                    kwargs[name] = ann(**(json or {}))
+                elif ann is dict:
+                    kwargs[name] = json if json is not None else {}
+                elif name in kwargs:
+                    continue
+                elif params and name in params:
+                    kwargs[name] = params[name]
+        except ValidationError as e:
+            return url, None, None, _error(url, 422, '{"detail": %s}' % e.json())
+        return url, fn, kwargs, None
+
+    def call(self, method: str, path: str, json: Optional[dict] = None, params: Optional[dict] = None,
+             timeout: Optional[float] = None) -> Dict[str, Any]:
+        url, fn, kwargs, err = self._prepare(method, path, json, params)
+        if err is not None:
+            return err
+        try:
+            if inspect.iscoroutinefunction(fn):
+                fut = _submit(fn(**kwargs))
+                try:
+                    res = fut.result(timeout)
+                except concurrent.futures.TimeoutError:
+                    fut.cancel()
+                    return {"error": f"local call to {url} timed out after {timeout}s"}
+            else:
+                res = fn(**kwargs)
+        except Exception as e:
+            return _error(url, 500, str(e))
+        return _response(url, res)
+
+    async def acall(self, method: str, path: str, json: Optional[dict] = None, params: Optional[dict] = None,
+                    timeout: Optional[float] = None) -> Dict[str, Any]:
+        # first use imports the server module; keep that off the caller's loop
+        url, fn, kwargs, err = await asyncio.to_thread(self._prepare, method, path, json, params)
+        if err is not None:
+            return err
+        try:
+            if inspect.iscoroutinefunction(fn):
+                res = await asyncio.wait_for(asyncio.wrap_future(_submit(fn(**kwargs))), timeout)
+            else:
+                res = await asyncio.to_thread(fn, **kwargs)
+        except asyncio.TimeoutError:
+            return {"error": f"local call to {url} timed out after {timeout}s"}
+        except Exception as e:
+            return _error(url, 500, str(e))
+        return _response(url, res)
+
+
+_servers: Dict[str, LocalServer] = {}
+_servers_lock = threading.Lock()
+
+
+def local_server(name: str) -> LocalServer:
+    if name not in MCP_MODULES:
+        raise ValueError(f"unknown MCP service for local transport: {name!r}")
+    with _servers_lock:
+        if name not in _servers:
+            _servers[name] = LocalServer(name)
+        return _servers[name]
+
+
+def start_local_servers(names=None):
+    """Import and start the given (default: all) servers up front."""
+    for name in names or MCP_MODULES:
+        try:
+            local_server(name).start()
+            print(f"[BOOT] Loaded {MCP_MODULES[name]} in-process")
+        except Exception as e:
+            print(f"[BOOT] Failed to load {MCP_MODULES[name]} in-process: {e}")
@@ -0,0 +1,265 @@
+"""
+utils/output_capture.py
+
+Bounded capture of a child's stdout/stderr. Pipes are read as the child writes
+and only the first and last bytes of each stream are kept, so a program that
+prints in a loop costs at most `cap` bytes per stream in the server, its
+response and everything downstream (analyzer state, debug, memory records).
+
+- BoundedCapture: head + tail ring buffer (OUTPUT_HEAD_RATIO of the cap is
+  head), total byte count, truncation flag, optional spool file.
+- pump(): select loop over raw pipe fds, used by the zygote; run_capped():
+  subprocess.run() with bounded capture, used by the subprocess fallbacks;
+  read_stream(): the same for asyncio subprocesses.
+- Spooled artifacts: with "spool_output": true, the full streams are also
+  written to OUTPUT_ARTIFACT_DIR (capped at OUTPUT_SPOOL_MAX bytes each) and
+  can be fetched by id until OUTPUT_ARTIFACT_TTL expires.
+
+Env: SANDBOX_OUTPUT_CAP (bytes kept per stream), SANDBOX_OUTPUT_KILL (1 =
+kill the run once a stream passes the cap), OUTPUT_HEAD_RATIO,
+OUTPUT_SPOOL_MAX, OUTPUT_ARTIFACT_DIR, OUTPUT_ARTIFACT_TTL
+"""
+
+import os
+import re
+import select
+import signal
+import subprocess
+import tempfile
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+OUTPUT_CAP = int(os.getenv("SANDBOX_OUTPUT_CAP", str(64 * 1024)))
+OUTPUT_KILL = os.getenv("SANDBOX_OUTPUT_KILL", "0") == "1"
+OUTPUT_HEAD_RATIO = float(os.getenv("OUTPUT_HEAD_RATIO", "0.25"))
+OUTPUT_SPOOL_MAX = int(os.getenv("OUTPUT_SPOOL_MAX", str(64 * 1024 * 1024)))
+OUTPUT_ARTIFACT_DIR = os.getenv("OUTPUT_ARTIFACT_DIR") or os.path.join(tempfile.gettempdir(), "mcp_artifacts")
+OUTPUT_ARTIFACT_TTL = float(os.getenv("OUTPUT_ARTIFACT_TTL", "900"))
+
+CHUNK = 64 * 1024
+# after the child exits, how long to keep reading pipes that stray grandchildren hold open
+EXIT_GRACE = 1.0
+_ARTIFACT_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class BoundedCapture:
+    def __init__(self, cap: int = OUTPUT_CAP, spool_path: Optional[str] = None, spool_max: int = OUTPUT_SPOOL_MAX):
+        cap = max(0, int(cap))
+        self.head_cap = int(cap * OUTPUT_HEAD_RATIO)
+        self.tail_cap = cap - self.head_cap
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+        self.spool_max = spool_max
+        self.spooled = 0
+        self.spool = open(spool_path, "wb") if spool_path else None
+
+    def feed(self, data: bytes):
+        self.total += len(data)
+        if self.spool is not None and self.spooled < self.spool_max:
+            part = data[:self.spool_max - self.spooled]
+            self.spool.write(part)
+            self.spooled += len(part)
+        room = self.head_cap - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data and self.tail_cap:
+            self.tail += data[-self.tail_cap:]
+            if len(self.tail) > self.tail_cap:
+                del self.tail[:len(self.tail) - self.tail_cap]
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > len(self.head) + len(self.tail)
+
+    def over(self, limit: int) -> bool:
+        return limit > 0 and self.total > limit
+
+    def text(self) -> str:
+        if not self.truncated:
+            return (bytes(self.head) + bytes(self.tail)).decode("utf-8", errors="replace")
+        omitted = self.total - len(self.head) - len(self.tail)
+        return (self.head.decode("utf-8", errors="replace")
+                + f"\n... [{omitted} bytes of output omitted] ...\n"
+                + self.tail.decode("utf-8", errors="replace"))
+
+    def close(self):
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+
+
+def new_captures(job: Dict[str, Any]) -> Dict[str, BoundedCapture]:
+    """stdout/stderr captures for a job ("output_cap", "spool_output")."""
+    cap = int(job.get("output_cap") or OUTPUT_CAP)
+    artifact = job.get("_artifact_id")
+    if job.get("spool_output") and not artifact:
+        artifact = job["_artifact_id"] = uuid.uuid4().hex
+        os.makedirs(OUTPUT_ARTIFACT_DIR, exist_ok=True)
+        sweep_artifacts()
+    return {name: BoundedCapture(cap, artifact_path(artifact, name) if artifact else None)
+            for name in ("stdout", "stderr")}
+
+
+def kill_limit(job: Dict[str, Any]) -> int:
+    """Bytes per stream after which the run is killed (0 = never)."""
+    kill = job.get("kill_on_output_cap")
+    if kill if kill is not None else OUTPUT_KILL:
+        return int(job.get("output_cap") or OUTPUT_CAP)
+    return 0
+
+
+def finish(res: Dict[str, Any], caps: Dict[str, BoundedCapture], job: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill stdout/stderr, byte counts, truncation flag and artifact ids into `res`."""
+    for name, c in caps.items():
+        c.close()
+        res[name] = c.text()
+        res[f"{name}_bytes"] = c.total
+    res["truncated"] = any(c.truncated for c in caps.values())
+    if job.get("_artifact_id"):
+        res["artifact"] = job["_artifact_id"]
+    return res
+
+
+def outcome(returncode: int, reason: str, caps: Dict[str, BoundedCapture], job: Dict[str, Any]) -> Dict[str, Any]:
+    """Result dict for a run that ended with pump()'s `reason`."""
+    res = finish({"returncode": returncode, "timed_out": reason == "timeout"}, caps, job)
+    if reason == "timeout":
+        res["stderr"] += "TIMEOUT"
+        res["returncode"] = 124
+    elif reason == "overflow":
+        res["output_killed"] = True
+        res["stderr"] += "\nOUTPUT LIMIT EXCEEDED"
+    return res
+
+
+def pump(fds: Dict[int, BoundedCapture], deadline: float, exited: Callable[[], bool],
+         kill: Callable[[], None], limit: int = 0, wake_fd: Optional[int] = None) -> str:
+    """
+    Read the pipes in `fds` into their captures until EOF on all of them.
+    exited() polls the child (wake_fd, e.g. a pidfd, makes select notice its
+    exit); once it's gone kill() clears stray grandchildren and the pipes get
+    EXIT_GRACE more seconds. Returns "eof", "timeout" or "overflow" (a stream
+    passed `limit`; kill() has been called).
+    """
+    open_fds = set(fds)
+    exited_at = None
+    while open_fds:
+        now = time.monotonic()
+        if exited_at is None and exited():
+            exited_at = now
+            kill()
+        end = deadline if exited_at is None else min(deadline, exited_at + EXIT_GRACE)
+        left = end - now
+        if left <= 0:
+            return "eof" if exited_at is not None else "timeout"
+        watch = list(open_fds)
+        if exited_at is None and wake_fd is not None:
+            watch.append(wake_fd)
+        ready, _, _ = select.select(watch, [], [], left if wake_fd is not None or exited_at else min(left, 0.02))
+        for fd in ready:
+            if fd not in open_fds:
+                continue
+            data = os.read(fd, CHUNK)
+            if not data:
+                open_fds.discard(fd)
+                continue
+            fds[fd].feed(data)
+            if fds[fd].over(limit):
+                kill()
+                return "overflow"
+    return "eof"
+
+
+async def read_stream(reader, capture: BoundedCapture, limit: int = 0, on_overflow: Callable[[], None] = None) -> bool:
+    """asyncio twin of pump() for one stream; True if it stopped on overflow."""
+    while True:
+        data = await reader.read(CHUNK)
+        if not data:
+            return False
+        capture.feed(data)
+        if capture.over(limit):
+            if on_overflow is not None:
+                on_overflow()
+            return True
+
+
+def run_capped(argv: List[str], timeout: float, job: Optional[Dict[str, Any]] = None, **popen) -> Dict[str, Any]:
+    """
+    subprocess.run(argv, timeout=...) with bounded capture; the child gets its
+    own session so a timeout or overflow kills its whole process group.
+    -> {stdout, stderr, returncode, timed_out, stdout_bytes, stderr_bytes, truncated, ...}
+    """
+    job = job if job is not None else {}
+    caps = new_captures(job)
+    proc = subprocess.Popen(argv, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            start_new_session=hasattr(os, "killpg"), **popen)
+
+    def kill():
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except (AttributeError, OSError):
+            proc.kill()
+
+    try:
+        if os.name == "nt":
+            # no select() on pipes: read it all, keep head + tail
+            try:
+                out, err = proc.communicate(timeout=timeout)
+                reason = "eof"
+            except subprocess.TimeoutExpired:
+                kill()
+                out, err = proc.communicate()
+                reason = "timeout"
+            caps["stdout"].feed(out or b"")
+            caps["stderr"].feed(err or b"")
+        else:
+            deadline = time.monotonic() + timeout
+            reason = pump({proc.stdout.fileno(): caps["stdout"], proc.stderr.fileno(): caps["stderr"]},
+                          deadline, lambda: proc.poll() is not None, kill, kill_limit(job))
+            if reason == "eof":
+                try:
+                    proc.wait(max(0.0, deadline - time.monotonic()))
+                except subprocess.TimeoutExpired:
+                    reason = "timeout"
+            if reason != "eof":
+                kill()
+                proc.wait()
+    finally:
+        proc.stdout.close()
+        proc.stderr.close()
+    return outcome(proc.returncode, reason, caps, job)
+
+
+def artifact_path(artifact_id: str, stream: str) -> str:
+    return os.path.join(OUTPUT_ARTIFACT_DIR, f"{artifact_id}.{stream}")
+
+
+def read_artifact(artifact_id: str, stream: str) -> Optional[str]:
+    """Full spooled output of one stream, or None if unknown/expired."""
+    if not _ARTIFACT_ID.match(artifact_id or "") or stream not in ("stdout", "stderr"):
+        return None
+    path = artifact_path(artifact_id, stream)
+    try:
+        if os.path.getmtime(path) < time.time() - OUTPUT_ARTIFACT_TTL:
+            return None  # expired; sweep_artifacts removes it with the next spooled run
+        with open(path, "rb") as f:
+            return f.read().decode("utf-8", errors="replace")
+    except OSError:
+        return None
+
+
+def sweep_artifacts(ttl: float = OUTPUT_ARTIFACT_TTL):
+    cutoff = time.time() - ttl
+    try:
+        entries = list(os.scandir(OUTPUT_ARTIFACT_DIR))
+    except OSError:
+        return
+    for e in entries:
+        try:
+            if e.stat().st_mtime < cutoff:
+                os.unlink(e.path)
+        except OSError:
+            pass
@@ -0,0 +1,182 @@
+"""
+utils/patching.py
+
+Apply LLM-produced edits to a file instead of asking for the whole file back.
+Two formats are understood:
+
+  1) search/replace blocks
+       <<<<<<< SEARCH
+       old lines
+       =======
+       new lines
+       >>>>>>> REPLACE
+
+  2) unified diffs (@@ hunks with ' ', '-', '+' lines; headers are ignored)
+
+Each hunk's "old" lines are located exactly, then ignoring whitespace, then
+fuzzily (best window by difflib ratio >= FUZZ_THRESHOLD). A hunk that matches
+more than one place (several exact matches, or fuzzy windows within FUZZ_MARGIN
+of each other) counts as unplaced. If any hunk can't be placed the whole patch
+is rejected, so callers can fall back to full-file mode.
+"""
+
+import difflib
+import re
+from typing import List, Optional, Tuple
+
+FUZZ_THRESHOLD = 0.85
+# a fuzzy match must beat the next best window by this much, else it's ambiguous
+FUZZ_MARGIN = 0.02
+
+Hunk = Tuple[List[str], List[str]]  # (old_lines, new_lines)
+
+_SR_RE = re.compile(
+    r"^<{5,9} ?SEARCH[^\n]*\n(.*?)^={5,9}[ \t]*\n(.*?)^>{5,9} ?REPLACE[^\n]*$",
+    re.DOTALL | re.MULTILINE,
+)
+
+
+def parse_search_replace(text: str) -> List[Hunk]:
+    hunks = []
+    for m in _SR_RE.finditer(text or ""):
+        hunks.append((m.group(1).splitlines(), m.group(2).splitlines()))
+    return hunks
+
+
+def parse_unified_diff(text: str) -> List[Hunk]:
+    hunks: List[Hunk] = []
+    old: Optional[List[str]] = None
+    new: List[str] = []
+    for line in (text or "").splitlines():
+        if line.startswith("@@"):
+            if old is not None and (old or new):
+                hunks.append((old, new))
+            old, new = [], []
+            continue
+        if old is None or line.startswith(("---", "+++", "\\ No newline")):
+            continue
+        tag, body = line[:1], line[1:]
+        if tag == " " or line == "":
+            old.append(body)
+            new.append(body)
+        elif tag == "-":
+            old.append(body)
+        elif tag == "+":
+            new.append(body)
+    if old is not None and (old or new):
+        hunks.append((old, new))
+    return hunks
+
+
+def diff_hunks(before: str, after: str, context: int = 2) -> List[Hunk]:
+    """Hunks that turn `before` into `after`; re-applicable to similar files."""
+    udiff = "\n".join(difflib.unified_diff(
+        before.splitlines(), after.splitlines(), lineterm="", n=context))
+    return parse_unified_diff(udiff)
+
+
+def _locate(lines: List[str], old: List[str], start: int = 0) -> Optional[int]:
+    """Start of the one window matching `old`; None if there's none or it's ambiguous."""
+    n = len(old)
+    if n == 0 or n > len(lines):
+        return None
+    # 1) exact
+    hits = [i for i in range(start, len(lines) - n + 1) if lines[i:i + n] == old]
+    if hits:
+        return hits[0] if len(hits) == 1 else None
+    # 2) whitespace-insensitive
+    norm_old = [l.strip() for l in old]
+    hits = [i for i in range(start, len(lines) - n + 1) if [l.strip() for l in lines[i:i + n]] == norm_old]
+    if hits:
+        return hits[0] if len(hits) == 1 else None
+    # 3) fuzzy: best window above the threshold, clearly ahead of the runner-up
+    target = "\n".join(norm_old)
+    best, best_i, second = 0.0, None, 0.0
+    for i in range(start, len(lines) - n + 1):
+        window = "\n".join(l.strip() for l in lines[i:i + n])
+        sm = difflib.SequenceMatcher(None, window, target, autojunk=False)
+        if sm.quick_ratio() < FUZZ_THRESHOLD:
+            continue
+        r = sm.ratio()
+        if r > best:
+            best, best_i, second = r, i, best
+        elif r > second:
+            second = r
+    if best < FUZZ_THRESHOLD or best - second < FUZZ_MARGIN:
+        return None
+    return best_i
+
+
+def _reindent(new: List[str], old: List[str], found: List[str]) -> List[str]:
+    """If the match was found at a different indentation, shift the replacement the same way."""
+    def indent(l: str) -> int:
+        return len(l) - len(l.lstrip())
+    first_old = next((l for l in old if l.strip()), None)
+    first_found = next((l for l in found if l.strip()), None)
+    if first_old is None or first_found is None:
+        return new
+    delta = indent(first_found) - indent(first_old)
+    if delta == 0:
+        return new
+    out = []
+    for l in new:
+        if not l.strip():
+            out.append(l)
+        elif delta > 0:
+            out.append(" " * delta + l)
+        else:
+            out.append(l[min(-delta, indent(l)):])
+    return out
+
+
+def _merge(old: List[str], new: List[str], found: List[str]) -> List[str]:
+    """
+    Build the replacement for `found` (the located, possibly fuzzy, match of `old`):
+    lines the hunk keeps come from the file as it is, changed lines from `new`.
+    """
+    out: List[str] = []
+    added = _reindent(new, old, found)
+    sm = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    for tag, i1, i2, j1, j2 in sm.get_opcodes():
+        if tag == "equal":
+            out.extend(found[i1:i2])
+        elif tag in ("replace", "insert"):
+            out.extend(added[j1:j2])
+    return out
+
+
+def apply_hunks(source: str, hunks: List[Hunk]) -> Optional[str]:
+    """Apply hunks in order; None if any hunk can't be located."""
+    if not hunks:
+        return None
+    lines = source.splitlines()
+    pos = 0
+    for old, new in hunks:
+        if not old:
+            if lines:
+                return None  # pure insertion without context is ambiguous
+            lines = list(new)
+            continue
+        i = _locate(lines, old, pos)
+        if i is None and pos:
+            i = _locate(lines, old, 0)  # hunks may come out of order
+        if i is None:
+            return None
+        found = lines[i:i + len(old)]
+        repl = _merge(old, new, found)
+        lines[i:i + len(old)] = repl
+        pos = i + len(repl)
+    out = "\n".join(lines)
+    return out + "\n" if source.endswith("\n") else out
+
+
+def apply_patch(source: str, text: str) -> Tuple[Optional[str], str]:
+    """Parse `text` as search/replace blocks or a unified diff and apply it.
+    Returns (new_source or None, format)."""
+    hunks = parse_search_replace(text)
+    if hunks:
+        return apply_hunks(source, hunks), "search_replace"
+    hunks = parse_unified_diff(text)
+    if hunks:
+        return apply_hunks(source, hunks), "unified_diff"
+    return None, "unparsed"
@@ -0,0 +1,47 @@
+"""
+utils/pytest_collect.py
+
+pytest plugin that records one entry per test (node id, outcome, duration,
+longrepr) and writes them as JSON to $PYTEST_RESULTS_PATH when the session
+ends. Loaded with `plugins=[pytest_collect]` in forked workers, or with
+`-p utils.pytest_collect` in a plain `python -m pytest`.
+
+{"tests": [{"nodeid", "outcome", "duration", "longrepr"}],
+ "summary": {"passed", "failed", "error", "skipped", "total"}, "exitstatus": int}
+"""
+
+import json
+import os
+from typing import Any, Dict
+
+_tests: Dict[str, Dict[str, Any]] = {}
+
+
+def pytest_runtest_logreport(report):
+    t = _tests.setdefault(report.nodeid, {"nodeid": report.nodeid, "outcome": "passed",
+                                          "duration": 0.0, "longrepr": ""})
+    t["duration"] = round(t["duration"] + float(getattr(report, "duration", 0.0) or 0.0), 6)
+    if report.outcome == "skipped" and t["outcome"] == "passed":
+        t["outcome"] = "skipped"
+    elif report.failed:
+        # a failing setup/teardown is an error, a failing call is a failure
+        t["outcome"] = "failed" if report.when == "call" else "error"
+    if report.longrepr and not t["longrepr"]:
+        t["longrepr"] = str(report.longrepr)[:8000]
+
+
+def pytest_collectreport(report):
+    if report.failed:
+        _tests[report.nodeid or "<collection>"] = {"nodeid": report.nodeid or "<collection>", "outcome": "error",
+                                                  "duration": 0.0, "longrepr": str(report.longrepr)[:8000]}
+
+
+def pytest_sessionfinish(session, exitstatus):
+    path = os.environ.get("PYTEST_RESULTS_PATH")
+    if not path:
+        return
+    tests = list(_tests.values())
+    summary = {k: sum(1 for t in tests if t["outcome"] == k) for k in ("passed", "failed", "error", "skipped")}
+    summary["total"] = len(tests)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"tests": tests, "summary": summary, "exitstatus": int(exitstatus)}, f)
@@ -0,0 +1,161 @@
+"""
+utils/response_cache.py
+
+Cache for the MCP servers that look things up upstream (docs: PyPI JSON API,
+stackoverflow: Stack Exchange API). The same few lookups repeat all day (the
+first line of common errors, `fastapi`, `pydantic`), so:
+
+- persistent: memory LRU in front of SQLite (utils.cache.TieredCache), one
+  table per server in a shared file, so restarts keep what was fetched.
+- per-endpoint policy (ttl, stale): younger than ttl is served as is; up to
+  ttl + stale the old value is served right away and refreshed in the
+  background (stale-while-revalidate).
+- conditional revalidation: entries keep the upstream ETag / Last-Modified;
+  fetch() gets them back and returns NOT_MODIFIED on a 304, which renews the
+  entry without a body.
+- single-flight: concurrent lookups of the same key share one upstream call.
+- stale-if-error: when upstream fails, an old value (up to RESPONSE_CACHE_KEEP
+  s) beats an error.
+
+fetch(validators) returns {"value": ..., "etag": ..., "last_modified": ...,
+"ttl": optional override} or NOT_MODIFIED, and raises on failure.
+
+Env: RESPONSE_CACHE (1/0), RESPONSE_CACHE_PATH, RESPONSE_CACHE_KEEP (s),
+RESPONSE_CACHE_POLICY ("/pkg_info=3600:86400,/search=...", ttl:stale in s)
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from utils.cache import SQLiteCache, TTLCache, TieredCache, make_key
+
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "1") == "1"
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", os.path.join(os.getcwd(), "data", "response_cache.sqlite3"))
+RESPONSE_CACHE_KEEP = float(os.getenv("RESPONSE_CACHE_KEEP", str(7 * 24 * 3600)))
+RESPONSE_CACHE_MEM_ENTRIES = int(os.getenv("RESPONSE_CACHE_MEM_ENTRIES", "512"))
+RESPONSE_CACHE_DISK_ENTRIES = int(os.getenv("RESPONSE_CACHE_DISK_ENTRIES", "20000"))
+
+NOT_MODIFIED = object()
+
+_POLICY_OVERRIDES: Dict[str, Tuple[float, float]] = {}
+for _item in os.getenv("RESPONSE_CACHE_POLICY", "").split(","):
+    if "=" in _item:
+        _path, _spec = _item.split("=", 1)
+        _ttl, _, _stale = _spec.partition(":")
+        _POLICY_OVERRIDES["/" + _path.strip().lstrip("/")] = (float(_ttl), float(_stale or 0))
+
+
+class ResponseCache:
+    def __init__(self, name: str, policies: Dict[str, Tuple[float, float]], path: str = RESPONSE_CACHE_PATH,
+                 enabled: bool = RESPONSE_CACHE):
+        self.name = name
+        self.enabled = enabled
+        self.policies = dict(policies, **_POLICY_OVERRIDES)
+        self.store = TieredCache(
+            TTLCache(max_entries=RESPONSE_CACHE_MEM_ENTRIES, ttl=RESPONSE_CACHE_KEEP),
+            SQLiteCache(path, max_entries=RESPONSE_CACHE_DISK_ENTRIES, ttl=RESPONSE_CACHE_KEEP,
+                        table=f"{name}_responses") if enabled and path else None,
+        )
+        self._flights: Dict[str, Future] = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._refresh = ThreadPoolExecutor(max_workers=2, thread_name_prefix=f"{name}-refresh")
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, endpoint: str, what: str):
+        with self._lock:
+            c = self._counts.setdefault(endpoint, {})
+            c[what] = c.get(what, 0) + 1
+
+    def _fetch(self, endpoint: str, key: str, entry: Optional[Dict[str, Any]],
+               fetch: Callable[[Dict[str, str]], Any]) -> Tuple[Dict[str, Any], str]:
+        """(entry, "miss" | "revalidated"). One upstream call per key at a time; later callers wait for the first."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Future()
+        if not leader:
+            self._count(endpoint, "coalesced")
+            return flight.result()
+        try:
+            validators = {k: entry[k] for k in ("etag", "last_modified") if entry and entry.get(k)}
+            got = fetch(validators)
+            now = time.time()
+            if got is NOT_MODIFIED:
+                self._count(endpoint, "revalidated")
+                new, how = dict(entry, fetched=now), "revalidated"
+            else:
+                self._count(endpoint, "fetched")
+                how = "miss"
+                new = {"value": got["value"], "etag": got.get("etag"), "last_modified": got.get("last_modified"),
+                       "fetched": now, "ttl": got.get("ttl")}
+            self.store.set(key, new, max(RESPONSE_CACHE_KEEP, sum(self.policies.get(endpoint, (0, 0)))))
+            flight.set_result((new, how))
+            return new, how
+        except BaseException as e:
+            self._count(endpoint, "errors")
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+
+    def _background(self, endpoint: str, key: str, entry: Dict[str, Any], fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self._fetch(endpoint, key, entry, fetch)
+            except Exception:
+                pass  # the stale value stays; the next lookup tries again
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+        self._count(endpoint, "refreshes")
+        self._refresh.submit(run)
+
+    def lookup(self, endpoint: str, key_parts: Any, fetch: Callable[[Dict[str, str]], Any]) -> Tuple[Any, str]:
+        """
+        (value, how): how is "hit", "stale" (being refreshed), "revalidated",
+        "miss", "stale-error" or "off". Raises what fetch raised when there is
+        nothing to fall back on.
+        """
+        if not self.enabled:
+            got = fetch({})
+            return got["value"], "off"
+        key = make_key(self.name, endpoint, key_parts)
+        entry = self.store.get(key)
+        ttl, stale = self.policies.get(endpoint, (0.0, 0.0))
+        if entry is not None:
+            age = time.time() - entry["fetched"]
+            fresh_for = entry["ttl"] if entry.get("ttl") is not None else ttl
+            if age < fresh_for:
+                self._count(endpoint, "hits")
+                return entry["value"], "hit"
+            if age < fresh_for + stale:
+                self._count(endpoint, "stale")
+                self._background(endpoint, key, entry, fetch)
+                return entry["value"], "stale"
+        self._count(endpoint, "misses")
+        try:
+            new, how = self._fetch(endpoint, key, entry, fetch)
+        except Exception:
+            if entry is None:
+                raise
+            self._count(endpoint, "stale_on_error")
+            return entry["value"], "stale-error"
+        return new["value"], how
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = {e: dict(c) for e, c in self._counts.items()}
+            inflight = len(self._flights)
+        return {"enabled": self.enabled, "policies": self.policies, "endpoints": counts,
+                "inflight": inflight, **self.store.stats()}
@@ -8,11 +8,12 @@ Small helper to execute a single Python script safely (best-effort).
 """
 
 import tempfile
-import subprocess
 import sys
 import os
 import traceback
 
+from utils.output_capture import run_capped
+
 try:
     import resource
     HAS_RESOURCE = True
@@ -41,13 +42,14 @@ def run_script(code: str, timeout: int = 5, cpu_seconds: int = 5, memory_mb: int
 
     Args:
       code: python code string
-      timeout: wall time limit for subprocess.run
+      timeout: wall time limit (the process group is killed after it)
       cpu_seconds: RLIMIT_CPU (POSIX only)
       memory_mb: RLIMIT_AS approx (POSIX only)
 
     Returns:
       dict with keys:
         - stdout, stderr, returncode, timed_out (bool), error (exception string)
+        - stdout_bytes, stderr_bytes, truncated (output is capped, see utils/output_capture.py)
     """
     fd = None
     path = None
@@ -59,22 +61,9 @@ def run_script(code: str, timeout: int = 5, cpu_seconds: int = 5, memory_mb: int
 
         preexec = (lambda: _set_limits(cpu_seconds, memory_mb)) if HAS_RESOURCE else None
 
-        proc = subprocess.run(
-            [sys.executable, path],
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-            preexec_fn=preexec
-        )
-        return {
-            "stdout": proc.stdout,
-            "stderr": proc.stderr,
-            "returncode": proc.returncode,
-            "timed_out": False,
-            "error": None
-        }
-    except subprocess.TimeoutExpired as e:
-        return {"stdout": getattr(e, "stdout", ""), "stderr": getattr(e, "stderr", ""), "returncode": 124, "timed_out": True, "error": "TIMEOUT"}
+        res = run_capped([sys.executable, path], timeout, preexec_fn=preexec)
+        res["error"] = "TIMEOUT" if res["timed_out"] else None
+        return res
     except Exception as ex:
         return {"stdout": "", "stderr": "", "returncode": -1, "timed_out": False, "error": traceback.format_exc()}
     finally:
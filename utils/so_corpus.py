@@ -0,0 +1,182 @@
+"""
+utils/so_corpus.py
+
+Offline StackOverflow corpus: questions from a Stack Exchange data dump
+(Posts.xml), filtered by tag, in a local SQLite FTS5 index (BM25 over title,
+body and tags) so /search works without the network.
+
+Ingest (streams the XML, so multi-GB dumps are fine):
+    python -m utils.so_corpus Posts.xml --tags python --min-score 1
+    python -m utils.so_corpus Posts.xml --db data/stackoverflow.sqlite3 --limit 200000
+
+Hits have the same shape as the live API results:
+{title, link, is_answered, score, excerpt}
+"""
+
+import argparse
+import html
+import math
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterable, List, Optional
+
+from utils.fts_index import FTSIndex
+
+SO_CORPUS_PATH = os.getenv("SO_CORPUS_PATH", os.path.join(os.getcwd(), "data", "stackoverflow.sqlite3"))
+EXCERPT_CHARS = 300
+# BM25 column weights: title, body, tags
+WEIGHTS = (4.0, 1.0, 2.0)
+
+_TAG_RE = re.compile(r"[^<>|]+")
+_HTML_TAG_RE = re.compile(r"<[^>]+>")
+_WS_RE = re.compile(r"\s+")
+
+
+def _text(body_html: str) -> str:
+    return _WS_RE.sub(" ", html.unescape(_HTML_TAG_RE.sub(" ", body_html or ""))).strip()
+
+
+def _tags(raw: str) -> List[str]:
+    # "<python><list>" in older dumps, "|python|list|" in newer ones
+    return _TAG_RE.findall(raw or "")
+
+
+class SOCorpus:
+    def __init__(self, path: str = SO_CORPUS_PATH):
+        self.path = path
+        self.index = FTSIndex(path, table="posts", columns=("title", "body", "tags"))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS posts_meta (doc_id TEXT PRIMARY KEY, title TEXT, link TEXT, "
+            "score INTEGER, is_answered INTEGER, excerpt TEXT)"
+        )
+        self._conn.commit()
+
+    def count(self) -> int:
+        return self.index.count()
+
+    def add_many(self, posts: Iterable[Dict]):
+        posts = list(posts)
+        self.index.upsert_many(
+            (p["doc_id"], {"title": p["title"], "body": p["body"], "tags": " ".join(p["tags"])}) for p in posts
+        )
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO posts_meta VALUES (?, ?, ?, ?, ?, ?)",
+                [(p["doc_id"], p["title"], p["link"], p["score"], int(p["is_answered"]), p["body"][:EXCERPT_CHARS])
+                 for p in posts],
+            )
+            self._conn.commit()
+
+    def mark_answered(self, doc_ids: Iterable[str]):
+        with self._lock:
+            self._conn.executemany("UPDATE posts_meta SET is_answered = 1 WHERE doc_id = ?", [(d,) for d in doc_ids])
+            self._conn.commit()
+
+    def search(self, query: str, pagesize: int = 5) -> List[Dict]:
+        """Best BM25 matches, nudged towards answered, well-scored questions."""
+        hits = self.index.search(query, limit=pagesize * 4, weights=WEIGHTS)
+        if not hits:
+            return []
+        ids = [h["doc_id"] for h in hits]
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT doc_id, title, link, score, is_answered, excerpt FROM posts_meta "
+                f"WHERE doc_id IN ({', '.join('?' for _ in ids)})", ids,
+            ).fetchall()
+        meta = {r[0]: r for r in rows}
+
+        def rank(h):
+            m = meta.get(h["doc_id"])
+            # bm25 is negative, lower is better
+            return h["rank"] - (0.5 if m and m[4] else 0.0) - 0.2 * math.log1p(max(m[3] if m else 0, 0))
+
+        out = []
+        for h in sorted(hits, key=rank)[:pagesize]:
+            m = meta.get(h["doc_id"])
+            if m is None:
+                continue
+            out.append({"title": m[1], "link": m[2], "is_answered": bool(m[4]), "score": m[3], "excerpt": m[5]})
+        return out
+
+
+def iter_posts(xml_path: str, tags=("python",), min_score: int = 0):
+    """
+    Yield ("question", post) for matching questions and ("answered", question_id)
+    for answers with a positive score to one of them. Streams the file.
+    """
+    wanted = {t.lower() for t in tags}
+    kept = set()
+    context = ET.iterparse(xml_path, events=("start", "end"))
+    _, root = next(context)
+    for event, el in context:
+        if event != "end" or el.tag != "row":
+            continue
+        a = el.attrib
+        kind = a.get("PostTypeId")
+        if kind == "1":
+            post_tags = _tags(a.get("Tags", ""))
+            score = int(a.get("Score") or 0)
+            if (not wanted or wanted & {t.lower() for t in post_tags}) and score >= min_score:
+                qid = a["Id"]
+                kept.add(qid)
+                yield "question", {
+                    "doc_id": qid,
+                    "title": html.unescape(a.get("Title", "")),
+                    "body": _text(a.get("Body", "")),
+                    "tags": post_tags,
+                    "score": score,
+                    "is_answered": bool(a.get("AcceptedAnswerId")),
+                    "link": f"https://stackoverflow.com/questions/{qid}",
+                }
+        elif kind == "2" and a.get("ParentId") in kept and int(a.get("Score") or 0) > 0:
+            yield "answered", a["ParentId"]
+        el.clear()
+        root.clear()  # drop finished rows, or the tree grows with the file
+
+
+def ingest(xml_path: str, db_path: str = SO_CORPUS_PATH, tags=("python",), min_score: int = 0,
+           limit: Optional[int] = None, batch: int = 2000) -> Dict[str, int]:
+    corpus = SOCorpus(db_path)
+    questions, answered, buf = 0, set(), []
+    for kind, item in iter_posts(xml_path, tags, min_score):
+        if kind == "answered":
+            answered.add(item)
+            continue
+        if limit is not None and questions >= limit:
+            continue   # keep reading for answers to the questions already in
+        buf.append(item)
+        questions += 1
+        if len(buf) >= batch:
+            corpus.add_many(buf)
+            buf = []
+    if buf:
+        corpus.add_many(buf)
+    corpus.mark_answered(answered)
+    return {"questions": questions, "answered": len(answered), "total": corpus.count()}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Load a Stack Exchange Posts.xml into the offline StackOverflow index.")
+    ap.add_argument("posts_xml")
+    ap.add_argument("--db", default=SO_CORPUS_PATH)
+    ap.add_argument("--tags", default="python", help="comma-separated; a question needs one of them ('' = all)")
+    ap.add_argument("--min-score", type=int, default=0)
+    ap.add_argument("--limit", type=int, default=None, help="max questions to load")
+    args = ap.parse_args(argv)
+    t0 = time.perf_counter()
+    stats = ingest(args.posts_xml, args.db, [t.strip() for t in args.tags.split(",") if t.strip()],
+                   args.min_score, args.limit)
+    print(f"[INGEST] {stats['questions']} questions ({stats['answered']} answered) -> {args.db} "
+          f"({stats['total']} total) in {time.perf_counter() - t0:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,385 @@
+"""
+utils/symbol_index.py
+
+On-disk index of the modules and public symbols of installed distributions
+(and the stdlib), built by reading source files with `ast`. Nothing is
+imported, so building is safe for any package and doesn't touch this process.
+
+- modules: name -> distribution, version, file, docstring
+- symbols: (module, name) -> kind (function/class/method/variable/import),
+  signature, first docstring paragraph; "import" rows point at the re-exported
+  target so `pydantic.BaseModel` resolves to `pydantic.main.BaseModel`
+- build() is incremental: distributions whose version didn't change are skipped.
+- lookups are SQLite primary-key reads; "did you mean" uses difflib over the
+  module's names (or the top-level module list, kept in memory).
+
+Env: DOCS_INDEX_PATH, DOCS_INDEX_STDLIB (1/0)
+"""
+
+import ast
+import difflib
+import importlib.metadata
+import os
+import sqlite3
+import sys
+import sysconfig
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+DOCS_INDEX_PATH = os.getenv("DOCS_INDEX_PATH", os.path.join(os.getcwd(), "data", "symbol_index.sqlite3"))
+DOCS_INDEX_STDLIB = os.getenv("DOCS_INDEX_STDLIB", "1") == "1"
+MAX_FILE_BYTES = 2_000_000     # generated giants (protobufs, tables) aren't worth parsing
+DOC_CHARS = 300
+SIG_CHARS = 400
+STDLIB_DIST = "python"
+_SKIP_PARTS = {"test", "tests", "idle_test", "__pycache__", "site-packages"}
+# modules that only exist at runtime
+_ALIASES = {"os.path": os.path.__name__}
+
+Row = Tuple[str, str, str, str, str]   # name, kind, signature, doc, target
+
+
+def _doc(node) -> str:
+    try:
+        d = ast.get_docstring(node) or ""
+    except TypeError:
+        return ""
+    return d.split("\n\n")[0].strip()[:DOC_CHARS]
+
+
+class _StripAnnotated(ast.NodeTransformer):
+    # Annotated[int, Doc("...pages...")] -> int
+    def visit_Subscript(self, node):
+        base = node.value
+        if (isinstance(base, ast.Name) and base.id == "Annotated") or (
+                isinstance(base, ast.Attribute) and base.attr == "Annotated"):
+            if isinstance(node.slice, ast.Tuple) and node.slice.elts:
+                return self.visit(node.slice.elts[0])
+        return self.generic_visit(node)
+
+
+def _signature(fn) -> str:
+    try:
+        args = _StripAnnotated().visit(fn.args)
+        sig = f"({ast.unparse(args)})"
+        sig += f" -> {ast.unparse(fn.returns)}" if fn.returns is not None else ""
+    except Exception:
+        return "(...)"
+    return sig if len(sig) <= SIG_CHARS else sig[:SIG_CHARS - 3] + "..."
+
+
+def _public(name: str, exported: Optional[set]) -> bool:
+    return name in exported if exported is not None else not name.startswith("_")
+
+
+def _exported(tree: ast.Module) -> Optional[set]:
+    for node in tree.body:
+        if isinstance(node, (ast.Assign, ast.AugAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            if any(isinstance(t, ast.Name) and t.id == "__all__" for t in targets):
+                try:
+                    return set(ast.literal_eval(node.value))
+                except Exception:
+                    return None
+    return None
+
+
+def scan_source(source: str, module: str, is_package: bool) -> Tuple[str, List[Row]]:
+    """(module docstring, symbol rows) of one source file."""
+    tree = ast.parse(source)
+    exported = _exported(tree)
+    package = module if is_package else module.rpartition(".")[0]
+    rows: Dict[str, Row] = {}
+
+    def visit(body):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and _public(node.name, exported):
+                rows[node.name] = (node.name, "function", _signature(node), _doc(node), "")
+            elif isinstance(node, ast.ClassDef) and _public(node.name, exported):
+                init = next((n for n in node.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))
+                             and n.name == "__init__"), None)
+                rows[node.name] = (node.name, "class", _signature(init) if init else "", _doc(node), "")
+                for m in node.body:
+                    if isinstance(m, (ast.FunctionDef, ast.AsyncFunctionDef)) and (
+                            not m.name.startswith("_") or m.name in ("__init__", "__call__")):
+                        name = f"{node.name}.{m.name}"
+                        rows[name] = (name, "method", _signature(m), _doc(m), "")
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                ann = ast.unparse(node.annotation) if isinstance(node, ast.AnnAssign) else ""
+                for t in targets:
+                    if isinstance(t, ast.Name) and _public(t.id, exported) and t.id not in rows:
+                        rows[t.id] = (t.id, "variable", ann, "", "")
+            elif isinstance(node, ast.ImportFrom):
+                base = node.module or ""
+                if node.level:
+                    parts = package.split(".")
+                    parent = ".".join(parts[:len(parts) - node.level + 1]) if node.level <= len(parts) else ""
+                    base = f"{parent}.{base}".strip(".") if node.module else parent
+                for a in node.names:
+                    name = a.asname or a.name
+                    if a.name != "*" and _public(name, exported) and name not in rows:
+                        rows[name] = (name, "import", "", "", f"{base}.{a.name}")
+            elif isinstance(node, ast.Import):
+                for a in node.names:
+                    if a.asname and _public(a.asname, exported):
+                        rows[a.asname] = (a.asname, "import", "", "", a.name)
+            elif isinstance(node, ast.If):
+                visit(node.body)
+                visit(node.orelse)
+            elif isinstance(node, ast.Try):
+                visit(node.body)
+                for h in node.handlers:
+                    visit(h.body)
+    visit(tree.body)
+    return _doc(tree), list(rows.values())
+
+
+def _module_name(rel_parts: Iterable[str]) -> Optional[Tuple[str, bool]]:
+    parts = list(rel_parts)
+    if not parts or not parts[-1].endswith(".py") or any(p in _SKIP_PARTS for p in parts):
+        return None
+    parts[-1] = parts[-1][:-3]
+    is_package = parts[-1] == "__init__"
+    if is_package:
+        parts = parts[:-1]
+    if not parts or not all(p.isidentifier() for p in parts):
+        return None
+    return ".".join(parts), is_package
+
+
+def _dist_files(dist) -> Iterable[Tuple[str, bool, str]]:
+    """(module, is_package, path) for the .py files a distribution installed."""
+    for f in dist.files or []:
+        mod = _module_name(f.parts)
+        if mod:
+            yield mod[0], mod[1], str(f.locate())
+
+
+def _stdlib_files() -> Iterable[Tuple[str, bool, str]]:
+    root = sysconfig.get_paths()["stdlib"]
+    tops = getattr(sys, "stdlib_module_names", None)
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel = os.path.relpath(dirpath, root)
+        parts = [] if rel == "." else rel.split(os.sep)
+        dirnames[:] = [d for d in dirnames if d not in _SKIP_PARTS and d.isidentifier()]
+        if parts and tops is not None and parts[0] not in tops:
+            dirnames[:] = []
+            continue
+        for fn in filenames:
+            mod = _module_name(parts + [fn])
+            if mod and (tops is None or mod[0].split(".")[0] in tops):
+                yield mod[0], mod[1], os.path.join(dirpath, fn)
+
+
+class SymbolIndex:
+    def __init__(self, path: str = DOCS_INDEX_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS dists (name TEXT PRIMARY KEY, version TEXT);
+            CREATE TABLE IF NOT EXISTS modules (name TEXT PRIMARY KEY, dist TEXT, path TEXT, doc TEXT);
+            CREATE INDEX IF NOT EXISTS modules_dist ON modules (dist);
+            CREATE TABLE IF NOT EXISTS symbols (module TEXT, name TEXT, kind TEXT, signature TEXT, doc TEXT,
+                                                target TEXT, PRIMARY KEY (module, name)) WITHOUT ROWID;
+        """)
+        self._conn.commit()
+        self.building = False
+        self.last_build: Dict[str, Any] = {}
+        self._load_tops()
+
+    def _load_tops(self):
+        with self._lock:
+            names = [r[0] for r in self._conn.execute("SELECT name FROM modules WHERE name NOT LIKE '%.%'")]
+        self._tops = {n.lower(): n for n in names}
+
+    # ---- build --------------------------------------------------------------
+    def _index_dist(self, name: str, version: str, files: Iterable[Tuple[str, bool, str]]) -> int:
+        modules, symbols = [], []
+        for module, is_package, path in files:
+            try:
+                if os.path.getsize(path) > MAX_FILE_BYTES:
+                    continue
+                with open(path, "rb") as f:
+                    doc, rows = scan_source(f.read(), module, is_package)
+            except (OSError, SyntaxError, ValueError, RecursionError):
+                continue
+            modules.append((module, name, path, doc))
+            symbols.extend((module, *r) for r in rows)
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("DELETE FROM symbols WHERE module IN (SELECT name FROM modules WHERE dist = ?)", (name,))
+            cur.execute("DELETE FROM modules WHERE dist = ?", (name,))
+            cur.executemany("INSERT OR REPLACE INTO modules VALUES (?, ?, ?, ?)", modules)
+            cur.executemany("INSERT OR REPLACE INTO symbols VALUES (?, ?, ?, ?, ?, ?)", symbols)
+            cur.execute("INSERT OR REPLACE INTO dists VALUES (?, ?)", (name, version))
+            self._conn.commit()
+        return len(modules)
+
+    def build(self, stdlib: bool = DOCS_INDEX_STDLIB) -> Dict[str, Any]:
+        """(Re)index distributions that are new or changed; drop uninstalled ones."""
+        t0 = time.perf_counter()
+        self.building = True
+        try:
+            with self._lock:
+                known = dict(self._conn.execute("SELECT name, version FROM dists").fetchall())
+            seen, indexed, modules = set(), 0, 0
+            dists = {}
+            for d in importlib.metadata.distributions():
+                name = d.metadata["Name"]
+                if name and name not in dists:
+                    dists[name] = d
+            for name, d in dists.items():
+                seen.add(name)
+                if known.get(name) != d.version:
+                    modules += self._index_dist(name, d.version, _dist_files(d))
+                    indexed += 1
+            if stdlib:
+                seen.add(STDLIB_DIST)
+                version = sys.version.split()[0]
+                if known.get(STDLIB_DIST) != version:
+                    modules += self._index_dist(STDLIB_DIST, version, _stdlib_files())
+                    indexed += 1
+            gone = [n for n in known if n not in seen]
+            with self._lock:
+                for name in gone:
+                    self._conn.execute("DELETE FROM symbols WHERE module IN (SELECT name FROM modules WHERE dist = ?)", (name,))
+                    self._conn.execute("DELETE FROM modules WHERE dist = ?", (name,))
+                    self._conn.execute("DELETE FROM dists WHERE name = ?", (name,))
+                self._conn.commit()
+            self._load_tops()
+            self.last_build = {"dists_indexed": indexed, "modules_indexed": modules, "dists_removed": len(gone),
+                               "ms": round((time.perf_counter() - t0) * 1000, 1), "at": time.time()}
+            return self.last_build
+        finally:
+            self.building = False
+
+    def empty(self) -> bool:
+        return not self._tops
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = {t: self._conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+                      for t in ("dists", "modules", "symbols")}
+        return dict(counts, building=self.building, last_build=self.last_build)
+
+    # ---- lookups --------------------------------------------------------------
+    def module(self, name: str) -> Optional[Dict[str, Any]]:
+        name = _ALIASES.get(name, name)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT m.name, m.dist, d.version, m.path, m.doc FROM modules m LEFT JOIN dists d ON d.name = m.dist "
+                "WHERE m.name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        return {"module": row[0], "dist": row[1], "version": row[2], "path": row[3], "doc": row[4]}
+
+    def members(self, module: str, limit: int = 200) -> List[Dict[str, str]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name, kind, signature FROM symbols WHERE module = ? AND name NOT LIKE '%.%' LIMIT ?",
+                (module, limit)).fetchall()
+        return [{"name": r[0], "kind": r[1], "signature": r[2]} for r in rows]
+
+    def submodules(self, module: str, limit: int = 200) -> List[str]:
+        # children only: "pkg.x" but not "pkg.x.y"
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name FROM modules WHERE name > ? AND name < ? LIMIT ?",
+                (module + ".", module + "/", limit * 20)).fetchall()
+        depth = module.count(".") + 1
+        return [r[0] for r in rows if r[0].count(".") == depth][:limit]
+
+    def _row(self, module: str, name: str):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT kind, signature, doc, target FROM symbols WHERE module = ? AND name = ?",
+                (_ALIASES.get(module, module), name)).fetchone()
+
+    def _defined_below(self, package: str, name: str) -> Optional[str]:
+        """Submodule of `package` that defines `name`: packages exporting lazily
+        through a module-level __getattr__ (pydantic, ...) have no static import."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT module FROM symbols WHERE module > ? AND module < ? AND name = ? AND kind != 'import'",
+                (package + ".", package + "/", name)).fetchall()
+        return min((r[0] for r in rows), key=lambda m: (m.count("."), m), default=None)
+
+    def resolve(self, qualified: str) -> Optional[Tuple[str, str]]:
+        """Split "a.b.C.meth" into (longest indexed module, rest)."""
+        parts = qualified.split(".")
+        for i in range(len(parts), 0, -1):
+            mod = ".".join(parts[:i])
+            if self.module(mod) is not None:
+                return mod, ".".join(parts[i:])
+        return None
+
+    def symbol(self, module: str, name: str, _hops: int = 0) -> Optional[Dict[str, Any]]:
+        """Symbol `name` (may be "Class.method") as seen from `module`, following re-exports."""
+        if not name:
+            info = self.module(module)
+            return dict(info, kind="module", name=module) if info else None
+        row = self._row(module, name)
+        if row is None and "." in name:
+            # "BaseModel.model_dump" where BaseModel is re-exported into `module`
+            head, _, rest = name.partition(".")
+            owner = self._row(module, head)
+            if owner is not None and owner[0] == "import" and _hops < 5:
+                target = self.resolve(owner[3])
+                if target:
+                    return self.symbol(target[0], f"{target[1]}.{rest}".strip("."), _hops + 1)
+        if row is None:
+            sub = self.module(f"{module}.{name}")
+            if sub:
+                return dict(sub, kind="module", name=sub["module"])
+            owner = _hops < 5 and self._defined_below(module, name.partition(".")[0])
+            hit = self.symbol(owner, name, _hops + 1) if owner else None
+            return dict(hit, exported_from=module) if hit else None
+        kind, signature, doc, target = row
+        if kind == "import" and _hops < 5:
+            resolved = self.resolve(target)
+            if resolved:
+                hit = self.symbol(resolved[0], resolved[1], _hops + 1)
+                if hit:
+                    return dict(hit, exported_from=module)
+        return {"module": module, "name": name, "qualname": f"{module}.{name}", "kind": kind,
+                "signature": signature, "doc": doc, "target": target or None}
+
+    def suggest_module(self, name: str, n: int = 5) -> List[str]:
+        parent, _, last = name.rpartition(".")
+        if parent and self.module(parent) is not None:
+            pool = {s.rpartition(".")[2].lower(): s for s in self.submodules(parent, limit=5000)}
+            key = last.lower()
+        else:
+            pool, key = self._tops, name.split(".")[0].lower()
+        pool = {k: v for k, v in pool.items() if abs(len(k) - len(key)) <= 3}
+        return [pool[m] for m in difflib.get_close_matches(key, list(pool), n=n, cutoff=0.6)]
+
+    def suggest_symbol(self, module: str, name: str, n: int = 5) -> List[str]:
+        owner, _, last = name.rpartition(".")
+        if owner:
+            # "Class.meth": the class's methods, wherever it's defined
+            cls = self.symbol(module, owner)
+            if not cls or cls["kind"] != "class":
+                return []
+            with self._lock:
+                names = [r[0].partition(".")[2] for r in self._conn.execute(
+                    "SELECT name FROM symbols WHERE module = ? AND name > ? AND name < ?",
+                    (cls["module"], cls["name"] + ".", cls["name"] + "/"))]
+            pool = {x.lower(): x for x in names}
+            return [f"{owner}.{pool[m]}" for m in difflib.get_close_matches(last.lower(), list(pool), n=n, cutoff=0.6)]
+        with self._lock:
+            names = [r[0] for r in self._conn.execute(
+                "SELECT name FROM symbols WHERE module = ? AND name NOT LIKE '%.%'", (module,))]
+            # lazily exporting packages: what the submodules define counts too
+            names += [r[0] for r in self._conn.execute(
+                "SELECT DISTINCT name FROM symbols WHERE module > ? AND module < ? AND kind IN "
+                "('class', 'function') AND name NOT LIKE '%.%'", (module + ".", module + "/"))]
+        names += [s.rpartition(".")[2] for s in self.submodules(module, limit=1000)]
+        pool = {x.lower(): x for x in names}
+        return [pool[m] for m in difflib.get_close_matches(name.lower(), list(pool), n=n, cutoff=0.6)]
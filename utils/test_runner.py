@@ -11,18 +11,20 @@ Returns:
     "stdout": str,
     "stderr": str,
     "timed_out": bool,
-    "error": optional_exception_str
+    "error": optional_exception_str,
+    "stdout_bytes", "stderr_bytes", "truncated"   (output is capped, see utils/output_capture.py)
   }
 """
 
 import tempfile
-import subprocess
 import sys
 import os
 import textwrap
 import shutil
 import traceback
 
+from utils.output_capture import run_capped
+
 # a small fallback test if generator doesn't provide tests
 DEFAULT_TEST = textwrap.dedent("""
     from fastapi.testclient import TestClient
@@ -59,23 +61,10 @@ def run_pytest_on_files(files: dict, timeout: int = 30, create_default_test: boo
                 f.write(DEFAULT_TEST)
 
         # run pytest in tempdir
-        proc = subprocess.run(
-            [sys.executable, "-m", "pytest", "-q"],
-            cwd=tempdir,
-            capture_output=True,
-            text=True,
-            timeout=timeout
-        )
-        return {
-            "passed": proc.returncode == 0,
-            "returncode": proc.returncode,
-            "stdout": proc.stdout,
-            "stderr": proc.stderr,
-            "timed_out": False,
-            "error": None
-        }
-    except subprocess.TimeoutExpired as e:
-        return {"passed": False, "returncode": 124, "stdout": getattr(e, "stdout", ""), "stderr": getattr(e, "stderr", ""), "timed_out": True, "error": "TIMEOUT"}
+        res = run_capped([sys.executable, "-m", "pytest", "-q"], timeout, cwd=tempdir)
+        res["passed"] = res["returncode"] == 0
+        res["error"] = "TIMEOUT" if res["timed_out"] else None
+        return res
     except Exception:
         return {"passed": False, "returncode": -1, "stdout": "", "stderr": "", "timed_out": False, "error": traceback.format_exc()}
     finally:
@@ -0,0 +1,91 @@
+"""
+utils/token_budget.py
+
+Fit prompt sections (code, error, references, ...) into a per-agent token budget.
+Sections are listed in priority order; each gets its `min_tokens` first, then
+the remaining budget goes to sections in order until they're whole. Anything
+still too long is cut with the section's strategy:
+  "head"   keep the beginning      "tail"   keep the end
+  "middle" keep both ends, drop the middle
+A section with keep=True (e.g. the file the model must return in full) is
+never cut, even if that means going over budget.
+
+Token counts are the usual ~4 chars/token estimate; we only need the ballpark.
+
+Budgets (env): FIXER_PROMPT_BUDGET, GENERATOR_PROMPT_BUDGET
+"""
+
+import os
+from typing import Dict, List, Optional
+
+PROMPT_BUDGETS = {
+    "fixer": int(os.getenv("FIXER_PROMPT_BUDGET", "3000")),
+    "generator": int(os.getenv("GENERATOR_PROMPT_BUDGET", "1500")),
+}
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text or "") + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def budget_for(agent: str, default: int = 3000) -> int:
+    return PROMPT_BUDGETS.get(agent, default)
+
+
+class Section:
+    def __init__(self, name: str, text: str, min_tokens: int = 0, strategy: str = "head", keep: bool = False):
+        self.name = name
+        self.text = text or ""
+        self.min_tokens = min_tokens
+        self.strategy = strategy
+        self.keep = keep
+
+
+def _cut(text: str, tokens: int, strategy: str) -> str:
+    limit = max(0, tokens * CHARS_PER_TOKEN)
+    if len(text) <= limit:
+        return text
+    marker = "\n...[truncated]...\n"
+    if limit <= len(marker):
+        return ""
+    room = limit - len(marker)
+    if strategy == "tail":
+        return marker.lstrip("\n") + text[-room:]
+    if strategy == "middle":
+        head = room // 2
+        return text[:head] + marker + text[-(room - head):]
+    return text[:room] + marker.rstrip("\n")
+
+
+def fit(sections: List[Section], budget_tokens: int) -> Dict[str, str]:
+    """Return {name: text} with the sections trimmed to fit budget_tokens."""
+    need = {s.name: estimate_tokens(s.text) for s in sections}
+    alloc: Dict[str, int] = {}
+    left = budget_tokens
+    for s in sections:
+        give = need[s.name] if s.keep else min(need[s.name], s.min_tokens)
+        alloc[s.name] = give
+        left -= give
+    for s in sections:
+        if left <= 0:
+            break
+        extra = min(need[s.name] - alloc[s.name], left)
+        alloc[s.name] += extra
+        left -= extra
+    return {s.name: (s.text if s.keep else _cut(s.text, alloc[s.name], s.strategy)) for s in sections}
+
+
+def format_references(refs: Optional[Dict[str, list]], limit: int = 5) -> str:
+    """One line per reference from state["references"] (stackoverflow, docs, ...)."""
+    lines: List[str] = []
+    for source, items in (refs or {}).items():
+        for it in (items or [])[:limit]:
+            if isinstance(it, dict):
+                title = it.get("title") or it.get("name") or it.get("symbol") or ""
+                extra = it.get("link") or it.get("signature") or ""
+                lines.append(f"- [{source}] {title} {extra}".rstrip())
+            else:
+                lines.append(f"- [{source}] {it}")
+    return "\n".join(lines)
@@ -0,0 +1,144 @@
+"""
+utils/tracebacks.py
+
+Turn raw Python / pytest output into the few lines a fixer actually needs.
+- parse_error(): exception type + message, stack frames, pytest "E" assertion
+  lines and failing test ids.
+- compact_error(): a short, deduplicated rendering of that: the exception,
+  frames in the user's own files (site-packages/stdlib frames dropped, repeats
+  collapsed) and the assertion diff. Falls back to the *tail* of the raw text
+  when nothing parses, because that's where Python puts the exception.
+"""
+
+import re
+from typing import Any, Dict, List, Optional
+
+# File "/tmp/x/app.py", line 12, in add
+_PY_FRAME_RE = re.compile(r'^\s*File "(?P<file>[^"]+)", line (?P<line>\d+)(?:, in (?P<func>.+))?$')
+# app.py:12: in add      |  app.py:12: AssertionError
+_PT_FRAME_RE = re.compile(r"^(?P<file>[\w./\\-]+\.py):(?P<line>\d+):(?: in (?P<func>\S+)|\s+(?P<exc>\w+))?\s*$")
+# NameError: name 'x' is not defined   (optionally pytest's "E   " prefix)
+_EXC_RE = re.compile(
+    r"^(?:E\s+)?(?P<type>(?:[A-Za-z_][\w]*\.)*[A-Za-z_]\w*(?:Error|Exception|Exit|Interrupt|Warning|Failed))"
+    r"(?::\s?(?P<msg>.*))?$"
+)
+# FAILED test_app.py::test_add - AssertionError: assert 3 == -1
+_FAILED_RE = re.compile(r"^(?:FAILED|ERROR) (?P<test>\S+)(?: - (?P<rest>.*))?$")
+
+_LIB_MARKERS = ("site-packages", "dist-packages", "/lib/python", "\\lib\\python", "<frozen", "_pytest", "pluggy")
+
+
+def _is_user_frame(path: str) -> bool:
+    return not any(m in path for m in _LIB_MARKERS)
+
+
+def _short(path: str) -> str:
+    # temp workspaces differ on every run; the file name is what matters
+    return re.split(r"[\\/]", path)[-1]
+
+
+def parse_error(text: str) -> Dict[str, Any]:
+    lines = (text or "").splitlines()
+    frames: List[Dict[str, Any]] = []
+    assertion: List[str] = []
+    failed: List[str] = []
+    exc_type: Optional[str] = None
+    exc_msg = ""
+
+    for idx, raw in enumerate(lines):
+        line = raw.rstrip()
+        m = _PY_FRAME_RE.match(line)
+        if m:
+            src = lines[idx + 1].strip() if idx + 1 < len(lines) else ""
+            if _PY_FRAME_RE.match(src) or _EXC_RE.match(src):
+                src = ""
+            frames.append({"file": m.group("file"), "line": int(m.group("line")),
+                           "func": (m.group("func") or "").strip(), "code": src})
+            continue
+        m = _PT_FRAME_RE.match(line.strip())
+        if m:
+            frames.append({"file": m.group("file"), "line": int(m.group("line")),
+                           "func": m.group("func") or "", "code": ""})
+            if m.group("exc") and not exc_type:
+                exc_type = m.group("exc")
+            continue
+        m = _FAILED_RE.match(line.strip())
+        if m:
+            failed.append(m.group("test"))
+            rest = (m.group("rest") or "").strip()
+            em = _EXC_RE.match(rest)
+            if em:
+                exc_type, exc_msg = em.group("type"), (em.group("msg") or "").strip()
+            elif rest and not exc_msg:
+                exc_msg = rest  # e.g. "assert -1 == 3" for a bare assert
+            continue
+        stripped = line.strip()
+        em = _EXC_RE.match(stripped)
+        if em:
+            # the last exception line wins (chained exceptions end with the real one)
+            exc_type, exc_msg = em.group("type"), (em.group("msg") or "").strip()
+            continue
+        if (stripped.startswith("E ") or stripped.startswith("> ")) and stripped[2:].strip():
+            # pytest: "> failing line" and "E   explanation/diff"
+            assertion.append(stripped)
+
+    return {"exc_type": exc_type, "message": exc_msg, "frames": frames,
+            "assertion": assertion, "failed_tests": failed}
+
+
+def _dedupe_frames(frames: List[Dict[str, Any]]) -> List[str]:
+    out: List[str] = []
+    counts: List[int] = []
+    for f in frames:
+        s = f"{_short(f['file'])}:{f['line']}" + (f" in {f['func']}" if f["func"] else "")
+        if f["code"]:
+            s += f": {f['code']}"
+        if out and out[-1] == s:
+            counts[-1] += 1
+            continue
+        if s in out:
+            # same frame seen earlier (e.g. recursion); note it once
+            counts[out.index(s)] += 1
+            continue
+        out.append(s)
+        counts.append(1)
+    return [s + (f"  (x{c})" if c > 1 else "") for s, c in zip(out, counts)]
+
+
+def compact_error(text: str, max_chars: int = 1500) -> str:
+    text = (text or "").strip()
+    if not text:
+        return ""
+    info = parse_error(text)
+    if not info["exc_type"] and not info["assertion"]:
+        return text if len(text) <= max_chars else "...\n" + text[-max_chars:]
+
+    parts: List[str] = []
+    if info["exc_type"]:
+        parts.append(f"{info['exc_type']}: {info['message']}".rstrip(": "))
+    user_frames = [f for f in info["frames"] if _is_user_frame(f["file"])]
+    if user_frames:
+        parts.append("Frames (user code, innermost last):")
+        parts.extend("  " + s for s in _dedupe_frames(user_frames)[-8:])
+    if info["assertion"]:
+        seen, lines = set(), []
+        for a in info["assertion"]:
+            if a not in seen:
+                seen.add(a)
+                lines.append("  " + a)
+        parts.append("Assertion:")
+        parts.extend(lines[:15])
+    if info["failed_tests"]:
+        parts.append("Failed tests: " + ", ".join(dict.fromkeys(info["failed_tests"])))
+
+    out = "\n".join(parts)
+    return out if len(out) <= max_chars else out[:max_chars - 4] + "\n..."
+
+
+def error_headline(text: str) -> str:
+    """'ExcType: message' if we can find it, else the last non-empty line."""
+    info = parse_error(text)
+    if info["exc_type"]:
+        return f"{info['exc_type']}: {info['message']}".rstrip(": ")
+    tail = [l for l in (text or "").splitlines() if l.strip()]
+    return tail[-1].strip() if tail else ""
@@ -0,0 +1,109 @@
+"""
+utils/write_behind.py
+
+Write-behind buffer: callers put() records and return immediately; a daemon
+thread hands them to `flush_fn(batch)` in batches of up to `batch_size`, at
+least every `interval` seconds.
+- Bounded: when the queue is full, put() waits up to `put_timeout` seconds
+  (backpressure) and then drops the record (counted in stats()).
+- flush() drains everything queued so far (used on shutdown / graph reload).
+- flush_fn returning False or raising counts the batch as failed; records are
+  not retried, memory writes are best effort.
+"""
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+
+class WriteBehindQueue:
+    def __init__(self, flush_fn: Callable[[List[Any]], bool], max_size: int = 1000,
+                 batch_size: int = 50, interval: float = 1.0, put_timeout: float = 0.0,
+                 name: str = "write-behind"):
+        self.flush_fn = flush_fn
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        self.put_timeout = put_timeout
+        self._q: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, max_size))
+        self._flush_lock = threading.Lock()   # one batch in flight at a time
+        self._stats_lock = threading.Lock()
+        self._stats = {"enqueued": 0, "written": 0, "batches": 0, "failed": 0,
+                       "dropped": 0, "blocked": 0, "last_batch_ms": None}
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def _count(self, **inc):
+        with self._stats_lock:
+            for k, v in inc.items():
+                self._stats[k] += v
+
+    def put(self, item: Any) -> bool:
+        """Queue one record; False if it had to be dropped."""
+        try:
+            self._q.put_nowait(item)
+        except queue.Full:
+            self._count(blocked=1)
+            try:
+                if self.put_timeout <= 0:
+                    raise queue.Full
+                self._q.put(item, timeout=self.put_timeout)
+            except queue.Full:
+                self._count(dropped=1)
+                return False
+        self._count(enqueued=1)
+        if self._q.qsize() >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def _take(self) -> List[Any]:
+        batch: List[Any] = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[Any]):
+        t0 = time.perf_counter()
+        try:
+            ok = self.flush_fn(batch) is not False
+        except Exception:
+            ok = False
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            self._stats["written" if ok else "failed"] += len(batch)
+            self._stats["last_batch_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+
+    def _drain(self, deadline: float = float("inf")) -> int:
+        # records stay in the queue until taken here, under the lock, so flush()
+        # never misses a batch the worker is still holding
+        n = 0
+        with self._flush_lock:
+            while time.monotonic() < deadline:
+                batch = self._take()
+                if not batch:
+                    break
+                self._write(batch)
+                n += len(batch)
+        return n
+
+    def _loop(self):
+        while True:
+            # every `interval`, or as soon as a full batch is waiting
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self._drain()
+
+    def flush(self, timeout: float = 10.0) -> int:
+        """Write out everything queued right now; returns the number of records handled."""
+        return self._drain(time.monotonic() + timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            out = dict(self._stats)
+        out["queued"] = self._q.qsize()
+        out["capacity"] = self._q.maxsize
+        return out
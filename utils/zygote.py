@@ -0,0 +1,537 @@
+"""
+utils/zygote.py
+
+Pre-warmed interpreter pool for running untrusted snippets.
+
+A zygote is a long-lived `python -m utils.zygote` process that imports the
+usual heavy modules once (SANDBOX_PRELOAD) and then forks one short-lived
+child per job, so a run costs a fork instead of interpreter startup + imports.
+Each child still gets:
+- a fresh temp dir as cwd holding only the job's files,
+- its own process group, rlimits (utils.sandbox_runner._set_limits),
+- a wall-clock timeout after which the whole group is SIGKILLed.
+
+The parent side (ZygotePool) keeps up to SANDBOX_POOL_SIZE zygotes, starts
+them lazily (or up front with prewarm()), hands each one a single job at a
+time over a JSON-lines pipe, and recycles a zygote after SANDBOX_ZYGOTE_JOBS
+jobs or when it dies. Where fork isn't available (or SANDBOX_POOL=0) jobs
+run in a plain `python main.py` subprocess instead.
+
+Job:    {"kind": "run" | "pytest", "files": {"main.py": "..."}, "entry": "main.py",
+         "args": [...pytest args], "timeout": 10, "cpu_seconds": 10, "memory_mb": 512,
+         "tmp_root": "/dev/shm"}
+Result: {"stdout", "stderr", "returncode", "timed_out", "duration_ms", "worker",
+         "stdout_bytes", "stderr_bytes", "truncated", "output_killed"?, "artifact"?,
+         "report": {...}  (pytest: per-test results, see utils/pytest_collect.py)}
+
+Output goes through pipes into bounded head + tail buffers (utils/output_capture.py):
+job keys "output_cap", "kill_on_output_cap" and "spool_output" tune that per job.
+"""
+
+import asyncio
+import json
+import os
+import select
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, List, Optional
+
+from utils import pytest_collect
+from utils.output_capture import kill_limit, new_captures, outcome, pump, read_stream, run_capped
+from utils.sandbox_runner import _set_limits, HAS_RESOURCE
+
+POOL_ENABLED = os.getenv("SANDBOX_POOL", "1") == "1" and hasattr(os, "fork")
+POOL_SIZE = int(os.getenv("SANDBOX_POOL_SIZE", "0")) or min(8, os.cpu_count() or 2)
+ZYGOTE_JOBS = int(os.getenv("SANDBOX_ZYGOTE_JOBS", "500"))      # recycle after this many jobs
+PRELOAD = [m for m in os.getenv(
+    "SANDBOX_PRELOAD",
+    "json,re,math,random,collections,itertools,functools,typing,dataclasses,datetime,"
+    "decimal,fractions,statistics,string,textwrap,unittest,pydantic,fastapi",
+).split(",") if m.strip()]
+DEFAULT_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "512"))
+START_TIMEOUT = float(os.getenv("SANDBOX_ZYGOTE_START_TIMEOUT", "30"))
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# ---------------------------------------------------------------------------
+# Zygote process side
+# ---------------------------------------------------------------------------
+
+def _user_traceback(exc: BaseException, path: str):
+    """Print the traceback like `python main.py` would: starting at the user's file."""
+    tb = exc.__traceback__
+    while tb is not None and tb.tb_frame.f_code.co_filename != path:
+        tb = tb.tb_next
+    traceback.print_exception(type(exc), exc, tb or exc.__traceback__)
+
+
+def _child_run(job: Dict[str, Any], workdir: str) -> int:
+    path = os.path.join(workdir, job.get("entry") or "main.py")
+    sys.argv = [path]
+    try:
+        import runpy
+        runpy.run_path(path, run_name="__main__")
+        return 0
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException as e:
+        _user_traceback(e, path)
+        return 1
+
+
+def _child_pytest(job: Dict[str, Any], workdir: str) -> int:
+    import pytest
+    os.environ["PYTEST_RESULTS_PATH"] = job["_result_path"]
+    return int(pytest.main(PYTEST_ARGS + list(job.get("args") or []), plugins=[pytest_collect]))
+
+
+# job kind -> function(job, workdir) -> exit code, run inside the forked child.
+# A kind may leave a JSON report at job["_result_path"]; it comes back as res["report"].
+JOB_KINDS: Dict[str, Callable[[Dict[str, Any], str], int]] = {"run": _child_run, "pytest": _child_pytest}
+# plugins preloaded in the zygote can't be assert-rewritten again; that's expected
+PYTEST_ARGS = ["-q", "-p", "no:cacheprovider", "-W", "ignore::pytest.PytestAssertRewriteWarning"]
+
+
+def _write_files(workdir: str, files: Dict[str, str]):
+    for name, content in (files or {}).items():
+        dest = os.path.normpath(os.path.join(workdir, name))
+        if not dest.startswith(workdir + os.sep):
+            raise ValueError(f"bad file name: {name}")
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with open(dest, "w", encoding="utf-8") as f:
+            f.write(content)
+
+
+def _in_child(job: Dict[str, Any], workdir: str, out_fd: int, err_fd: int, close_fds: List[int]) -> None:
+    """Runs in the forked child; never returns."""
+    code = 1
+    try:
+        os.setpgid(0, 0)
+        for fd in close_fds:
+            os.close(fd)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(out_fd, 1)
+        os.dup2(err_fd, 2)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        os.chdir(workdir)
+        # look like a fresh `python main.py`: script dir first, no repo on the path
+        sys.path[:] = [workdir] + [p for p in sys.path[1:] if os.path.abspath(p or ".") != _ROOT]
+        for name in [m for m in sys.modules if m == "utils" or m.startswith("utils.")]:
+            del sys.modules[name]
+        if HAS_RESOURCE:
+            _set_limits(int(job.get("cpu_seconds") or job.get("timeout") or 10),
+                        int(job.get("memory_mb") or DEFAULT_MEMORY_MB))
+        code = JOB_KINDS[job.get("kind") or "run"](job, workdir)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except Exception:
+            pass
+        os._exit(code if isinstance(code, int) and 0 <= code < 256 else 1)
+
+
+def _pidfd(pid: int) -> Optional[int]:
+    try:
+        return os.pidfd_open(pid) if hasattr(os, "pidfd_open") else None
+    except OSError:
+        return None
+
+
+def _wait(pid: int, timeout: float):
+    """(status or None on timeout). Uses a pidfd when the kernel has one, else polls."""
+    deadline = time.monotonic() + timeout
+    pidfd = _pidfd(pid)
+    try:
+        delay = 0.0005
+        while True:
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if done:
+                return status
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return None
+            if pidfd is not None:
+                select.select([pidfd], [], [], left)
+            else:
+                time.sleep(min(delay, left))
+                delay = min(delay * 2, 0.02)
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
+
+
+def _killpg(pid: int):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def run_job(job: Dict[str, Any], proto_fds: List[int]) -> Dict[str, Any]:
+    """Fork one child for `job` and collect its result (zygote side)."""
+    deadline = time.monotonic() + float(job.get("timeout") or 10)
+    workdir = tempfile.mkdtemp(prefix="mcp_sandbox_", dir=job.get("tmp_root") or None)
+    job["_result_path"] = _result_file(job)
+    pipes: List[int] = []
+    pidfd = None
+    try:
+        _write_files(workdir, job.get("files") or {})
+        caps = new_captures(job)
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        pipes = [out_r, err_r, out_w, err_w]
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            _in_child(job, workdir, out_w, err_w, proto_fds + [out_r, err_r])
+        for fd in (out_w, err_w):
+            os.close(fd)
+            pipes.remove(fd)
+        try:
+            os.setpgid(pid, pid)  # also from here, so a fast timeout can't beat the child to it
+        except OSError:
+            pass
+
+        status: Dict[str, int] = {}
+
+        def exited() -> bool:
+            if "s" not in status:
+                done, st = os.waitpid(pid, os.WNOHANG)
+                if done:
+                    status["s"] = st
+            return "s" in status
+
+        pidfd = _pidfd(pid)
+        reason = pump({out_r: caps["stdout"], err_r: caps["stderr"]}, deadline, exited,
+                      lambda: _killpg(pid), kill_limit(job), pidfd)
+        if reason == "eof" and not exited():
+            # closed its pipes but still running
+            st = _wait(pid, max(0.0, deadline - time.monotonic()))
+            if st is None:
+                reason = "timeout"
+            else:
+                status["s"] = st
+        _killpg(pid)  # timeout / overflow, or stray grandchildren
+        if "s" not in status:
+            _, status["s"] = os.waitpid(pid, 0)
+        res = outcome(os.waitstatus_to_exitcode(status["s"]), reason, caps, job)
+        return _attach_report(res, job["_result_path"])
+    except Exception as e:
+        return {"stdout": "", "stderr": str(e), "returncode": -1, "timed_out": False}
+    finally:
+        for fd in pipes + ([pidfd] if pidfd is not None else []):
+            os.close(fd)
+        shutil.rmtree(workdir, ignore_errors=True)
+        _unlink(job["_result_path"])
+
+
+def _result_file(job: Dict[str, Any]) -> str:
+    # outside the workspace, so the job's own code doesn't see it
+    fd, path = tempfile.mkstemp(prefix="mcp_result_", suffix=".json", dir=job.get("tmp_root") or None)
+    os.close(fd)
+    return path
+
+
+def _attach_report(res: Dict[str, Any], path: str) -> Dict[str, Any]:
+    try:
+        if os.path.getsize(path):
+            with open(path, encoding="utf-8") as f:
+                res["report"] = json.load(f)
+    except (OSError, ValueError):
+        pass
+    return res
+
+
+def _unlink(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def serve():
+    """Zygote main loop: preload, then one JSON job per stdin line -> one JSON result line."""
+    proto_in = os.dup(0)
+    proto_out = os.dup(1)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)  # stray prints from preloaded modules must not hit the pipe
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    loaded = []
+    for name in PRELOAD:
+        try:
+            __import__(name.strip())
+            loaded.append(name.strip())
+        except Exception:
+            pass
+    rfile = os.fdopen(proto_in, "r", encoding="utf-8")
+    wfile = os.fdopen(proto_out, "w", encoding="utf-8")
+
+    def send(obj):
+        try:
+            wfile.write(json.dumps(obj) + "\n")
+            wfile.flush()
+        except OSError:  # BrokenPipeError: the server exited, e.g. while we were still preloading
+            os._exit(0)
+
+    send({"ready": True, "pid": os.getpid(), "preloaded": loaded})
+    for line in rfile:
+        try:
+            job = json.loads(line)
+        except Exception as e:
+            send({"stdout": "", "stderr": f"bad job: {e}", "returncode": -1, "timed_out": False})
+            continue
+        t0 = time.perf_counter()
+        res = run_job(job, [proto_in, proto_out, devnull])
+        res["duration_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+        send(res)
+
+
+# ---------------------------------------------------------------------------
+# Server side
+# ---------------------------------------------------------------------------
+
+class _Zygote:
+    def __init__(self, preload: List[str]):
+        env = dict(os.environ)
+        env["SANDBOX_PRELOAD"] = ",".join(preload)
+        env["PYTHONPATH"] = _ROOT + (os.pathsep + env["PYTHONPATH"] if env.get("PYTHONPATH") else "")
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "utils.zygote"], cwd=_ROOT, env=env,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1,
+        )
+        self.jobs = 0
+        hello = self._read(START_TIMEOUT)
+        if not hello or not hello.get("ready"):
+            self.close()
+            raise RuntimeError("zygote failed to start")
+        self.preloaded = hello.get("preloaded", [])
+
+    def _read(self, timeout: float) -> Optional[Dict[str, Any]]:
+        ready, _, _ = select.select([self.proc.stdout], [], [], timeout)
+        if not ready:
+            return None
+        line = self.proc.stdout.readline()
+        return json.loads(line) if line else None
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def run(self, job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        self.jobs += 1
+        self.proc.stdin.write(json.dumps(job) + "\n")
+        self.proc.stdin.flush()
+        # the zygote enforces the job timeout itself; this only guards a wedged zygote
+        return self._read(float(job.get("timeout") or 10) + 10)
+
+    def close(self):
+        try:
+            self.proc.kill()
+            self.proc.wait(timeout=5)
+        except Exception:
+            pass
+
+
+class ZygotePool:
+    def __init__(self, size: int = POOL_SIZE, max_jobs: int = ZYGOTE_JOBS, preload: Optional[List[str]] = None):
+        self.size = max(1, size)
+        self.preload = list(preload if preload is not None else PRELOAD)
+        self.max_jobs = max_jobs
+        self._idle: List[_Zygote] = []
+        self._count = 0
+        self._cond = threading.Condition()
+        self._stats = {"runs": 0, "fallback_runs": 0, "spawned": 0, "recycled": 0, "failures": 0}
+
+    def prewarm(self, n: Optional[int] = None):
+        """Start zygotes up front so the first requests don't pay for them."""
+        for _ in range(min(n or self.size, self.size)):
+            z = self._spawn()
+            if z is None:
+                break
+            self._release(z)
+
+    def _spawn(self) -> Optional[_Zygote]:
+        with self._cond:
+            if self._count >= self.size:
+                return None
+            self._count += 1
+        try:
+            z = _Zygote(self.preload)
+        except Exception:
+            with self._cond:
+                self._count -= 1
+                self._stats["failures"] += 1
+                self._cond.notify()
+            return None
+        with self._cond:
+            self._stats["spawned"] += 1
+        return z
+
+    def _acquire(self, timeout: float) -> Optional[_Zygote]:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                while self._idle:
+                    z = self._idle.pop()
+                    if z.alive():
+                        return z
+                    self._count -= 1
+                if self._count < self.size:
+                    break
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return None
+                self._cond.wait(left)
+        return self._spawn()
+
+    def _release(self, z: _Zygote):
+        if not z.alive() or z.jobs >= self.max_jobs:
+            z.close()
+            with self._cond:
+                self._count -= 1
+                self._stats["recycled"] += 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append(z)
+            self._cond.notify()
+
+    def _run_zygote(self, job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Run on a zygote; None when the pool is off or no zygote could be had."""
+        z = self._acquire(float(job.get("timeout") or 10)) if POOL_ENABLED else None
+        if z is None:
+            return None
+        res = None
+        try:
+            res = z.run(job)
+        except Exception:
+            pass
+        if res is None:
+            z.close()  # wedged or crashed: drop it, next acquire starts a fresh one
+            res = {"stdout": "", "stderr": "sandbox worker failed", "returncode": -1, "timed_out": False}
+        self._release(z)
+        res["worker"] = "zygote"
+        with self._cond:
+            self._stats["runs"] += 1
+        return res
+
+    def _fallback_done(self, res: Dict[str, Any]) -> Dict[str, Any]:
+        res["worker"] = "subprocess"
+        with self._cond:
+            self._stats["fallback_runs"] += 1
+        return res
+
+    def run(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        res = self._run_zygote(job)
+        return res if res is not None else self._fallback_done(run_subprocess(job))
+
+    async def run_async(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Same as run() without blocking the event loop (fallback: asyncio subprocess)."""
+        res = await asyncio.to_thread(self._run_zygote, job) if POOL_ENABLED else None
+        return res if res is not None else self._fallback_done(await run_subprocess_async(job))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return dict(self._stats, size=self.size, live=self._count, idle=len(self._idle), enabled=POOL_ENABLED)
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._count -= len(idle)
+        for z in idle:
+            z.close()
+
+
+def _command(job: Dict[str, Any], workdir: str):
+    """argv + env for running `job` in a fresh interpreter."""
+    env = dict(os.environ)
+    if job.get("kind") == "pytest":
+        env["PYTEST_RESULTS_PATH"] = job["_result_path"]
+        env["PYTHONPATH"] = _ROOT + (os.pathsep + env["PYTHONPATH"] if env.get("PYTHONPATH") else "")
+        argv = [sys.executable, "-m", "pytest", *PYTEST_ARGS, "-p", "utils.pytest_collect", *(job.get("args") or [])]
+    else:
+        argv = [sys.executable, os.path.join(workdir, job.get("entry") or "main.py")]
+    cpu = int(job.get("cpu_seconds") or job.get("timeout") or 10)
+    mem = int(job.get("memory_mb") or DEFAULT_MEMORY_MB)
+    preexec = (lambda: _set_limits(cpu, mem)) if HAS_RESOURCE else None
+    return argv, env, preexec
+
+
+def run_subprocess(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Fallback: the job in a fresh `python` process (same limits/timeout)."""
+    t0 = time.perf_counter()
+    timeout = float(job.get("timeout") or 10)
+    workdir = tempfile.mkdtemp(prefix="mcp_sandbox_", dir=job.get("tmp_root") or None)
+    job["_result_path"] = _result_file(job)
+    try:
+        _write_files(workdir, job.get("files") or {})
+        argv, env, preexec = _command(job, workdir)
+        res = run_capped(argv, timeout, job, cwd=workdir, env=env, preexec_fn=preexec)
+        _attach_report(res, job["_result_path"])
+    except Exception as e:
+        res = {"stdout": "", "stderr": str(e), "returncode": -1, "timed_out": False}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        _unlink(job["_result_path"])
+    res["duration_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+    return res
+
+
+async def run_subprocess_async(job: Dict[str, Any]) -> Dict[str, Any]:
+    """run_subprocess() on an asyncio subprocess, for callers on an event loop."""
+    t0 = time.perf_counter()
+    timeout = float(job.get("timeout") or 10)
+    workdir = tempfile.mkdtemp(prefix="mcp_sandbox_", dir=job.get("tmp_root") or None)
+    job["_result_path"] = _result_file(job)
+    try:
+        _write_files(workdir, job.get("files") or {})
+        argv, env, preexec = _command(job, workdir)
+        caps = new_captures(job)
+        proc = await asyncio.create_subprocess_exec(
+            *argv, cwd=workdir, env=env, stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, preexec_fn=preexec,
+            start_new_session=True,
+        )
+        kill = lambda: _killpg(proc.pid)
+        limit = kill_limit(job)
+        try:
+            flags = await asyncio.wait_for(asyncio.gather(
+                read_stream(proc.stdout, caps["stdout"], limit, kill),
+                read_stream(proc.stderr, caps["stderr"], limit, kill),
+                proc.wait(),
+            ), timeout)
+            reason = "overflow" if any(flags[:2]) else "eof"
+        except asyncio.TimeoutError:
+            reason = "timeout"
+        kill()
+        await proc.wait()
+        res = _attach_report(outcome(proc.returncode, reason, caps, job), job["_result_path"])
+    except Exception as e:
+        res = {"stdout": "", "stderr": str(e), "returncode": -1, "timed_out": False}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        _unlink(job["_result_path"])
+    res["duration_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+    return res
+
+
+if __name__ == "__main__":
+    serve()